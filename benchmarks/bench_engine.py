@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+This script benchmarks the core of the rasblite engine without standing up a
+HTTP server. Models of increasing width and depth are generated along with
+starting data of increasing size, then :meth:`rasblite.engine.ModelParser.parse`,
+the validation of the starting data and :meth:`rasblite.engine.ModelData.action_path`
+for each HTTP method are timed.
+
+The results can be written to a JSON file and compared against a baseline saved
+from an earlier run, in which case the script fails if anything has slowed down
+by more than the threshold. Only the standard library is used so it can be ran
+anywhere, for example::
+
+    $ python benchmarks/bench_engine.py --output baseline.json
+    $ python benchmarks/bench_engine.py --baseline baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from ast import literal_eval
+
+# If the user hasn't installed rasblite then try to find it in this repo.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from rasblite import engine
+
+BASE_URL = '/bench/'
+
+# Name: (fields per item, depth of nested collections, items in the top collection)
+CASES = {'small':  (4, 2, 100),
+         'medium': (16, 3, 1000),
+         'large':  (16, 4, 2000)}
+NESTED_ITEMS = 2 # Items in each nested collection
+
+
+def generate_model(width, depth):
+    """Generates a model with a collection nested inside each item of the
+    collection above it, down to the depth given. Every item has the number of
+    fields given.
+
+    :param int width: number of fields in each item
+    :param int depth: number of nested collections
+    :returns: model in the format read by :class:`rasblite.engine.ModelParser`
+    :rtype: str
+    """
+    lines = ['[Base]', 'url = ' + BASE_URL, '', '[Model]', 'structure = ']
+
+    path = ''
+    for level in range(depth):
+        path += 'c' + str(level)
+        lines.append('    GET,POST         ' + path + '/')
+        path += '/:id' + str(level)
+        lines.append('    GET,PUT,DELETE   ' + path + '/')
+        for field in range(width):
+            lines.append('    GET,PUT          ' + path + '/f' + str(field))
+        path += '/'
+
+    return '\n'.join(lines) + '\n'
+
+def generate_item(width, depth, level=0):
+    """Generates a single item (and the nested collections beneath it) matching
+    a model from :func:`generate_model`.
+
+    :param int width: number of fields in each item
+    :param int depth: number of nested collections
+    :param int level: level of the collection that the item belongs to
+    :returns: item of the data
+    :rtype: dict
+    """
+    item = {'f' + str(field): 'value ' + str(field) for field in range(width)}
+    if level + 1 < depth:
+        item['c' + str(level + 1)] = [generate_item(width, depth, level + 1)
+                                      for _ in range(NESTED_ITEMS)]
+
+    return item
+
+def generate_data(width, depth, size):
+    """Generates starting data matching a model from :func:`generate_model`.
+
+    :param int width: number of fields in each item
+    :param int depth: number of nested collections
+    :param int size: number of items in the top collection
+    :returns: starting data in the format read by :class:`rasblite.engine.ModelParser`
+    :rtype: str
+    """
+    return repr({'c0': [generate_item(width, depth) for _ in range(size)]})
+
+def time_per_call(function, number, repeat):
+    """Returns the fastest time taken by a single call of the function out of
+    the repeats given.
+
+    :param function function: function to time
+    :param int number: number of calls timed together
+    :param int repeat: number of times the calls are timed
+    :returns: seconds per call
+    :rtype: float
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+def run_case(name, width, depth, size, repeat):
+    """Runs the benchmarks for a single model and starting data.
+
+    :param str name: name of the case
+    :param int width: number of fields in each item
+    :param int depth: number of nested collections
+    :param int size: number of items in the top collection
+    :param int repeat: number of times each benchmark is repeated
+    :returns: seconds per call of each benchmark, keyed by `case/benchmark`
+    :rtype: dict
+    """
+    raw_model = generate_model(width, depth)
+    raw_data = generate_data(width, depth, size)
+    parser = engine.ModelParser()
+    model = parser.parse(raw_model, raw_data)
+
+    # Validation is timed on its own, without parsing the model or the data
+    data = literal_eval(raw_data)
+
+    leaf = BASE_URL + '/'.join('c%d/%d' % (level, 0) for level in range(depth)) + '/f0'
+    item = leaf.rpartition('/')[0]
+    collection = item.rpartition('/')[0] + '/'
+    new_item = generate_item(width, depth, depth - 1)
+
+    benchmarks = (
+        ('parse_model', lambda: parser.parse(raw_model, 'EMPTY'), 10),
+        ('parse', lambda: parser.parse(raw_model, raw_data), 1),
+        ('validate', lambda: parser.check_data(model, data), 1),
+        ('GET_leaf', lambda: model.action_path('GET', leaf), 10000),
+        ('GET_item', lambda: model.action_path('GET', item), 10000),
+        ('GET_collection', lambda: model.action_path('GET', collection), 10000),
+        ('GET_page', lambda: model.action_path('GET', BASE_URL + 'c0/?offset=10&limit=10'), 10000),
+        ('POST', lambda: model.action_path('POST', collection, new_item), 1000),
+        ('PUT', lambda: model.action_path('PUT', leaf, 'new value'), 10000),
+        ('DELETE', lambda: model.action_path('DELETE', item), 10000),
+    )
+
+    results = dict()
+    for benchmark, function, number in benchmarks:
+        seconds = time_per_call(function, number, repeat)
+        results[name + '/' + benchmark] = seconds
+        print('%-24s %12.3f us' % (name + '/' + benchmark, seconds * 1e6))
+
+    return results
+
+def compare(results, baseline, threshold):
+    """Compares the results against a baseline, printing the change in each
+    benchmark found in both.
+
+    :param dict results: seconds per call of each benchmark
+    :param dict baseline: seconds per call of each benchmark in the baseline
+    :param float threshold: fraction that a benchmark can slow down by before
+        it is a regression, such as 0.25 for 25%
+    :returns: names of the benchmarks that regressed
+    :rtype: list(str)
+    """
+    regressions = list()
+
+    for benchmark in sorted(set(results) & set(baseline)):
+        ratio = results[benchmark] / baseline[benchmark]
+        regressed = ratio > 1 + threshold
+        print('%-24s %+8.1f%%%s' % (benchmark, (ratio - 1) * 100,
+                                    '  REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append(benchmark)
+
+    return regressions
+
+def add_parser_arguments(arg_parser):
+    """Adds arguments to the :class:`argparse.ArgumentParser` which is passed in
+    to allow the user to configure the benchmarks.
+
+    :param argparse.ArgumentParser arg_parser: argument parser to add arguments to
+    :returns: Argument parser which was originally passed in
+    :rtype: argparse.ArgumentParser
+    """
+    arg_parser.add_argument('--cases', '-c', nargs='+', choices=CASES, default=list(CASES))
+    arg_parser.add_argument('--repeat', '-r', type=int, default=5)
+    arg_parser.add_argument('--output', '-o', type=str)
+    arg_parser.add_argument('--baseline', '-b', type=argparse.FileType('r'))
+    arg_parser.add_argument('--threshold', '-t', type=float, default=0.25)
+
+    return arg_parser
+
+def main(cases, repeat=5, output=None, baseline=None, threshold=0.25):
+    """Runs the benchmarks, saving the results and comparing them against the
+    baseline if given.
+
+    :param list cases: names of the cases to run (see :data:`CASES`)
+    :param int repeat: number of times each benchmark is repeated
+    :param str output: path of the JSON file to write the results to
+    :param dict baseline: results of an earlier run to compare against
+    :param float threshold: fraction that a benchmark can slow down by before
+        it is a regression
+    :returns: names of the benchmarks that regressed
+    :rtype: list(str)
+    """
+    results = dict()
+    for name in cases:
+        results.update(run_case(name, *CASES[name], repeat=repeat))
+
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump({'python': platform.python_version(),
+                       'results': results}, output_file, indent=2, sort_keys=True)
+
+    if baseline is None:
+        return []
+
+    print('\nCompared to baseline (threshold %+.1f%%):' % (threshold * 100))
+    return compare(results, baseline['results'], threshold)
+
+if __name__ == '__main__':
+    """Runs the benchmarks from the command line, failing on a regression."""
+    args = add_parser_arguments(argparse.ArgumentParser(description='rasblite engine benchmarks')).parse_args()
+
+    baseline = None
+    if args.baseline:
+        baseline = json.load(args.baseline)
+        args.baseline.close()
+
+    regressions = main(args.cases, args.repeat, args.output, baseline, args.threshold)
+    if regressions:
+        sys.exit('Benchmarks regressed: ' + ', '.join(regressions))
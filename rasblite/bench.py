@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+This bench script gives a command line entry point for load testing a rasblite
+server. It either stands up a server itself on a free port or targets one that
+is already running, then drives a mix of GET, POST, PUT and DELETE requests
+across the routes of the model from many concurrent asyncio clients, each of
+which keeps its connection alive. The throughput and latency percentiles of
+each route are reported at the end.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import math
+import os
+import pathlib
+import random
+import sys
+import time
+import urllib.parse
+
+# If the user hasn't installed rasblite then try to find it in this repo.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from rasblite import engine
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+DEFAULT_MIX = 'GET=90,PUT=10'
+PERCENTILES = (50, 95, 99)
+
+
+class BenchClient(object):
+    """The BenchClient sends requests to the server one at a time over a single
+    kept alive connection, opening a new connection whenever the server closes
+    it.
+    """
+
+    def __init__(self, host, port):
+        """Creates a BenchClient which connects on its first request.
+
+        :param str host: host of the server
+        :param int port: port of the server
+        """
+        self.host = host
+        self.port = port
+        self.__reader = None
+        self.__writer = None
+
+    async def request(self, method, path, body=None):
+        """Sends a request and reads the whole response, which may be chunked.
+
+        :param str method: HTTP method such as GET, POST, PUT or DELETE
+        :param str path: full url of the request
+        :param bytes body: JSON message body, if any
+        :returns: HTTP status of the response
+        :rtype: int
+        """
+        if self.__writer is None:
+            self.__reader, self.__writer = await asyncio.open_connection(self.host, self.port)
+
+        request = '%s %s HTTP/1.1\r\nHost: %s\r\nContent-Length: %d\r\n' % (
+            method, path, self.host, len(body) if body else 0)
+        if body:
+            request += 'Content-Type: application/json\r\n'
+        self.__writer.write(request.encode() + b'\r\n' + (body or b''))
+
+        status_line = await self.__reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection')
+        status = int(status_line.split()[1])
+
+        headers = dict()
+        while True:
+            line = await self.__reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.__reader.readline()).split(b';')[0], 16)
+                await self.__reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await self.__reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+
+        return status
+
+    async def close(self):
+        """Closes the connection, if it is open."""
+        writer, self.__writer = self.__writer, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+def parse_mix(raw_mix):
+    """Parses the mix of requests, such as `GET=80,POST=5,PUT=10,DELETE=5`,
+    into the weight of each HTTP method.
+
+    :param str raw_mix: comma separated weights of each HTTP method
+    :returns: weight of each HTTP method
+    :rtype: dict
+    :raises ValueError: if the mix is not valid
+    """
+    mix = dict()
+    for part in raw_mix.split(','):
+        method, _, weight = part.partition('=')
+        method = method.strip().upper()
+        if method not in METHODS:
+            raise ValueError('Unknown method ' + repr(method) + '. Expected one of: ' + ', '.join(METHODS))
+        mix[method] = int(weight)
+        if mix[method] < 0:
+            raise ValueError('The weight of ' + method + ' cannot be negative')
+
+    if not any(mix.values()):
+        raise ValueError('At least one method needs a weight')
+
+    return mix
+
+def discover_targets(host, port, model, mix, sample):
+    """Finds the paths to request for each route of the model that allows a
+    method in the mix. Up to `sample` items of each collection in the data are
+    used in place of the route's parameters. POST requests add a copy of the
+    first item in the collection and PUT requests put back the data found.
+
+    :param str host: host of the server
+    :param int port: port of the server
+    :param rasblite.engine.ModelData model: model served by the server
+    :param dict mix: weight of each HTTP method
+    :param int sample: number of items of each collection used
+    :returns: method, route, paths and message body of each target
+    :rtype: list(tuple(str, str, list, bytes))
+    """
+    connection = http.client.HTTPConnection(host, port)
+    counts = dict()
+
+    def get(path):
+        connection.request('GET', path)
+        response = connection.getresponse()
+        raw_response = response.read()
+        return json.loads(raw_response.decode()) if response.status == 200 else None
+
+    def expand(route):
+        paths = [model.base_url().rstrip('/')]
+        for part in route.split('/'):
+            if not part.startswith(':'):
+                paths = [path + '/' + part for path in paths]
+                continue
+
+            expanded = list()
+            for path in paths:
+                if path not in counts:
+                    count = get(path + '?count')
+                    counts[path] = count if isinstance(count, int) else 0
+                expanded.extend(path + '/' + str(index)
+                                for index in range(min(counts[path], sample)))
+            paths = expanded
+
+        return paths
+
+    targets = list()
+    try:
+        for route, methods in model.routes():
+            allowed = [method for method in METHODS if mix.get(method) and method in methods]
+            if not allowed:
+                continue
+
+            paths = expand(route)
+            if not paths:
+                continue
+
+            for method in allowed:
+                body = None
+                if method == 'POST':
+                    body = json.dumps(get(paths[0] + '/0') or dict()).encode()
+                elif method == 'PUT':
+                    body = json.dumps(get(paths[0])).encode()
+                targets.append((method, route, paths, body))
+    finally:
+        connection.close()
+
+    return targets
+
+async def run_load(host, port, targets, mix, clients, duration=None, requests=None, seed=None):
+    """Sends requests to the targets from concurrent clients until either the
+    duration has passed or the number of requests has been sent.
+
+    :param str host: host of the server
+    :param int port: port of the server
+    :param list targets: targets found by :func:`discover_targets`
+    :param dict mix: weight of each HTTP method
+    :param int clients: number of concurrent clients
+    :param float duration: seconds to send requests for
+    :param int requests: total number of requests to send
+    :param int seed: seed for choosing the requests, so runs can be repeated
+    :returns: latencies and error count for each (method, route) along with
+        the seconds taken
+    :rtype: tuple(dict, float)
+    """
+    by_method = dict()
+    for target in targets:
+        by_method.setdefault(target[0], list()).append(target)
+    methods = list(by_method)
+    weights = [mix[method] for method in methods]
+
+    results = {(method, route): {'latencies': list(), 'errors': 0}
+               for method, route, paths, body in targets}
+    deadline = None if duration is None else time.perf_counter() + duration
+    remaining = [requests]
+
+    async def client_loop(index):
+        rng = random.Random(None if seed is None else seed + index)
+        client = BenchClient(host, port)
+        try:
+            while deadline is None or time.perf_counter() < deadline:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+
+                method, route, paths, body = rng.choice(by_method[rng.choices(methods, weights)[0]])
+                started = time.perf_counter()
+                try:
+                    status = await client.request(method, rng.choice(paths), body)
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    status = None
+                    await client.close()
+
+                result = results[(method, route)]
+                result['latencies'].append(time.perf_counter() - started)
+                if status is None or status >= 400:
+                    result['errors'] += 1
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(index) for index in range(clients)))
+
+    return (results, time.perf_counter() - started)
+
+def percentile(sorted_values, percent):
+    """Returns the percentile of the values using the nearest rank method.
+
+    :param list sorted_values: values in ascending order
+    :param float percent: percentile such as 95
+    :rtype: float
+    """
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+def summarise(results, elapsed):
+    """Summarises the results of :func:`run_load`, giving the number of
+    requests, errors, throughput and latency percentiles (in milliseconds) of
+    each route as well as all of them together.
+
+    :param dict results: latencies and error count for each (method, route)
+    :param float elapsed: seconds taken
+    :returns: summary of each route (`METHOD route`) and the `total`
+    :rtype: dict
+    """
+    def summary(latencies, errors):
+        latencies = sorted(latencies)
+        row = {'requests': len(latencies), 'errors': errors,
+               'throughput': len(latencies) / elapsed if elapsed else 0.0}
+        for percent in PERCENTILES:
+            row['p%d' % percent] = percentile(latencies, percent) * 1000 if latencies else None
+        return row
+
+    summaries = dict()
+    for (method, route), result in sorted(results.items()):
+        if result['latencies']:
+            summaries[method + ' ' + route] = summary(result['latencies'], result['errors'])
+
+    summaries['total'] = summary([latency for result in results.values() for latency in result['latencies']],
+                                 sum(result['errors'] for result in results.values()))
+
+    return summaries
+
+def print_report(summaries):
+    """Prints the summary from :func:`summarise` as a table.
+
+    :param dict summaries: summary of each route and the total
+    """
+    width = max(len(name) for name in summaries)
+    print('%-*s %9s %7s %9s %9s %9s %9s' % (width, 'route', 'requests', 'errors',
+                                            'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, row in summaries.items():
+        print('%-*s %9d %7d %9.1f %9.3f %9.3f %9.3f' % (width, name, row['requests'], row['errors'],
+                                                      row['throughput'], row['p50'] or 0,
+                                                      row['p95'] or 0, row['p99'] or 0))
+
+def add_parser_arguments(arg_parser):
+    """Adds arguments to the :class:`argparse.ArgumentParser` which is passed in
+    to allow the user to configure the load test.
+
+    :param argparse.ArgumentParser arg_parser: argument parser to add arguments to
+    :returns: Argument parser which was originally passed in
+    :rtype: argparse.ArgumentParser
+    """
+    arg_parser.add_argument('--model', '-m', type=argparse.FileType('r'), required=True)
+    arg_parser.add_argument('--starting_data', '-d', type=str, default='DEFAULT')
+    arg_parser.add_argument('--url', '-u', type=str, default=None)
+    arg_parser.add_argument('--clients', '-c', type=int, default=10)
+    arg_parser.add_argument('--duration', '-t', type=float, default=None)
+    arg_parser.add_argument('--requests', '-n', type=int, default=None)
+    arg_parser.add_argument('--mix', type=str, default=DEFAULT_MIX)
+    arg_parser.add_argument('--sample', type=int, default=10)
+    arg_parser.add_argument('--seed', type=int, default=None)
+    arg_parser.add_argument('--engine', '-e', choices=engine.Controller.ENGINES, default='http.server')
+    arg_parser.add_argument('--workers', '-w', type=int, default=0)
+    arg_parser.add_argument('--output', '-o', type=str, default=None)
+
+    return arg_parser
+
+def expand_arguments(args, error_function):
+    """Puts the arguments passed on the command line into a dictionary so that
+    the dictionary can be expanded and passed to :func:`main`. Also verifies the
+    arguments such as checking the mix of requests is valid.
+
+    :param args: arguments parsed by :class:`argparse.ArgumentParser`
+    :param error_function: :class:`argparse.ArgumentParser` error function
+    :returns: dictionary containing the arguments passed on the command line
+    :rtype: dict
+    """
+    starting_data = args.starting_data
+    if starting_data not in engine.Controller.STARTING_DATA_MODES:
+        if os.path.isfile(starting_data):
+            starting_data = pathlib.Path(starting_data)
+        else:
+            error_function("Could not read file: " + starting_data)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as error:
+        error_function('Invalid mix: ' + str(error))
+
+    if args.clients < 1:
+        error_function("There must be at least one client: " + str(args.clients))
+
+    if args.duration is None and args.requests is None:
+        args.duration = 10.0
+
+    expanded_args = dict()
+    expanded_args['model']       = args.model.read()
+    expanded_args['data']        = starting_data
+    expanded_args['url']         = args.url
+    expanded_args['clients']     = args.clients
+    expanded_args['duration']    = args.duration
+    expanded_args['requests']    = args.requests
+    expanded_args['mix']         = mix
+    expanded_args['sample']      = args.sample
+    expanded_args['seed']        = args.seed
+    expanded_args['engine_name'] = args.engine
+    expanded_args['workers']     = args.workers
+    expanded_args['output']      = args.output
+
+    args.model.close()
+
+    return expanded_args
+
+def main(model, data='DEFAULT', url=None, clients=10, duration=10.0, requests=None,
+         mix=None, sample=10, seed=None, engine_name='http.server', workers=0, output=None):
+    """Runs a load test against a rasblite server, printing the throughput and
+    latency percentiles of each route.
+
+    :param str model: format of the data model served
+    :param data: starting data of the server stood up (or a special string
+        that tells rasblite how to create the starting data, or the path of a
+        file to read it from)
+    :param str url: url (such as `http://localhost:8080`) of a server which is
+        already running, or None to stand one up on a free port
+    :param int clients: number of concurrent clients
+    :param float duration: seconds to send requests for
+    :param int requests: total number of requests to send
+    :param dict mix: weight of each HTTP method, see :func:`parse_mix`
+    :param int sample: number of items of each collection requested
+    :param int seed: seed for choosing the requests, so runs can be repeated
+    :param str engine_name: HTTP engine of the server stood up
+    :param int workers: workers of the server stood up (see
+        :class:`rasblite.engine.Controller`)
+    :param str output: path of a JSON file to write the summary to
+    :returns: summary of each route and the total, see :func:`summarise`
+    :rtype: dict
+    """
+    mix = mix or parse_mix(DEFAULT_MIX)
+    model_data = engine.ModelParser().parse(model, 'EMPTY')
+
+    controller = None
+    if url is None:
+        controller = engine.Controller(model, data, 0, workers, engine_name)
+        controller.start()
+        host, port = 'localhost', controller.server_port()
+    else:
+        split_url = urllib.parse.urlsplit(url)
+        host, port = split_url.hostname, split_url.port or 80
+
+    try:
+        targets = discover_targets(host, port, model_data, mix, sample)
+        if not targets:
+            print('No routes of the model allow the methods in the mix')
+            return dict()
+
+        results, elapsed = asyncio.run(run_load(host, port, targets, mix, clients,
+                                                duration, requests, seed))
+    finally:
+        if controller is not None:
+            controller.stop()
+
+    summaries = summarise(results, elapsed)
+    print_report(summaries)
+
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump(summaries, output_file, indent=2)
+
+    return summaries
+
+def command_line_run():
+    """Parses the command line before passing the arguments to the main function"""
+    arg_parser = argparse.ArgumentParser(description='Lightweight RESTful API Server Builder Load Generator')
+    arg_parser = add_parser_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    main(**expand_arguments(args, arg_parser.error))
+
+if __name__ == '__main__':
+    """Hook to command line run."""
+    command_line_run()
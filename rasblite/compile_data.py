@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+This script compiles starting data ahead of time. The data is verified against
+the model once and written to a compact binary file which rasblite-run then
+loads straight into the data store, without parsing or verifying it again. This
+makes starting a server with a large amount of starting data much faster, for
+example::
+
+    $ rasblite-compile-data --model model.txt --starting_data data.txt --output data.bin
+    $ rasblite-run --model model.txt --starting_data data.bin
+
+The compiled data can only be used with the same model.
+"""
+import argparse
+import logging
+import os
+import sys
+
+# If the user hasn't installed rasblite then try to find it in this repo.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from rasblite import engine
+
+def add_parser_arguments(arg_parser):
+    """Adds arguments to the :class:`argparse.ArgumentParser` which is passed in
+    to allow the user to configure the compilation.
+
+    :param argparse.ArgumentParser arg_parser: argument parser to add arguments to
+    :returns: Argument parser which was originally passed in
+    :rtype: argparse.ArgumentParser
+
+    """
+    arg_parser.add_argument('--model', '-m', type=argparse.FileType('r'), required=True)
+    arg_parser.add_argument('--starting_data', '-d', type=argparse.FileType('r'), required=True)
+    arg_parser.add_argument('--output', '-o', type=str, required=True)
+    arg_parser.add_argument('--validate_workers', type=int, default=None)
+
+    return arg_parser
+
+def main(model, data, output, validate_workers=None):
+    """Verifies the starting data against the model and writes the compiled
+    data to the output file.
+
+    :param str model: format of the data model
+    :param str data: contents of the starting data
+    :param str output: path of the compiled data file to write
+    :param int validate_workers: number of processes to verify the data across,
+        or None to verify it in this process
+    :raises ValueError: if the data does not match the model
+
+    """
+    with open(output, 'wb') as output_file:
+        engine.ModelParser(validate_workers).compile_data(model, data, output_file)
+
+def command_line_run():
+    """Parses the command line before passing the arguments to the main function"""
+    arg_parser = add_parser_arguments(argparse.ArgumentParser(description='Compiles starting data for rasblite-run'))
+    args = arg_parser.parse_args()
+    if args.validate_workers is not None and args.validate_workers <= 0:
+        arg_parser.error('The number of validation workers must be positive: ' + str(args.validate_workers))
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+
+    model, data = args.model.read(), args.starting_data.read()
+    args.model.close()
+    args.starting_data.close()
+
+    try:
+        main(model, data, args.output, args.validate_workers)
+    except (ValueError, SyntaxError) as error:
+        os.remove(args.output)
+        arg_parser.error('Could not compile ' + args.starting_data.name + ': ' + str(error))
+
+    print('Compiled ' + args.starting_data.name + ' to ' + args.output)
+
+if __name__ == '__main__':
+    """Hook to command line run."""
+    command_line_run()
@@ -8,17 +8,158 @@ is the controller, :class:`rasblite.engine.RequestHandler` is the view and
 """
 
 import http.server
+import asyncio
 import configparser
+import cProfile
+import hashlib
+import html
+import io
 import re
 import json
+import logging
+import multiprocessing
 import os
-from pprint import pprint, pformat
+import pickle
+import pstats
+import random
+import socket
+import sys
+import time
+import tracemalloc
+import urllib.parse
+from pprint import pformat
+from array import array
 from ast import literal_eval
-from threading import Thread
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from collections.abc import Mapping, MutableMapping, MutableSequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import accumulate
+from threading import Thread, Condition, Event, Lock, get_ident
+
+logger = logging.getLogger(__name__)
 
 RESOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'resources'))
 
-# TODO: Should use Python's logging module rather than just prints
+class ReadWriteLock(object):
+    """The ReadWriteLock allows any number of readers to hold the lock at the
+    same time whereas a writer holds it exclusively. Waiting writers are given
+    preference over new readers so that a steady stream of GET requests cannot
+    starve a POST, PUT or DELETE.
+    """
+    
+    def __init__(self):
+        """Creates a new ReadWriteLock that is not held by anyone.
+        """
+        self.__condition = Condition()
+        self.__readers = 0
+        self.__writer = False
+        self.__writers_waiting = 0
+    
+    def acquire_read(self):
+        """Blocks until the lock can be shared with other readers."""
+        with self.__condition:
+            while self.__writer or self.__writers_waiting:
+                self.__condition.wait()
+            self.__readers += 1
+    
+    def release_read(self):
+        """Releases a lock previously acquired with :meth:`acquire_read`."""
+        with self.__condition:
+            self.__readers -= 1
+            if not self.__readers:
+                self.__condition.notify_all()
+    
+    def acquire_write(self):
+        """Blocks until the lock is held exclusively by the caller."""
+        with self.__condition:
+            self.__writers_waiting += 1
+            while self.__writer or self.__readers:
+                self.__condition.wait()
+            self.__writers_waiting -= 1
+            self.__writer = True
+    
+    def release_write(self):
+        """Releases a lock previously acquired with :meth:`acquire_write`."""
+        with self.__condition:
+            self.__writer = False
+            self.__condition.notify_all()
+    
+    @contextmanager
+    def reading(self):
+        """Context manager that holds the lock as a reader."""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+    
+    @contextmanager
+    def writing(self):
+        """Context manager that holds the lock as the only writer."""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class RingBufferHandler(logging.Handler):
+    """The RingBufferHandler keeps the most recent log records in memory so 
+    that a debug trace can be pulled on demand (see 
+    :meth:`rasblite.engine.Controller.trace`). Records are only formatted when
+    they are read, so keeping them is cheap.
+    """
+    
+    def __init__(self, capacity, level=logging.NOTSET):
+        """Creates an empty RingBufferHandler.
+        
+        :param int capacity: number of records kept before the oldest is dropped
+        :param int level: lowest level of the records kept
+        """
+        super().__init__(level)
+        self.records = deque(maxlen=capacity)
+    
+    def emit(self, record):
+        """Keeps the record, dropping the oldest one if the buffer is full."""
+        self.records.append(record)
+    
+    def getvalue(self):
+        """Returns the records kept, oldest first, formatted one per line.
+        
+        :returns: formatted records
+        :rtype: list(str)
+        """
+        with self.lock:
+            records = list(self.records)
+        
+        return [self.format(record) for record in records]
+
+
+class PropagatingHandler(logging.Handler):
+    """The PropagatingHandler passes the records of a logger that are at or 
+    above its level on to the handlers of the logger's ancestors, as 
+    propagation would. It stands in for propagation while the level of the 
+    logger is lowered for another of its handlers (such as a 
+    :class:`rasblite.engine.RingBufferHandler`), so that the extra records do
+    not reach the handlers of the application.
+    """
+    
+    def __init__(self, source, level=logging.NOTSET):
+        """Creates a PropagatingHandler for a logger.
+        
+        :param logging.Logger source: logger whose records are passed on
+        :param int level: lowest level of the records passed on
+        """
+        super().__init__(level)
+        self.source = source
+    
+    def emit(self, record):
+        """Passes the record on to the handlers of the logger's ancestors."""
+        if self.source.parent is not None:
+            self.source.parent.callHandlers(record)
+
 
 class ModelParser(object):
     """The rasblite ModelParser's main funtion is to create and populate a 
@@ -85,91 +226,187 @@ class ModelParser(object):
         """
         return {'users': [{'addresses': [{'address_lines': '123 Fake Street', 'post_code': 'AB12 3CD'}], 'age': '21', 'name': 'Bob'}, {'addresses': [{'address_lines': '456 My Street', 'post_code': 'EF45 6GH'}, {'address_lines': '789 Other Street', 'post_code': 'IJ12 3KL'}], 'age': '60', 'name': 'Frank'}]}
     
-    def __verify_data_for_data_store(self, data_key, new_data, model_structure):
-        """Walks (recursively) the model and data structure and verifies that
-        they both match the same structure. Returns True if the data contains 
-        the same structure as the model
+    def __verify_route(self, data_key, item, route):
+        """Verifies the data against the node of the compiled model that it was
+        found at (or None if the model has no such key), logging the first 
+        mismatch found. Returns True if the data matches the model.
         """
-        item = new_data[data_key]
-        try:
-            model_item = model_structure[data_key]
-        except KeyError as key_error:
-            print("Error: Data contains extra identifier not in the model: {0}".format(key_error))
+        if route is None:
+            logger.error('Data contains extra identifier not in the model: %r', data_key)
+            return False
+        
+        error = route.check(item, data_key)
+        if error is not None:
+            logger.error(error)
+            return False
+        return True
+    
+    def __verify_item(self, item, route, path):
+        """Verifies a single item of the collection at the node of the compiled
+        model given, logging the mismatch if there is one. Returns True if it
+        matches.
+        """
+        error = route.check_item(item, path)
+        if error is not None:
+            logger.error(error)
             return False
+        return True
+    
+    STARTING_DATA_MODES = {'EMPTY' :   __starting_data_mode_empty, 
+                           'DEFAULT' : __starting_data_mode_default, 
+                           'EXAMPLE' : __starting_data_mode_example}
+    COMPILED_DATA_MAGIC = b'RASBLITE-DATA\x01' # Start of a compiled data file
+    validate_chunk_size = 10000 # Items of a collection checked by a worker at a time
+    DATA_FORMATS = {'.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+    
+    class ValidationWorker():
+        """The ValidationWorker class checks chunks of the starting data in a
+        worker process of a :class:`concurrent.futures.ProcessPoolExecutor`.
+        Each worker is given the compiled model once when it starts, whereas
+        only the items of a chunk are sent with it.
+        """
+        routes = None
+        
+        @classmethod
+        def start(cls, routes):
+            """Keeps the compiled model for the chunks checked by this worker
+            process.
             
-        if isinstance(item, list):
-            # Check that the model says this item should have a list
-            model_item_contains_list = False
-            for model_key in model_item:
-                if model_key == self.KEY_METHODS:
-                    continue
-                elif model_key[0] == ':':
-                    model_item = model_item[model_key]
-                    model_item_contains_list = True
-                    break
+            :param routes: root :class:`rasblite.engine.ModelData.RouteNode`,
+                without record classes (see 
+                :meth:`rasblite.engine.ModelData.RouteNode.without_records`)
+            """
+            cls.routes = routes
+        
+        @classmethod
+        def check_chunk(cls, keys, start, items):
+            """Checks a range of the items in a collection against the model.
+            
+            :param tuple keys: keys (and indices of items) leading to the 
+                collection from the top of the data
+            :param int start: index of the first item within the collection
+            :param list items: items to check
+            :returns: None if the items match the model, otherwise a 
+                description of the first mismatch found and where it is
+            :rtype: str
+            """
+            route = cls.routes
+            for key in keys:
+                route = route.param_child if isinstance(key, int) else route.children[key]
+            
+            path = '/'.join(str(key) for key in keys) + '/'
+            for index, item in enumerate(items, start):
+                error = route.check_item(item, path + str(index))
+                if error is not None:
+                    return error
+            
+            return None
+    
+    class JSONReader():
+        """The JSONReader class reads JSON values one at a time from a text 
+        file, so that the items of a huge list can be handled as they arrive 
+        rather than once the whole file has been read. Only the value being 
+        decoded is held in memory, read in chunks from the file.
+        """
+        CHUNK_SIZE = 1 << 16 # Characters read from the file at a time
+        RE_WHITESPACE = re.compile(r'[ \t\n\r]*')
+        
+        def __init__(self, data_file, object_pairs_hook=None):
+            """Creates a new JSONReader for a file.
+            
+            :param data_file: text file to read the JSON from
+            :param object_pairs_hook: passed on to :class:`json.JSONDecoder`
+            """
+            self.__file = data_file
+            self.__decoder = json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+            self.__buffer = ''
+            self.__position = 0
+            self.__eof = False
+        
+        def peek(self):
+            """Skips any whitespace and returns the next character without 
+            consuming it, or an empty string at the end of the file.
+            """
+            while True:
+                self.__position = self.RE_WHITESPACE.match(self.__buffer, self.__position).end()
+                if self.__position < len(self.__buffer):
+                    return self.__buffer[self.__position]
+                if not self.__fill():
+                    return ''
+        
+        def expect(self, characters):
+            """Consumes the next character, which must be one of the characters
+            given, and returns it.
+            
+            :raises ValueError: if the next character is not one of them
+            """
+            character = self.peek()
+            if not character or character not in characters:
+                raise ValueError('Expected one of %r but found %r' % (characters, character or 'the end of the file'))
+            self.__position += 1
+            return character
+        
+        def value(self):
+            """Decodes and returns the next JSON value in the file.
+            
+            :raises json.JSONDecodeError: if it is not valid JSON
+            """
+            self.peek()
+            while True:
+                try:
+                    value, end = self.__decoder.raw_decode(self.__buffer, self.__position)
+                except json.JSONDecodeError:
+                    # The value may just be cut short by the end of the buffer
+                    if self.__fill():
+                        continue
+                    raise
                 
-            if model_item_contains_list:
-                for next_item in item:
-                    if isinstance(next_item, dict):
-                        for next_key in next_item:
-                            successful = self.__verify_data_for_data_store(next_key, next_item, model_item)
-                            if not successful:
-                                return False
-                    elif isinstance(next_item, list):
-                        print('ERROR: Cannot have a list contain another list')
-                        return False
-                    else:
-                        print('ERROR: List containing item that is not a list or dict')
-                        return False
-                        
-                return True
-            else:
-                print('ERROR: data contains a list but the model doesn\'t')
-                return False
-        elif isinstance(item, str):
-            if len(model_item) == 1 and self.KEY_METHODS in model_item:
-                return True
-            else:
-                print('ERROR: Data contains a string but model is expecting a dictionary or list')
-                return False
-        elif isinstance(item, dict):
-            print('Handle dictionary')
-            model_item_contains_dict = False
-            for model_key in model_item:
-                if model_key == self.KEY_METHODS:
+                # A number at the end of the buffer may carry on in the file
+                if end == len(self.__buffer) and self.__fill():
                     continue
-                elif model_key[0] != ':':
-                    model_item_contains_dict = True
-                    break
                 
-            if model_item_contains_dict:
-                for next_key in item:
-                    successful = self.__verify_data_for_data_store(next_key, item, model_item)
-                    if not successful:
-                        return False
-                return True
-            else:
-                print('ERROR: data contains a dictionary but the model doesn\'t')
-                return False
-        else:
-            print('ERROR: unhandled type' + item.__class__.__name__)
-            return False
-        
-                    
+                self.__position = end
+                return value
         
+        def __fill(self):
+            """Drops what has been consumed from the buffer and reads more of 
+            the file onto it, at least doubling it so that a value spread over
+            many chunks is not decoded again for every chunk. Returns False at
+            the end of the file.
+            """
+            if self.__eof:
+                return False
+            
+            remaining = self.__buffer[self.__position:]
+            chunk = self.__file.read(max(self.CHUNK_SIZE, len(remaining)))
+            self.__buffer = remaining + chunk
+            self.__position = 0
+            self.__eof = not chunk
+            return not self.__eof
     
-    STARTING_DATA_MODES = {'EMPTY' :   __starting_data_mode_empty, 
-                           'DEFAULT' : __starting_data_mode_default, 
-                           'EXAMPLE' : __starting_data_mode_example}
+    def __init__(self, validate_workers=None):
+        """Creates a new ModelParser.
+        
+        :param int validate_workers: number of processes to verify large 
+            starting data across, or None to verify it in this process. This
+            does not apply to JSON or NDJSON files, which are verified while 
+            they are streamed in
+        """
+        self.validate_workers = validate_workers
     
     def parse(self, raw_model, raw_data):
         """Parses the raw model to create a :class:`rasblite.engine.ModelData`
         object which is then populated with starting data if supplied.
         
         :param str raw_model: contents of the model structure config
-        :param str raw_data: either a special string which tells the 
+        :param raw_data: either a special string which tells the 
             :class:`rasblite.engine.ModelParser` how to construct the starting
-            data or the contents of the actual data
+            data, the contents of the actual data or the path of a file 
+            (:class:`os.PathLike`) to read it from. The file can also hold 
+            data compiled by :meth:`compile_data`, or JSON or NDJSON (ending 
+            in `.json`, `.ndjson` or `.jsonl`) which is streamed in by 
+            :meth:`load_data`
+        :type raw_data: str or os.PathLike
         :returns: a new :class:`rasblite.engine.ModelData` object containing the 
             structure provided and populated with the starting data provided
         :rtype: :class:`rasblite.engine.ModelData`
@@ -184,10 +421,194 @@ class ModelParser(object):
         
         raw_structure = config[self.KEY_MODEL][self.KEY_STRUCTURE]
         model._structure = self.__parse_structure(raw_structure)
-        model._data_store = self.__parse_data(model._structure, raw_data)
+        model._routes = self.__compile_routes(model._structure)
+        if isinstance(raw_data, os.PathLike):
+            model._data_store = self.__load_data_file(model, raw_data)
+        else:
+            model._data_store = self.__parse_data(model, raw_data)
         
         
         return model
+    
+    def compile_data(self, raw_model, raw_data, output_file):
+        """Verifies the starting data against the model once and writes it to
+        a compact binary file, which is loaded straight into the data store by
+        :meth:`parse` without being parsed or verified again. The file starts
+        with a hash of the model so that it is not loaded for a different one.
+        
+        The data is pickled, so as with any pickle only load a file that you
+        compiled yourself.
+        
+        :param str raw_model: contents of the model structure config
+        :param str raw_data: contents of the starting data
+        :param output_file: binary file to write the compiled data to
+        :raises ValueError: if the data does not match the model
+        """
+        model = self.parse(raw_model, 'EMPTY')
+        data_store = literal_eval(raw_data)
+        if not self.__verify_data(model, data_store):
+            raise ValueError('Starting data does not match the model')
+        
+        output_file.write(self.COMPILED_DATA_MAGIC)
+        output_file.write(self.__model_hash(model))
+        pickle.dump(data_store, output_file, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def load_data(self, model, data_file, data_format='json'):
+        """Streams starting data for the model from a JSON or NDJSON file. 
+        Each item of a collection is verified and inserted into the data store
+        as soon as it is read, so a file much larger than the data store never
+        has to be held in memory at once.
+        
+        A JSON file holds a single object in the same shape as the Python 
+        starting data. Each line of an NDJSON file holds an object with a 
+        single key, which is either a collection of the model (such as 
+        `users`) along with one item or a list of items to add to it, or any
+        other key of the model along with its whole value.
+        
+        :param model: :class:`rasblite.engine.ModelData` to load the data for
+        :param data_file: text file to read the data from
+        :param str data_format: either `json` or `ndjson`
+        :returns: the new data store, or an empty one if the data does not 
+            match the model
+        :rtype: dict
+        :raises ValueError: if the file is not valid JSON or NDJSON
+        """
+        keys = dict()
+        def intern_keys(pairs):
+            # Items share their key strings rather than each having a copy
+            return {keys.setdefault(key, key): value for key, value in pairs}
+        
+        if data_format == 'json':
+            loader = self.__stream_json(model._routes, self.JSONReader(data_file, intern_keys))
+        elif data_format == 'ndjson':
+            decoder = json.JSONDecoder(object_pairs_hook=intern_keys)
+            loader = self.__stream_ndjson(model._routes, data_file, decoder)
+        else:
+            raise ValueError('Unknown starting data format: ' + data_format)
+        
+        data_store = dict()
+        for key, item, route, is_item in loader:
+            if is_item:
+                collection = data_store.setdefault(key, [])
+                if not self.__verify_item(item, route, key + '/' + str(len(collection))):
+                    return dict()
+                collection.append(item)
+            else:
+                if not self.__verify_route(key, item, route):
+                    return dict()
+                data_store[key] = item
+        
+        logger.info('Successful! Data matches model')
+        return data_store
+    
+    def check_data(self, model, data):
+        """Checks the whole of the data against the model, as starting data is
+        checked by :meth:`parse`. If there are validation workers then 
+        collections too large to check in one go are split into chunks and 
+        checked across a pool of processes. Either way the first mismatch in
+        the order of the data is the one reported.
+        
+        :param rasblite.engine.ModelData model: model parsed by :meth:`parse`
+        :param dict data: data to check, such as starting data
+        :returns: None if the data matches the model, otherwise a description
+            of the first mismatch found and where it is
+        :rtype: str
+        """
+        routes = model._routes
+        if not self.validate_workers:
+            return routes.check(data)
+        
+        chunks = list()
+        error = self.__partition_data(routes, data, (), chunks)
+        if chunks:
+            # Every chunk comes before the mismatch found outside of them
+            error = self.__verify_chunks(routes, data, chunks) or error
+        
+        return error
+    
+    def __stream_json(self, routes, reader):
+        """Yields the key, value and route of each part of a JSON object read 
+        by a :class:`JSONReader`, along with whether the value is an item of a
+        collection. The items of a collection are yielded one at a time after
+        an empty list for the collection itself.
+        """
+        reader.expect('{')
+        if reader.peek() == '}':
+            reader.expect('}')
+        else:
+            separator = ','
+            while separator == ',':
+                key = reader.value()
+                if not isinstance(key, str):
+                    raise ValueError('Expected a key but found %r' % (key,))
+                reader.expect(':')
+                
+                route = routes.children.get(key)
+                if route is not None and route.param_child is not None and reader.peek() == '[':
+                    reader.expect('[')
+                    yield key, [], route, False
+                    if reader.peek() == ']':
+                        reader.expect(']')
+                    else:
+                        while True:
+                            yield key, reader.value(), route, True
+                            if reader.expect(',]') == ']':
+                                break
+                else:
+                    yield key, reader.value(), route, False
+                separator = reader.expect(',}')
+        
+        if reader.peek():
+            raise ValueError('Extra data after the starting data')
+    
+    def __stream_ndjson(self, routes, data_file, decoder):
+        """Yields the key, value and route of the object on each line of an 
+        NDJSON file, along with whether the value is an item of a collection.
+        A list of items for a collection is yielded one item at a time.
+        """
+        for line_number, line in enumerate(data_file, 1):
+            if not line.strip():
+                continue
+            
+            line_data = decoder.decode(line)
+            if not isinstance(line_data, dict) or len(line_data) != 1:
+                raise ValueError('Line %d is not an object with a single key' % line_number)
+            
+            for key, item in line_data.items():
+                route = routes.children.get(key)
+                if route is None or route.param_child is None:
+                    yield key, item, route, False
+                elif isinstance(item, list):
+                    for next_item in item:
+                        yield key, next_item, route, True
+                else:
+                    yield key, item, route, True
+    
+    def __model_hash(self, model):
+        """Returns a hash of the base url and structure of the model."""
+        return hashlib.sha256(repr(model).encode()).digest()
+    
+    def __load_data_file(self, model, path):
+        """Loads the starting data from a file, which either holds data 
+        compiled by :meth:`compile_data`, JSON or NDJSON to stream into the 
+        data store (see :meth:`load_data`) or the contents of the data.
+        """
+        data_format = self.DATA_FORMATS.get(os.path.splitext(path)[1].lower())
+        if data_format is not None:
+            logger.info('Streaming %s data from %s', data_format, path)
+            with open(path, encoding='utf8') as data_file:
+                return self.load_data(model, data_file, data_format)
+        
+        with open(path, 'rb') as data_file:
+            if data_file.read(len(self.COMPILED_DATA_MAGIC)) != self.COMPILED_DATA_MAGIC:
+                data_file.seek(0)
+                return self.__parse_data(model, data_file.read().decode())
+            
+            if data_file.read(hashlib.sha256().digest_size) != self.__model_hash(model):
+                raise ValueError('Compiled data in ' + str(path) + ' was compiled for a different model')
+            
+            logger.info('Loading compiled data from %s', path)
+            return pickle.load(data_file)
 
     def __parse_structure(self, raw_structure):
         """Parses the raw model structure and returns a dictionary containing 
@@ -212,7 +633,55 @@ class ModelParser(object):
         
         return structure
     
-    def __parse_data(self, model_structure, raw_data):
+    def __compile_routes(self, structure, route=None):
+        """Compiles (recursively) the parsed model structure into a route trie
+        of :class:`rasblite.engine.ModelData.RouteNode` objects so that a 
+        request can be dispatched in a single pass over its path parts.
+        """
+        if route is None:
+            route = ModelData.RouteNode()
+        
+        for key, detail in structure.items():
+            if key == self.KEY_METHODS:
+                continue
+            
+            pattern = route.pattern + '/' + key if route.pattern else key
+            child = ModelData.RouteNode(key, frozenset(detail[self.KEY_METHODS].split(',')), 
+                                        pattern)
+            if child.is_param:
+                route.param_child = child
+            else:
+                route.children[key] = child
+            self.__compile_routes(detail, child)
+        
+        if route.param_child is not None:
+            route.kind = ModelData.RouteNode.COLLECTION
+        elif route.children:
+            route.kind = ModelData.RouteNode.OBJECT
+            if route.is_param:
+                route.record = self.__record_class(route)
+        
+        return route
+    
+    def __record_class(self, route):
+        """Generates a :class:`rasblite.engine.ModelData.Record` class with a 
+        slot for each field of the items found at the route, such as `name`,
+        `age` and `addresses` for `users/:userID`. A field that cannot be a 
+        slot name is given a numbered slot instead.
+        """
+        slots = dict()
+        for index, field in enumerate(route.children):
+            if field.isidentifier() and not field.startswith('_'):
+                slots[field] = field
+            else:
+                slots[field] = '_field%d' % index
+        
+        name = 'Record_' + re.sub(r'\W+', '_', route.pattern)
+        return type(name, (ModelData.Record,), {'__slots__': tuple(slots.values()), 
+                                                '_slots': slots, 
+                                                '__module__': __name__})
+    
+    def __parse_data(self, model, raw_data):
         """Parses the raw data to create starting data for the model. The model
         structure is used to ensure the data matches the model. The raw data
         can also contain a special string that the ModelParser understands to
@@ -224,21 +693,110 @@ class ModelParser(object):
             raw_data = 'EMPTY'
         
         if raw_data in self.STARTING_DATA_MODES:
-            data_store = self.STARTING_DATA_MODES[raw_data](self, model_structure)
+            data_store = self.STARTING_DATA_MODES[raw_data](self, model._structure)
         else:
-            # TODO: If we trust the data we could just set it like data_store = literal_eval(raw_data)
-            data_matches_model = True
+            # TODO: If we trust the data we could skip verifying it, see compile_data
             new_data = literal_eval(raw_data)
-            for data_key in new_data:
-                data_matches_model = self.__verify_data_for_data_store(data_key, new_data, model_structure)
-                if not data_matches_model:
-                    break
-            if data_matches_model:
-                print('Successful! Data matches model')
-                data_store = literal_eval(raw_data)
+            if self.__verify_data(model, new_data):
+                logger.info('Successful! Data matches model')
+                data_store = new_data
         
         return data_store
     
+    def __verify_data(self, model, new_data):
+        """Returns True if the whole of the data matches the model (see 
+        :meth:`check_data`), otherwise logs the first mismatch found.
+        """
+        error = self.check_data(model, new_data)
+        if error is not None:
+            logger.error(error)
+            return False
+        return True
+    
+    def __partition_data(self, route, data, keys, chunks):
+        """Checks (recursively) the data against the model in the order of the
+        data, apart from the items of any collection with more items than the
+        chunk size, which are added to chunks (as the keys leading to the 
+        collection and a range of items) instead. The items of smaller 
+        collections are looked through for larger collections inside them. 
+        Returns the first mismatch found outside of the chunks (after which 
+        nothing more is partitioned) or None.
+        """
+        if isinstance(data, dict) and route.children:
+            for key, item in data.items():
+                child = route.children.get(key)
+                if child is None:
+                    # Let the route describe the extra key
+                    return route.check({key: item}, self.__path(keys))
+                
+                error = self.__partition_data(child, item, keys + (key,), chunks)
+                if error is not None:
+                    return error
+            return None
+        
+        if isinstance(data, list) and route.param_child is not None:
+            if len(data) > self.validate_chunk_size:
+                chunks.extend((keys, start, min(start + self.validate_chunk_size, len(data)))
+                              for start in range(0, len(data), self.validate_chunk_size))
+                return None
+            
+            if self.__has_collections(route.param_child):
+                for index, item in enumerate(data):
+                    if isinstance(item, list):
+                        # Let the route describe the list in a list
+                        return route.check_item(item, self.__path(keys + (index,)))
+                    
+                    error = self.__partition_data(route.param_child, item, keys + (index,), chunks)
+                    if error is not None:
+                        return error
+                return None
+        
+        return route.check(data, self.__path(keys))
+    
+    @classmethod
+    def __has_collections(cls, route):
+        """Returns True if there is a collection at or below the route."""
+        if route.param_child is not None:
+            return True
+        
+        return any(cls.__has_collections(child) for child in route.children.values())
+    
+    @staticmethod
+    def __path(keys):
+        """Returns the path within the data of the keys (and indices) given."""
+        return '/'.join(str(key) for key in keys)
+    
+    def __verify_chunks(self, routes, new_data, chunks):
+        """Checks the chunks of items across a pool of processes, returning the
+        first mismatch in the order of the data (so the same one is reported
+        however the chunks are scheduled) or None. The workers are started 
+        fresh rather than forked (which is unsafe once threads are running), 
+        so each is sent the routes without their record classes, which cannot
+        be pickled, and only the items of the chunks it checks.
+        """
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in start_methods else 'spawn')
+        with ProcessPoolExecutor(self.validate_workers, mp_context=context,
+                                 initializer=self.ValidationWorker.start,
+                                 initargs=(routes.without_records(),)) as executor:
+            futures = list()
+            for keys, start, stop in chunks:
+                collection = new_data
+                for key in keys:
+                    collection = collection[key]
+                futures.append(executor.submit(self.ValidationWorker.check_chunk, 
+                                               keys, start, collection[start:stop]))
+            logger.info('Verifying %d chunks of starting data across %d processes', 
+                        len(futures), self.validate_workers)
+            
+            for future in futures:
+                error = future.result()
+                if error is not None:
+                    executor.shutdown(cancel_futures=True)
+                    return error
+        
+        return None
+    
 
 class ModelData():
     """The rasblite ModelData holds both the structure of the data and the 
@@ -263,182 +821,2355 @@ class ModelData():
             """
             self.error_type = error_type
             self.message = message
-            
-    def __init__(self):
-        """Creates a new ModelData with starting (empty) defaults.
-        """
-        self._structure = dict()
-        self._base_url = ''
-        
-    def __repr__(self):
-        """Returns a string representation of the ModelData.
-        """
-        desc_string = ''
-        desc_string += 'BASE URL = ' + self._base_url
-        desc_string += '\nSTRUCTURE = ' + pformat(self._structure)
-        
-        return desc_string
-    
-    def __verify_base_url(self, path):
-        """Verifies the base url used matches the one that is held by the model,
-        returning True if it does.
-        """
-        if len(path) < len(self._base_url):
-            return False
-
-        sub_path = path[:len(self._base_url)]
-
-        return (sub_path.lower() == self._base_url)
     
-    def action_path(self, method, path, message_body=None):
-        """Carries out the user's instruction depending on the method (GET,POST,
-        PUT or DELETE) and returns either the data requested or a 
-        :class:`rasblite.engine.ModelData.ModelError` if there was an issue.
+    class RouteNode():
+        """The RouteNode class is a single node of the route trie compiled from
+        the model structure by the :class:`rasblite.engine.ModelParser`. Literal
+        path parts are held in a dictionary of children whereas a parameter 
+        (such as `:userID`) is held as the one parameter child of the node.
         
-        :param str method: HTTP method used such as GET, POST, PUT or DELETE
-        :param str path: full url requested by the user
-        :param str message_body: data from the HTTP body (such as data to be put
-            into the model)
-        :returns: data requested by the user or a 
-            :class:`rasblite.engine.ModelData.ModelError`
-        :rtype: str, dict, list or :class:`rasblite.engine.ModelData.ModelError`
+        The trie doubles as the schema of the data store. Each node is either
+        a leaf holding a string, an object holding its children or a 
+        collection holding a list of items, so data can be checked against it
+        with a single lookup per key however wide the model is.
         """
-        valid_base_path = self.__verify_base_url(path)
-        if not valid_base_path:
-            return self.ModelError(error_type='BaseError')
+        __slots__ = ('key', 'methods', 'pattern', 'is_param', 'children', 
+                     'param_child', 'kind', 'record')
         
-        path = path[len(self._base_url):]
-        path_parts = path.split('/')
+        LEAF = 'leaf'
+        OBJECT = 'object'
+        COLLECTION = 'collection'
         
-        if path:
-            result = self.__walk_structure_tree(method, None, message_body, self._structure, path_parts, list(), list())
-        else:
-            result =  ModelData.ModelError(error_type='BaseError')
+        def __init__(self, key=None, methods=frozenset(), pattern=''):
+            """Creates a new RouteNode for a key within the model structure.
             
-        return result
-
-    
-    def __walk_structure_tree(self, method, allowed_methods, message_body, structure, path_parts, previous_parts, previous_keys):
-        """There are two main parts to this function. The first part walks 
-        (recursively) through the model to drill down to the requested point to
-        verify the request matches the model held. A ModelError is returned if 
-        this is not the case (for example if the request has not been allowed 
-        for this HTTP method). Once the correct location has been found within
-        the model, the second part is the data is then transversed to perform 
-        the actual requested action on the data store. 
-        """
-        print('structure', structure)
-        print('path_parts', path_parts)
+            :param str key: key of the node within the model structure such as
+                `users` or `:userID`. None is used for the root of the trie
+            :param frozenset methods: HTTP methods allowed on this node
+            :param str pattern: route of the node within the model structure 
+                such as `users/:userID/name`
+            """
+            self.key = key
+            self.methods = methods
+            self.pattern = pattern
+            self.is_param = key is not None and key[0] == ':'
+            self.children = dict()
+            self.param_child = None
+            self.kind = self.LEAF
+            self.record = None # Record class for the items of a collection
         
-        if not path_parts:
-            if method in allowed_methods.split(','):
-                return self.__walk_data_store(method, message_body, self._data_store, None, None, previous_parts, previous_keys)
-            else:
-                result = ModelData.ModelError(error_type='BadRequestError')
-                return result
+        def without_records(self):
+            """Returns a copy of the trie from this node down without the 
+            record classes, which are generated (see 
+            :meth:`rasblite.engine.ModelParser.parse`) and so cannot be 
+            pickled, such as to send the trie to another process.
+            
+            :returns: copy of this node
+            :rtype: :class:`rasblite.engine.ModelData.RouteNode`
+            """
+            route = ModelData.RouteNode(self.key, self.methods, self.pattern)
+            route.kind = self.kind
+            route.children = {key: child.without_records() for key, child in self.children.items()}
+            if self.param_child is not None:
+                route.param_child = self.param_child.without_records()
+            
+            return route
         
-        for current_node in path_parts:
-            if current_node == '':
-                if method in allowed_methods.split(','):
-                    return self.__walk_data_store(method, message_body, self._data_store, None, None, previous_parts, previous_keys)
-                else:
-                    result = ModelData.ModelError(error_type='BadRequestError')
-                    return result
+        def check(self, value, path=None):
+            """Checks (recursively) that the value matches the model at this 
+            node.
             
-            for key in structure:
-                if key == ModelParser.KEY_METHODS:
-                    continue
-                
-                if key == current_node or (key[0] == ':' and current_node.isdigit()):
-                    detail = structure[key]
-                    allowed_methods = detail[ModelParser.KEY_METHODS]
-                    previous_keys.append(key)
-                    result = self.__walk_structure_tree(method, allowed_methods, message_body, detail, path_parts[1:], previous_parts + path_parts[:1], previous_keys)
-                    if result is not None:
-                        return result
-                    else:
-                        result = ModelData.ModelError(error_type='BadRequestError')
-                        return result
-                    
-    def __walk_data_store(self, method, message_body, read_only_detail, current_key, previous_detail, previous_parts, previous_keys):
-        """Walks (recursively) through the data to perform the requested action 
-        on the data store. This could be reading the data at a certain point if
-        the HTTP method is GET or it could be placing new data if the HTTP
-        method is PUT or POST for example.
-        """
-        # TODO: Probably need to return a status code too, such as 204
-        if not previous_parts:
-            if method == 'GET':
-                return read_only_detail
-            elif method == 'POST':
-                # TODO: We check the model up to the point we insert but we don't verify underneath. Therfore it's possible to insert rubbish.
-                read_only_detail.append(message_body)
-                return read_only_detail
-            elif method == 'PUT':
-                # TODO: Should break PUT into a separate method
-                if not isinstance(read_only_detail, type(message_body)):
-                    print('ERROR data provided is not of the same type')
-                    return ModelData.ModelError(error_type='BadRequestError')
-                elif isinstance(read_only_detail, dict):
-                    
-                    for new_key, new_value in message_body.items():
-                        previous_detail[current_key][new_key] = new_value
-                else:
-                    previous_detail[current_key] = message_body
-                
-                # If we've updated an item field then return the whole object
-                # otherwise if the whole object has been updated then return it
-                if isinstance(current_key, int):
-                    return previous_detail[current_key]
-                else:
-                    return previous_detail
-            elif method == 'DELETE':
-                self.__perform_delete(previous_detail, current_key)
-                
-                return previous_detail
+            :param value: data to check, such as the body of a PUT
+            :param str path: path of the value within the data store (such as
+                `users/3`), which the location of any mismatch is given from
+            :returns: None if the value matches the model, otherwise a 
+                description of the first mismatch found and where it is
+            :rtype: str
+            """
+            return self.__describe(self.__check(value), path)
         
-        for current_node in previous_parts:
-
+        def check_item(self, item, path=None):
+            """Checks that the item matches the model of an item in the 
+            collection at this node, such as the body of a POST.
             
-            if previous_keys[0][0] == ':':
-                if not current_node.isdigit():
-                    print('ERROR should be a number index')
-                    return ModelData.ModelError(error_type='BadRequestError')
-                index = int(current_node)
+            :param item: item to check
+            :param str path: path of the item within the data store (such as
+                `users/3`), which the location of any mismatch is given from
+            :returns: None if the item matches the model, otherwise a 
+                description of the first mismatch found and where it is
+            :rtype: str
+            """
+            return self.__describe(self.__check_item(item), path)
+        
+        def __describe(self, error, path):
+            """Formats the error found by a check along with its location."""
+            if error is None:
+                return None
+            
+            message, keys = error
+            location = [str(key) for key in reversed(keys)]
+            if path:
+                location.insert(0, path)
+            
+            return message + ' (at ' + '/'.join(location) + ')' if location else message
+        
+        def __check(self, value):
+            """Checks the value against this node, returning None or the first
+            mismatch along with the keys leading to it (deepest first, so 
+            that they are only gathered on the way back from a mismatch).
+            """
+            if isinstance(value, str):
+                if self.kind != self.LEAF:
+                    return ('Data contains a string but model is expecting a dictionary or list', [])
+            elif isinstance(value, list):
+                if self.param_child is None:
+                    return ('Data contains a list but the model doesn\'t', [])
                 
-                if index >= len(read_only_detail):
-                    print('ERROR number higher than size of collection')
-                    return ModelData.ModelError(error_type='BaseError')
+                for index, item in enumerate(value):
+                    error = self.__check_item(item)
+                    if error is not None:
+                        error[1].append(index)
+                        return error
+            elif isinstance(value, dict):
+                if not self.children:
+                    return ('Data contains a dictionary but the model doesn\'t', [])
                 
-                return self.__walk_data_store(method, message_body, read_only_detail[index], index, read_only_detail, previous_parts[1:], previous_keys[1:] )
+                for key, item in value.items():
+                    child = self.children.get(key)
+                    if child is None:
+                        return ('Data contains extra identifier not in the model: %r' % (key,), [])
+                    
+                    error = child.__check(item)
+                    if error is not None:
+                        error[1].append(key)
+                        return error
             else:
-                if current_node not in read_only_detail:
-                    print('ERROR Model allowed \'' + current_node + '\' but the data store does not contain it.')
-                    return ModelData.ModelError(error_type='BaseError')
-                return self.__walk_data_store(method, message_body, read_only_detail[current_node], current_node, read_only_detail, previous_parts[1:], previous_keys[1:]) 
+                return ('Unhandled type ' + value.__class__.__name__, [])
             
-    def __perform_delete(self, previous_detail, current_key):
-        """Carries out a delete on the data (for example if the HTTP method used
-        was DELETE) which replaces the requested point with an empty object of
-        that type. Deletes will also do the same to anything underneath them in
-        the model structure.
-        """
-        if isinstance(previous_detail[current_key], dict):
+            return None
+        
+        def __check_item(self, item):
+            """Checks an item of the collection at this node, returning None or
+            the first mismatch as :meth:`__check` does.
+            """
+            if self.param_child is None:
+                return ('Model does not have a collection at ' + (self.pattern or 'the base URL'), [])
+            if isinstance(item, list):
+                return ('Cannot have a list contain another list', [])
+            
+            return self.param_child.__check(item)
+            
+    class VersionNode():
+        """The VersionNode class records when part of the data store was last
+        changed. VersionNodes are only created along the paths that have been
+        written to, so the version tree stays small however large the data 
+        store is.
+        """
+        __slots__ = ('version', 'subtree', 'children')
+        
+        def __init__(self):
+            """Creates a new VersionNode that has never been written to.
+            """
+            self.version = 0    # When this node (and so everything under it) was replaced
+            self.subtree = 0    # When anything at or under this node was last changed
+            self.children = None
+    
+    class Record(MutableMapping):
+        """The Record class is the base of the record classes generated by the
+        :class:`rasblite.engine.ModelParser` for the items of each collection
+        in the model (see :meth:`rasblite.engine.ModelData.use_record_storage`).
+        Each generated class has a slot for every field of the item rather 
+        than a dictionary, so its fields are attribute lookups and the keys 
+        are shared by every item. A field the item does not have is an empty
+        slot.
+        
+        It behaves as a dictionary of its fields, and is only turned into one
+        when it is encoded. It is also pickled (and so compiled) as a plain 
+        dictionary, as the generated class cannot be found by name when it is
+        loaded. The data store is turned back into records when it is stored
+        (see :meth:`rasblite.engine.ModelData.use_record_storage`).
+        """
+        __slots__ = ()
+        
+        _slots = dict() # Name of the slot for each field, set for each generated class
+        
+        def __init__(self, fields=()):
+            """Creates a new record holding the fields given.
+            
+            :param fields: dictionary (or pairs) of the fields of the item
+            """
+            for field, value in dict(fields).items():
+                self[field] = value
+        
+        def __getitem__(self, field):
+            try:
+                return getattr(self, self._slots[field])
+            except (KeyError, AttributeError):
+                raise KeyError(field) from None
+        
+        def __contains__(self, field):
+            slot = self._slots.get(field)
+            return slot is not None and hasattr(self, slot)
+        
+        def __setitem__(self, field, value):
+            slot = self._slots.get(field)
+            if slot is None:
+                raise KeyError('%r is not a field of %s' % (field, self.__class__.__name__))
+            setattr(self, slot, value)
+        
+        def __delitem__(self, field):
+            try:
+                delattr(self, self._slots[field])
+            except (KeyError, AttributeError):
+                raise KeyError(field) from None
+        
+        def __iter__(self):
+            return (field for field, slot in self._slots.items() if hasattr(self, slot))
+        
+        def __len__(self):
+            return sum(1 for slot in self._slots.values() if hasattr(self, slot))
+        
+        def __repr__(self):
+            return repr(dict(self))
+        
+        def __reduce__(self):
+            # Generated classes cannot be found by name, so pickle it as a dict
+            return (dict, (dict(self),))
+    
+    class ColumnarCollection(MutableSequence):
+        """The ColumnarCollection class holds a collection whose items only 
+        have leaf fields (such as strings) as one column per field rather than
+        a dictionary per item, along with a mask of which items have the 
+        field. A column of whole numbers is held as a typed array (with a 
+        second mask of the items whose value is empty, as a DELETE leaves it),
+        so a collection of millions of items no longer pays for a dictionary 
+        and its keys for every item.
+        
+        It behaves as a list of dictionaries. Each item read from it is a 
+        :class:`rasblite.engine.ModelData.ColumnarItem` view onto its row, and
+        dictionaries are only built when the collection is encoded.
+        """
+        __slots__ = ('_length', '_values', '_valid', '_empty')
+        
+        RE_INTEGER = re.compile(r'(?:0|-?[1-9][0-9]{0,17})') # Fits in a signed 64 bit integer and prints the same
+        
+        def __init__(self, items=()):
+            """Creates a new ColumnarCollection holding the items given.
+            
+            :param items: dictionaries to fill the collection with
+            """
+            self._length = 0
+            self._values = dict()   # Column of values for each field
+            self._valid = dict()    # Mask of the items that have each field
+            self._empty = dict()    # Mask of the items with an empty value in each array
+            self.extend(items)
+        
+        def __len__(self):
+            return self._length
+        
+        def __getitem__(self, index):
+            if isinstance(index, slice):
+                return [ModelData.ColumnarItem(self, row) for row in range(*index.indices(self._length))]
+            return ModelData.ColumnarItem(self, self.__row(index))
+        
+        def __setitem__(self, index, item):
+            if isinstance(index, slice):
+                raise TypeError('Items of a columnar collection can only be set one at a time')
+            
+            row = self.__row(index)
+            item = dict(item) # The item may be a view onto this row
+            for field, valid in self._valid.items():
+                if field not in item:
+                    valid[row] = 0
+            for field, value in item.items():
+                self.set_value(field, row, value)
+        
+        def __delitem__(self, index):
+            if isinstance(index, slice):
+                removed = len(range(self._length)[index])
+            else:
+                index, removed = self.__row(index), 1
+            
+            for field, values in self._values.items():
+                del values[index]
+                del self._valid[field][index]
+            for empty in self._empty.values():
+                del empty[index]
+            self._length -= removed
+        
+        def insert(self, index, item):
+            """Inserts the item before the index, as for a list."""
+            if index < 0:
+                index = max(0, self._length + index)
+            index = min(index, self._length)
+            for field, values in self._values.items():
+                values.insert(index, 0 if isinstance(values, array) else None)
+                self._valid[field].insert(index, 0)
+            for empty in self._empty.values():
+                empty.insert(index, 0)
+            self._length += 1
+            self[index] = item
+        
+        def pop(self, index=-1):
+            """Removes the item at the index and returns it as a dictionary."""
+            item = dict(self[index])
+            del self[index]
+            return item
+        
+        def extend(self, items):
+            """Adds the items to the end of the collection, as for a list."""
+            if items is self:
+                items = list(items)
+            for item in items:
+                self.insert(self._length, item)
+        
+        def value(self, field, row):
+            """Returns the value of a field for the item in a row, or raises a 
+            KeyError if the item does not have the field.
+            """
+            valid = self._valid.get(field)
+            if valid is None or not valid[row]:
+                raise KeyError(field)
+            
+            values = self._values[field]
+            if isinstance(values, array):
+                return '' if self._empty[field][row] else str(values[row])
+            return values[row]
+        
+        def set_value(self, field, row, value):
+            """Sets a field of the item in a row. A column of whole numbers (or
+            empty values) is turned into a list once it is given anything else.
+            """
+            values = self._values.get(field)
+            is_integer = isinstance(value, str) and \
+                         (value == '' or self.RE_INTEGER.fullmatch(value) is not None)
+            if values is None:
+                if is_integer:
+                    values = array('q', bytes(8 * self._length))
+                    self._empty[field] = bytearray(self._length)
+                else:
+                    values = [None] * self._length
+                self._values[field] = values
+                self._valid[field] = bytearray(self._length)
+            elif isinstance(values, array) and not is_integer:
+                values = self.__strings(field)
+                self._values[field] = values
+                del self._empty[field]
+            
+            if isinstance(values, array):
+                values[row] = int(value) if value else 0
+                self._empty[field][row] = not value
+            else:
+                values[row] = value
+            self._valid[field][row] = 1
+        
+        def delete_value(self, field, row):
+            """Removes a field from the item in a row, or raises a KeyError if 
+            the item does not have the field.
+            """
+            valid = self._valid.get(field)
+            if valid is None or not valid[row]:
+                raise KeyError(field)
+            
+            valid[row] = 0
+            values = self._values[field]
+            if not isinstance(values, array):
+                values[row] = None
+        
+        def copy(self):
+            """Returns a copy of the collection that later changes to it do 
+            not affect.
+            """
+            collection = ModelData.ColumnarCollection()
+            collection._length = self._length
+            collection._values = {field: values[:] for field, values in self._values.items()}
+            collection._valid = {field: valid[:] for field, valid in self._valid.items()}
+            collection._empty = {field: empty[:] for field, empty in self._empty.items()}
+            return collection
+        
+        def fields(self, row):
+            """Returns the fields that the item in a row has."""
+            return [field for field, valid in self._valid.items() if valid[row]]
+        
+        def materialize(self):
+            """Returns the items of the collection as a list of dictionaries.
+            """
+            columns = [(field, self.__strings(field), self._valid[field]) for field in self._values]
+            return [{field: values[row] for field, values, valid in columns if valid[row]} 
+                    for row in range(self._length)]
+        
+        def __strings(self, field):
+            """Returns the column of a field as a list of strings."""
+            values = self._values[field]
+            if not isinstance(values, array):
+                return values
+            
+            return ['' if empty else str(number) for number, empty in zip(values, self._empty[field])]
+        
+        def __row(self, index):
+            """Returns the row of the index, which can count back from the end
+            of the collection as for a list.
+            """
+            return range(self._length)[index]
+        
+        def __eq__(self, other):
+            if isinstance(other, (list, ModelData.ColumnarCollection)):
+                return len(self) == len(other) and all(item == other_item for item, other_item in zip(self, other))
+            return NotImplemented
+        
+        def __repr__(self):
+            return repr(self.materialize())
+        
+        def __reduce__(self):
+            return (self.__class__, (self.materialize(),))
+        
+        def __sizeof__(self):
+            return (object.__sizeof__(self) + sys.getsizeof(self._values) + sys.getsizeof(self._valid)
+                    + sys.getsizeof(self._empty)
+                    + sum(sys.getsizeof(values) for values in self._values.values())
+                    + sum(sys.getsizeof(valid) for valid in self._valid.values())
+                    + sum(sys.getsizeof(empty) for empty in self._empty.values()))
+    
+    class ColumnarItem(MutableMapping):
+        """The ColumnarItem class is a view onto a single item of a 
+        :class:`rasblite.engine.ModelData.ColumnarCollection`, which behaves as
+        a dictionary of its fields. Changing it changes the collection.
+        """
+        __slots__ = ('_collection', '_row')
+        
+        def __init__(self, collection, row):
+            """Creates a new ColumnarItem for a row of the collection.
+            
+            :param collection: :class:`rasblite.engine.ModelData.ColumnarCollection`
+                the item is in
+            :param int row: row of the item in the collection
+            """
+            self._collection = collection
+            self._row = row
+        
+        def __getitem__(self, field):
+            return self._collection.value(field, self._row)
+        
+        def __setitem__(self, field, value):
+            self._collection.set_value(field, self._row, value)
+        
+        def __delitem__(self, field):
+            self._collection.delete_value(field, self._row)
+        
+        def __iter__(self):
+            return iter(self._collection.fields(self._row))
+        
+        def __len__(self):
+            return len(self._collection.fields(self._row))
+        
+        def __repr__(self):
+            return repr(dict(self))
+        
+        def __sizeof__(self):
+            # Only the values held as objects (rather than in an array) belong
+            # to the item, the view itself is not part of the data store
+            columns = self._collection._values
+            return sum(sys.getsizeof(columns[field][self._row]) for field in self
+                       if not isinstance(columns[field], array))
+    
+    SNAPSHOT_HEADER = '# rasblite snapshot %d\n'
+    SNAPSHOT_BUFFER_SIZE = 65536 # Characters of the snapshot encoded each time the data store is locked
+    
+    def __init__(self):
+        """Creates a new ModelData with starting (empty) defaults.
+        """
+        self._structure = dict()
+        self._routes = ModelData.RouteNode()
+        self._base_url = ''
+        self._lock = ReadWriteLock()
+        self._versions = ModelData.VersionNode()
+        self._version = 0
+        self._epoch = '%x%s' % (int(time.time() * 1000), os.urandom(2).hex())
+        self._memory = None
+        self._journal = None
+        self._storage = 'dict'
+        self._snapshots = dict()
+        
+    def __repr__(self):
+        """Returns a string representation of the ModelData.
+        """
+        desc_string = ''
+        desc_string += 'BASE URL = ' + self._base_url
+        desc_string += '\nSTRUCTURE = ' + pformat(self._structure)
+        
+        return desc_string
+    
+    def __verify_base_url(self, path):
+        """Verifies the base url used matches the one that is held by the model,
+        returning True if it does.
+        """
+        if len(path) < len(self._base_url):
+            return False
+
+        sub_path = path[:len(self._base_url)]
+
+        return (sub_path.lower() == self._base_url)
+    
+    def action_path(self, method, path, message_body=None, encoder=None, bulk=False):
+        """Carries out the user's instruction depending on the method (GET,POST,
+        PUT or DELETE) and returns either the data requested or a 
+        :class:`rasblite.engine.ModelData.ModelError` if there was an issue.
+        
+        GET requests share the data store lock so they can run in parallel, 
+        whereas POST, PUT and DELETE requests hold it exclusively. A HEAD 
+        request is treated as a GET request.
+        
+        A GET on a collection can be paged with the query string. `offset` 
+        skips that many items, `after` skips every item up to and including
+        that index and `limit` caps the number of items returned. With `count`
+        the number of items is returned rather than the items themselves. For
+        example `users/?after=9&limit=5` or `users/?count`.
+        
+        A POST of a list of items (in bulk) adds every item to the collection 
+        at once. Rather than the whole collection, only the number of items 
+        added and their indices (`count` and `ids`) are returned. A list 
+        posted to a collection of objects is always added in bulk, as it could
+        not be one of the items itself.
+        
+        :param str method: HTTP method used such as GET, POST, PUT or DELETE
+        :param str path: full url requested by the user, which may include a
+            query string
+        :param str message_body: data from the HTTP body (such as data to be put
+            into the model)
+        :param function encoder: optional function that is applied to the data
+            requested while the lock is still held, so that the encoded result
+            is consistent even if other threads are writing to the data store.
+            It is passed the data and the version of the path requested (see
+            :meth:`version`)
+        :param bool bulk: True if the message body of a POST is a list of 
+            items to add rather than a single item
+        :returns: data requested by the user (or its encoding) or a 
+            :class:`rasblite.engine.ModelData.ModelError`
+        :rtype: str, dict, list or :class:`rasblite.engine.ModelData.ModelError`
+        """
+        if method == 'HEAD':
+            method = 'GET'
+        
+        if method == 'GET':
+            lock = self._lock.reading()
+        else:
+            lock = self._lock.writing()
+        
+        with lock:
+            result = self.__perform_action(method, path, message_body, encoder, bulk=bulk)
+            if self._journal is not None and method != 'GET' and \
+               not isinstance(result, ModelData.ModelError):
+                self._journal.append([self._journal.encode(method, path, message_body, bulk)])
+            
+            return result
+    
+    def action_batch(self, operations, atomic=False, encoder=None):
+        """Carries out a batch of operations in order, as :meth:`action_path` 
+        would, but takes the data store lock once for the whole batch rather 
+        than once for each operation. No other request is served in between
+        the operations.
+        
+        If the batch is atomic it stops at the first operation that fails and
+        undoes every change made by the operations before it. The result of 
+        each of those operations (and of any that were not carried out) is 
+        then a :class:`rasblite.engine.ModelData.ModelError` of type 
+        `RolledBackError`.
+        
+        :param list operations: method, path and message body of each operation
+        :param bool atomic: True to undo the whole batch if any operation fails
+        :param function encoder: optional function applied to the data 
+            returned by each operation while the lock is still held (see 
+            :meth:`action_path`)
+        :returns: result of each operation, in the same order
+        :rtype: list
+        """
+        operations = [('GET' if method == 'HEAD' else method, path, message_body)
+                      for method, path, message_body in operations]
+        
+        if all(method == 'GET' for method, path, message_body in operations):
+            lock = self._lock.reading()
+        else:
+            lock = self._lock.writing()
+        
+        undo = list() if atomic else None
+        results = list()
+        entries = list()
+        
+        with lock:
+            for method, path, message_body in operations:
+                result = self.__perform_action(method, path, message_body, encoder, undo)
+                results.append(result)
+                
+                if atomic and isinstance(result, ModelData.ModelError):
+                    self.__roll_back(undo)
+                    rolled_back = ModelData.ModelError(error_type='RolledBackError')
+                    return [result if index == len(results) - 1 else rolled_back
+                            for index in range(len(operations))]
+                
+                # Encoded straight away as later operations may change the body
+                if self._journal is not None and method != 'GET' and \
+                   not isinstance(result, ModelData.ModelError):
+                    entries.append(self._journal.encode(method, path, message_body, False))
+            
+            if entries:
+                self._journal.append(entries)
+        
+        return results
+    
+    def set_journal(self, journal):
+        """Sets the journal that every successful POST, PUT and DELETE is 
+        appended to while the data store is still locked, so that the journal
+        is in the same order as the changes. See 
+        :class:`rasblite.engine.WriteAheadLog`.
+        
+        :param journal: None or an object with `encode(method, path, 
+            message_body, bulk)`, which encodes a change as it is made, 
+            `append(entries)` and `position()`, which returns the number of 
+            the last entry appended
+        """
+        self._journal = journal
+    
+    def snapshot(self, path, callback=None):
+        """Writes the whole data store to a file in the background, without 
+        holding up requests for as long as it takes to write. The snapshot is
+        written to a temporary file first and then renamed, so the file at the
+        path is always a complete snapshot. It can be loaded with 
+        :meth:`load_snapshot` or used as starting data.
+        
+        The data store is not copied up front. Instead, until the snapshot is
+        written, each dictionary, list or collection is copied just before it
+        is first changed, so the snapshot can still read it as it was. A 
+        background thread encodes the snapshot a piece at a time (see 
+        `SNAPSHOT_BUFFER_SIZE`), locking the data store as a reader only while
+        it encodes each piece, so changes never wait for more than one piece
+        and the snapshot is never held in memory as one string.
+        
+        The snapshot records the position of the journal (see 
+        :meth:`set_journal`) at that moment, so that the changes after it can
+        be replayed.
+        
+        :param str path: path of the file to write the snapshot to
+        :param function callback: optional function called with None, or the
+            error if the snapshot could not be written, once it is done. It is
+            called from a background thread
+        :returns: background thread that finishes the snapshot
+        :rtype: :class:`threading.Thread`
+        """
+        preserved = dict()
+        with self._lock.reading():
+            number = self._journal.position() if self._journal is not None else 0
+            data_store = self._data_store
+            self._snapshots[id(preserved)] = preserved
+        
+        thread = Thread(target=self.__finish_snapshot, 
+                        args=(path, callback, self.__write_snapshot, path, number, data_store, preserved),
+                        name='rasblite-snapshot', daemon=True)
+        thread.start()
+        
+        return thread
+    
+    @classmethod
+    def copy_data(cls, data):
+        """Returns a copy of the data, down to its leaves, that later changes 
+        to the data store cannot affect. The leaves themselves (strings) are 
+        shared as they cannot be changed, and records are copied as 
+        dictionaries.
+        
+        :param data: data from the data store
+        :returns: copy of the data
+        """
+        data_type = type(data)
+        if data_type is str:
+            return data
+        if data_type is dict:
+            return {key: value if type(value) is str else cls.copy_data(value) 
+                    for key, value in data.items()}
+        if data_type is list:
+            return [value if type(value) is str else cls.copy_data(value) for value in data]
+        if isinstance(data, ModelData.ColumnarCollection):
+            return data.copy()
+        if isinstance(data, ModelData.Record):
+            # Read the slots directly rather than through the mapping methods
+            fields = dict()
+            for field, slot in data._slots.items():
+                try:
+                    value = getattr(data, slot)
+                except AttributeError:
+                    continue
+                fields[field] = value if type(value) is str else cls.copy_data(value)
+            return fields
+        if isinstance(data, Mapping):
+            return {key: cls.copy_data(value) for key, value in data.items()}
+        
+        return data
+    
+    def load_snapshot(self, path):
+        """Replaces the whole data store with a snapshot written by 
+        :meth:`snapshot`.
+        
+        :param str path: path of the snapshot
+        :returns: position of the journal when the snapshot was taken
+        :rtype: int
+        """
+        with open(path) as snapshot_file:
+            number = int(snapshot_file.readline().split()[-1])
+            self.replace_data_store(literal_eval(snapshot_file.read()))
+        
+        return number
+    
+    def replace_data_store(self, data_store):
+        """Replaces the whole data store, such as with one loaded from a 
+        snapshot. The data store is not verified against the model.
+        
+        :param dict data_store: new data store
+        """
+        with self._lock.writing():
+            self._data_store = self.__store(self._routes, data_store)
+            self._memory = None
+            self.__bump_version([], replaced=True)
+    
+    def use_columnar_storage(self):
+        """Holds every collection whose items only have leaf fields (such as 
+        `users/` when each user only has a name and an age) as a 
+        :class:`rasblite.engine.ModelData.ColumnarCollection` from now on, 
+        including those already in the data store. Collections inside the 
+        items of another collection are still held as lists.
+        """
+        with self._lock.writing():
+            self._storage = 'columnar'
+            self._data_store = self.__store(self._routes, self.__unshared(self._data_store))
+            self._memory = None
+    
+    def use_record_storage(self):
+        """Holds every item of a collection as an instance of the 
+        :class:`rasblite.engine.ModelData.Record` class generated for it from 
+        the model from now on, including those already in the data store. 
+        Items posted or put are turned into records as they are stored.
+        """
+        with self._lock.writing():
+            self._storage = 'records'
+            self._data_store = self.__store(self._routes, self.__unshared(self._data_store))
+            self._memory = None
+    
+    def version(self, path):
+        """Returns the version of the data at the path requested. The version 
+        changes whenever a POST, PUT or DELETE changes the data at that path 
+        (including anything underneath it). It includes a token unique to this
+        ModelData so that versions are not confused across server restarts.
+        
+        :param str path: full url of the data
+        :returns: opaque version string or None if the path is not valid
+        :rtype: str
+        """
+        with self._lock.reading():
+            matched = self.__match_path('GET', path.partition('?')[0])
+            if isinstance(matched, ModelData.ModelError):
+                return None
+            
+            return self.__format_version(matched)
+    
+    def read_if_unchanged(self, path, version, function, *args):
+        """Calls the function while the data store is locked as a reader, as 
+        long as the data at the path is still at the version given (see 
+        :meth:`version`), so that data returned by an earlier request can be
+        read a piece at a time without copying it.
+        
+        :param str path: full url of the data
+        :param str version: version of the data when it was returned
+        :param function function: function to call, with any further 
+            arguments given
+        :returns: result of the function or a ModelError if the data has 
+            changed
+        :rtype: object or :class:`rasblite.engine.ModelData.ModelError`
+        """
+        with self._lock.reading():
+            matched = self.__match_path('GET', path.partition('?')[0])
+            if isinstance(matched, ModelData.ModelError) or \
+               self.__format_version(matched) != version:
+                return ModelData.ModelError(error_type='ChangedError')
+            
+            return function(*args)
+    
+    def route(self, path):
+        """Returns the route within the model structure that the path matches,
+        such as `users/:userID/name` for `users/3/name`. The route trie never 
+        changes once the model is parsed so the data store lock is not needed.
+        
+        :param str path: full url requested by the user
+        :returns: route matched or None if the path does not match the model
+        :rtype: str
+        """
+        matched = self.__match_path(None, path.partition('?')[0])
+        if isinstance(matched, ModelData.ModelError):
+            return None
+        
+        return matched[-1][1].pattern
+    
+    def memory_usage(self):
+        """Returns the approximate deep size in bytes of the collections at 
+        each route within the model structure, along with the number of 
+        collections (such as the addresses of every user) and items in them. 
+        A collection's size includes everything nested inside it.
+        
+        The first call walks the whole data store. After that the sizes are 
+        kept up to date as the data is written to, by measuring only the part 
+        that changed, so later calls are cheap. Objects shared between items 
+        are counted for each of them.
+        
+        :returns: `collections`, `items` and `bytes` keyed by route
+        :rtype: dict
+        """
+        while True:
+            with self._lock.reading():
+                if self._memory is not None:
+                    return {pattern: {'collections': collections, 'items': items, 'bytes': size}
+                            for pattern, (collections, items, size) in sorted(self._memory.items())}
+            
+            with self._lock.writing():
+                if self._memory is None:
+                    memory = dict()
+                    self.__measure(self._data_store, self._routes, memory)
+                    self._memory = memory
+    
+    def routes(self):
+        """Returns every route within the model structure along with the HTTP 
+        methods allowed on it, parents before their children. Routes are 
+        relative to the base url (see :meth:`base_url`).
+        
+        :returns: routes such as `users/:userID/name` and their methods
+        :rtype: list(tuple(str, frozenset))
+        """
+        routes = list()
+        nodes = [self._routes]
+        while nodes:
+            node = nodes.pop(0)
+            if node.key is not None:
+                routes.append((node.pattern, node.methods))
+            nodes.extend(node.children.values())
+            if node.param_child is not None:
+                nodes.append(node.param_child)
+        
+        return routes
+    
+    def base_url(self):
+        """Returns the base url which every path in the model starts with.
+        
+        :rtype: str
+        """
+        return self._base_url
+    
+    def __write_snapshot(self, path, number, data_store, preserved):
+        """Writes the data store, as it was when the snapshot was taken, to a 
+        temporary file a piece at a time, which then replaces the snapshot at
+        the path. The data store is locked as a reader while each piece is 
+        encoded, but not while it is written.
+        """
+        temporary_path = '%s.%d-%d.tmp' % (path, os.getpid(), get_ident())
+        try:
+            with open(temporary_path, 'w') as snapshot_file:
+                snapshot_file.write(self.SNAPSHOT_HEADER % number)
+                encoded = self.__encode_snapshot(data_store, preserved)
+                while encoded is not None:
+                    pieces, length = list(), 0
+                    with self._lock.reading():
+                        while length < self.SNAPSHOT_BUFFER_SIZE:
+                            piece = next(encoded, None)
+                            if piece is None:
+                                encoded = None
+                                break
+                            pieces.append(piece)
+                            length += len(piece)
+                    snapshot_file.write(''.join(pieces))
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+        finally:
+            with self._lock.reading():
+                del self._snapshots[id(preserved)]
+        os.replace(temporary_path, path)
+    
+    @classmethod
+    def __encode_snapshot(cls, data, preserved):
+        """Encodes the data as :func:`repr` does, in pieces, reading the copy
+        of any container that has been changed since the snapshot was taken 
+        (see :meth:`__preserve`). Dictionaries that only hold leaves (such as
+        most items of a collection) are encoded whole.
+        
+        The data store may change whenever a piece has been yielded, so a 
+        dictionary's items are taken as they are before the first piece, 
+        whereas a list or collection is looked up again for each item.
+        """
+        if isinstance(data, Mapping):
+            items = list(cls.__preserved(data, preserved).items())
+            if not any(isinstance(value, (Mapping, list, ModelData.ColumnarCollection)) 
+                       for _, value in items):
+                yield repr(dict(items))
+                return
+            
+            separator = '{'
+            for key, value in items:
+                yield separator + repr(key) + ': '
+                yield from cls.__encode_snapshot(value, preserved)
+                separator = ', '
+            yield '}'
+        elif isinstance(data, (list, ModelData.ColumnarCollection)):
+            separator = '['
+            index = 0
+            while True:
+                collection = cls.__preserved(data, preserved)
+                if index >= len(collection):
+                    break
+                yield separator
+                yield from cls.__encode_snapshot(collection[index], preserved)
+                separator = ', '
+                index += 1
+            yield ']' if separator == ', ' else '[]'
+        else:
+            yield repr(data)
+    
+    @staticmethod
+    def __preserved(data, preserved):
+        """Returns the copy of the data kept for a snapshot if it has been 
+        changed since the snapshot was taken, otherwise the data itself.
+        """
+        kept = preserved.get(id(data))
+        return data if kept is None else kept[1]
+    
+    def __preserve(self, data):
+        """Keeps a shallow copy of a dictionary, list or collection for every
+        snapshot being written (see :meth:`snapshot`) that has not kept one 
+        yet, just before it is changed. The data itself is kept too, so that 
+        its id is not reused while the snapshot is written. Changing an item
+        of a collection keeps a copy of the whole collection.
+        """
+        if not self._snapshots:
+            return
+        
+        if isinstance(data, ModelData.ColumnarItem):
+            data = data._collection
+        for preserved in self._snapshots.values():
+            if id(data) not in preserved:
+                if isinstance(data, ModelData.ColumnarCollection):
+                    preserved[id(data)] = (data, data.copy())
+                elif isinstance(data, Mapping):
+                    preserved[id(data)] = (data, dict(data))
+                else:
+                    preserved[id(data)] = (data, list(data))
+    
+    def __unshared(self, data_store):
+        """Returns the data store, or a copy of it if a snapshot is being 
+        written, so that it can be changed in place throughout.
+        """
+        return self.copy_data(data_store) if self._snapshots else data_store
+    
+    def __finish_snapshot(self, path, callback, function, *args):
+        """Finishes a snapshot in the background, calling the callback once it
+        is done.
+        """
+        error = None
+        try:
+            function(*args)
+            logger.info('Wrote snapshot of the data store to %s', path)
+        except OSError as snapshot_error:
+            logger.error('Could not write snapshot to %s: %s', path, snapshot_error)
+            error = snapshot_error
+        
+        if callback is not None:
+            callback(error)
+    
+    def __perform_action(self, method, path, message_body, encoder, undo=None, bulk=False):
+        """Carries out the user's instruction, paging and encoding the result, 
+        without taking the data store lock. The caller must already hold it.
+        """
+        path, _, query = path.partition('?')
+        
+        result, version = self.__action_path(method, path, message_body, undo, bulk)
+        if query and method == 'GET' and \
+           not isinstance(result, ModelData.ModelError):
+            result = self.__page_collection(result, query)
+        if encoder is not None and result is not None and \
+           not isinstance(result, ModelData.ModelError):
+            result = encoder(result, version)
+        
+        return result
+    
+    def __action_path(self, method, path, message_body, undo=None, bulk=False):
+        """Carries out the user's instruction without taking the data store 
+        lock. The caller must already hold it. Returns the result along with
+        the version of the path afterwards (or None if there was an error).
+        A function that undoes any change made is added to undo, if given.
+        """
+        matched = self.__match_path(method, path)
+        if isinstance(matched, ModelData.ModelError):
+            return (matched, None)
+            
+        result = self.__walk_data_store(method, message_body, matched, undo, bulk)
+        if isinstance(result, ModelData.ModelError):
+            return (result, None)
+        
+        if method != 'GET':
+            # A POST only adds to the collection whereas a PUT or DELETE 
+            # replaces what was there
+            self.__bump_version(self.__version_keys(matched), 
+                                replaced=(method != 'POST'))
+            
+        return (result, self.__format_version(matched))
+    
+    def __match_path(self, method, path):
+        """Verifies the base url of the path and matches the rest of it against
+        the model structure (see :meth:`__walk_structure_tree`). The method is
+        not checked if it is None.
+        """
+        valid_base_path = self.__verify_base_url(path)
+        if not valid_base_path:
+            return self.ModelError(error_type='BaseError')
+        
+        path = path[len(self._base_url):]
+        
+        if not path:
+            return ModelData.ModelError(error_type='BaseError')
+        
+        return self.__walk_structure_tree(method, path.split('/'))
+    
+    def __version_keys(self, matched):
+        """Returns the keys into the data store (and the version tree) for the
+        path parts matched.
+        """
+        return [int(current_node) if route.is_param else current_node 
+                for current_node, route in matched]
+    
+    def __format_version(self, matched):
+        """Returns the opaque version string for the path parts matched.
+        """
+        version = self.__get_version(self.__version_keys(matched))
+        return self._epoch + '.' + str(version)
+    
+    def __get_version(self, keys):
+        """Returns the version number of the data found by following the keys
+        from the top of the data store. This is the last time that it or 
+        anything underneath it changed, or that anything above it was replaced.
+        """
+        node = self._versions
+        version = node.version
+        for key in keys:
+            if node.children is None or key not in node.children:
+                return version
+            node = node.children[key]
+            version = max(version, node.version)
+        
+        return max(version, node.subtree)
+    
+    def __bump_version(self, keys, replaced):
+        """Records a change to the data found by following the keys from the 
+        top of the data store, giving it (and everything above it) a new 
+        version number. If the data was replaced then everything underneath it
+        changed too, so the version nodes underneath are no longer needed.
+        """
+        self._version += 1
+        
+        node = self._versions
+        node.subtree = self._version
+        for key in keys:
+            if node.children is None:
+                node.children = dict()
+            if key not in node.children:
+                node.children[key] = ModelData.VersionNode()
+            node = node.children[key]
+            node.subtree = self._version
+        
+        if replaced:
+            node.version = self._version
+            node.children = None
+
+    
+    def __page_collection(self, collection, query):
+        """Applies the paging parameters in the query string to the collection,
+        returning the page of items requested (or their count). Unknown 
+        parameters are ignored.
+        """
+        params = urllib.parse.parse_qs(query, keep_blank_values=True)
+        
+        try:
+            offset = int(params['offset'][-1]) if 'offset' in params else 0
+            after = int(params['after'][-1]) if 'after' in params else -1
+            limit = int(params['limit'][-1]) if 'limit' in params else None
+        except ValueError:
+            logger.debug('Paging parameters should be numbers: %s', query)
+            return ModelData.ModelError(error_type='BadRequestError')
+        
+        if offset < 0 or after < -1 or (limit is not None and limit < 0):
+            logger.debug('Paging parameters cannot be negative: %s', query)
+            return ModelData.ModelError(error_type='BadRequestError')
+        
+        paged = ('offset' in params or 'after' in params or 'limit' in params)
+        if not paged and 'count' not in params:
+            return collection
+        
+        if not isinstance(collection, (list, ModelData.ColumnarCollection)):
+            logger.debug('Only a collection can be paged')
+            return ModelData.ModelError(error_type='BadRequestError')
+        
+        start = after + 1 + offset
+        stop = None if limit is None else start + limit
+        
+        if 'count' in params:
+            return len(range(len(collection))[start:stop])
+        
+        return collection[start:stop]
+    
+    def __walk_structure_tree(self, method, path_parts):
+        """Walks the compiled route trie to verify the request matches the model
+        held, returning the path parts paired with the route nodes they matched.
+        A ModelError is returned if this is not the case (for example if the 
+        request has not been allowed for this HTTP method). Each level is a 
+        single dictionary lookup so this is linear in the depth of the path 
+        rather than the width of the model.
+        """
+        route = self._routes
+        matched = list()
+        
+        for current_node in path_parts:
+            if current_node == '':
+                break
+            
+            next_route = route.children.get(current_node)
+            if next_route is None:
+                next_route = route.param_child
+                if next_route is None or not current_node.isdigit():
+                    if not matched:
+                        return ModelData.ModelError(error_type='BaseError')
+                    return ModelData.ModelError(error_type='BadRequestError')
+            
+            matched.append((current_node, next_route))
+            route = next_route
+        
+        if not matched:
+            return ModelData.ModelError(error_type='BaseError')
+        
+        if method is not None and method not in route.methods:
+            return ModelData.ModelError(error_type='BadRequestError')
+        
+        return matched
+                    
+    def __walk_data_store(self, method, message_body, matched, undo=None, bulk=False):
+        """Walks through the data, following the matched route, to perform the 
+        requested action on the data store. This could be reading the data at a
+        certain point if the HTTP method is GET or it could be placing new data
+        if the HTTP method is PUT or POST for example. A function that undoes
+        the change is added to undo, if given.
+        """
+        read_only_detail = self._data_store
+        previous_detail = None
+        current_key = None
+        
+        for current_node, route in matched:
+            if route.is_param:
+                index = int(current_node)
+                
+                if index >= len(read_only_detail):
+                    logger.debug('Index %d higher than size of collection', index)
+                    return ModelData.ModelError(error_type='BaseError')
+                
+                current_key = index
+                next_detail = read_only_detail[index]
+            elif isinstance(read_only_detail, ModelData.Record):
+                # Read the slot directly rather than through the mapping methods
+                try:
+                    next_detail = getattr(read_only_detail, read_only_detail._slots[current_node])
+                except (KeyError, AttributeError):
+                    logger.debug('Model allowed \'%s\' but the data store does not contain it', current_node)
+                    return ModelData.ModelError(error_type='BaseError')
+                
+                current_key = current_node
+            else:
+                if current_node not in read_only_detail:
+                    logger.debug('Model allowed \'%s\' but the data store does not contain it', current_node)
+                    return ModelData.ModelError(error_type='BaseError')
+                
+                current_key = current_node
+                next_detail = read_only_detail[current_node]
+            
+            previous_detail = read_only_detail
+            read_only_detail = next_detail
+        
+        # TODO: Probably need to return a status code too, such as 204
+        if method == 'GET':
+            return read_only_detail
+        elif method == 'POST':
+            route = matched[-1][1]
+            if bulk or (isinstance(message_body, list) and route.param_child is not None 
+                        and route.param_child.children):
+                return self.__post_items(matched, read_only_detail, message_body, undo)
+            
+            error = route.check_item(message_body)
+            if error is not None:
+                logger.debug('Data posted does not match the model: %s', error)
+                return ModelData.ModelError(error_type='BadRequestError')
+            
+            if self._storage == 'records':
+                message_body = self.__store_records(route.param_child, message_body)
+            
+            size_before = sys.getsizeof(read_only_detail)
+            self.__preserve(read_only_detail)
+            read_only_detail.append(message_body)
+            if undo is not None:
+                undo.append(read_only_detail.pop)
+            if self._memory is not None:
+                self.__account_post(matched, read_only_detail, size_before)
+            return read_only_detail
+        elif method == 'PUT':
+            # TODO: Should break PUT into a separate method
+            if self.__container_type(read_only_detail) is not self.__container_type(message_body):
+                logger.debug('Data provided is not of the same type')
+                return ModelData.ModelError(error_type='BadRequestError')
+            
+            error = matched[-1][1].check(message_body)
+            if error is not None:
+                logger.debug('Data provided does not match the model: %s', error)
+                return ModelData.ModelError(error_type='BadRequestError')
+            
+            if undo is not None:
+                undo.append(self.__saved(previous_detail, current_key))
+            
+            memory_before = self.__measure_target(matched, read_only_detail)
+            self.__preserve(previous_detail)
+            if isinstance(read_only_detail, Mapping):
+                self.__preserve(read_only_detail)
+                for new_key, new_value in message_body.items():
+                    previous_detail[current_key][new_key] = new_value
+            else:
+                previous_detail[current_key] = message_body
+            if isinstance(previous_detail[current_key], (list, dict, ModelData.Record)):
+                previous_detail[current_key] = self.__store(matched[-1][1], previous_detail[current_key])
+            self.__account_change(matched, memory_before, previous_detail[current_key])
+            
+            # If we've updated an item field then return the whole object
+            # otherwise if the whole object has been updated then return it
+            if isinstance(current_key, int):
+                return previous_detail[current_key]
+            else:
+                return previous_detail
+        elif method == 'DELETE':
+            if undo is not None:
+                undo.append(self.__saved(previous_detail, current_key))
+            
+            memory_before = self.__measure_target(matched, read_only_detail)
+            self.__perform_delete(previous_detail, current_key)
+            self.__account_change(matched, memory_before, previous_detail[current_key])
+            
+            return previous_detail
+    
+    def __container_type(self, data):
+        """Returns dict for any mapping (such as an item of a 
+        :class:`rasblite.engine.ModelData.ColumnarCollection`) and list for 
+        any other mutable sequence, otherwise the type of the data.
+        """
+        if isinstance(data, Mapping):
+            return dict
+        if isinstance(data, MutableSequence):
+            return list
+        return type(data)
+    
+    def __post_items(self, matched, collection, items, undo):
+        """Adds every item to the collection in one go, returning the number of
+        items added and their indices rather than the whole collection.
+        """
+        if not isinstance(items, list):
+            logger.debug('Items posted in bulk are not a list')
+            return ModelData.ModelError(error_type='BadRequestError')
+        
+        error = matched[-1][1].check(items)
+        if error is not None:
+            logger.debug('Items posted do not match the model: %s', error)
+            return ModelData.ModelError(error_type='BadRequestError')
+        
+        if self._storage == 'records':
+            items = [self.__store_records(matched[-1][1].param_child, item) for item in items]
+        
+        first = len(collection)
+        size_before = sys.getsizeof(collection)
+        self.__preserve(collection)
+        collection.extend(items)
+        
+        if undo is not None:
+            undo.append(lambda: collection.__delitem__(slice(first, None)))
+        if self._memory is not None:
+            self.__account_post(matched, collection, size_before, len(items))
+        
+        return {'count': len(items), 'ids': list(range(first, len(collection)))}
+    
+    def __store(self, route, data):
+        """Converts the data found at the route into the storage being used 
+        (see :meth:`use_columnar_storage` and :meth:`use_record_storage`), 
+        returning the data.
+        """
+        if self._storage == 'columnar':
+            return self.__store_columnar(route, data)
+        if self._storage == 'records':
+            return self.__store_records(route, data)
+        return data
+    
+    def __store_records(self, route, data):
+        """Converts (recursively) every item of a collection in the data into
+        an instance of the record class for its route, where route is the node
+        of the model that the data was found at. Returns the data, which is 
+        changed in place unless it is an item itself.
+        """
+        if isinstance(data, list) and route.param_child is not None:
+            for index, item in enumerate(data):
+                data[index] = self.__store_records(route.param_child, item)
+        elif isinstance(data, (dict, ModelData.Record)) and route.children:
+            for key, value in data.items():
+                child = route.children.get(key)
+                if child is not None and child.kind != ModelData.RouteNode.LEAF:
+                    data[key] = self.__store_records(child, value)
+            
+            if route.record is not None and isinstance(data, dict):
+                return route.record(data)
+        
+        return data
+    
+    def __store_columnar(self, route, data):
+        """Converts (recursively) any collection in the data that only has 
+        leaf fields into a :class:`rasblite.engine.ModelData.ColumnarCollection`,
+        where route is the node of the model that the data was found at. 
+        Returns the data, which is changed in place unless it is the 
+        collection itself.
+        """
+        if isinstance(data, list) and self.__is_flat_collection(route):
+            return ModelData.ColumnarCollection(data)
+        
+        if isinstance(data, dict) and route.kind == ModelData.RouteNode.OBJECT:
+            for key, value in data.items():
+                child = route.children.get(key)
+                if child is not None and child.kind != ModelData.RouteNode.LEAF:
+                    data[key] = self.__store_columnar(child, value)
+        
+        return data
+    
+    def __is_flat_collection(self, route):
+        """Returns True if the route is a collection whose items only have 
+        leaf fields.
+        """
+        item_route = route.param_child
+        return (item_route is not None and item_route.kind == ModelData.RouteNode.OBJECT 
+                and item_route.param_child is None
+                and all(child.kind == ModelData.RouteNode.LEAF for child in item_route.children.values()))
+    
+    def __saved(self, previous_detail, current_key):
+        """Returns a function that puts the data at the key back to how it is
+        now. A PUT or DELETE changes dicts in place, so the contents of the 
+        data and every dict beneath it (other than inside a collection) are 
+        saved too.
+        """
+        value = previous_detail[current_key]
+        saved = list()
+        pending = [value]
+        while pending:
+            data = pending.pop()
+            if isinstance(data, Mapping):
+                saved.append((data, dict(data)))
+                pending.extend(data.values())
+        
+        def restore():
+            for data, contents in saved:
+                data.clear()
+                data.update(contents)
+            previous_detail[current_key] = value
+        
+        return restore
+    
+    def __roll_back(self, undo):
+        """Undoes the changes made by a batch, most recent first. The versions
+        changed by the batch are left as they are, which only means that the 
+        data is fetched again, whereas the memory usage is measured again the
+        next time it is needed.
+        """
+        for restore in reversed(undo):
+            restore()
+        
+        self._memory = None
+    
+    def __measure(self, data, route, memory):
+        """Returns the deep size of the data found at the route, adding the 
+        number of collections, items and the size of any collections found 
+        (including the data itself) to memory.
+        """
+        # A columnar item is a view, so only count what it holds
+        size = data.__sizeof__() if isinstance(data, ModelData.ColumnarItem) else sys.getsizeof(data)
+        
+        if isinstance(data, dict):
+            for key, value in data.items():
+                child = route.children.get(key) if route is not None else None
+                size += sys.getsizeof(key) + self.__measure(value, child, memory)
+        elif isinstance(data, ModelData.Record):
+            # The keys are the slot names, which are shared by every record
+            for key, value in data.items():
+                child = route.children.get(key) if route is not None else None
+                size += self.__measure(value, child, memory)
+        elif isinstance(data, (list, ModelData.ColumnarCollection)):
+            item_route = route.param_child if route is not None else None
+            for item in data:
+                size += self.__measure(item, item_route, memory)
+            
+            if item_route is not None:
+                usage = memory.setdefault(route.pattern, [0, 0, 0])
+                usage[0] += 1
+                usage[1] += len(data)
+                usage[2] += size
+        
+        return size
+    
+    def __measure_target(self, matched, target):
+        """Measures the data about to be changed by a PUT or DELETE, if the 
+        memory usage is being kept up to date.
+        """
+        if self._memory is None:
+            return None
+        
+        memory = dict()
+        return (self.__measure(target, matched[-1][1], memory), memory)
+    
+    def __account_change(self, matched, memory_before, target):
+        """Updates the memory usage after a PUT or DELETE changed the data 
+        found by following the matched route, by measuring the data again. 
+        Any collections above it have changed in size by the same amount.
+        """
+        if memory_before is None:
+            return
+        
+        size_before, before = memory_before
+        after = dict()
+        size_after = self.__measure(target, matched[-1][1], after)
+        
+        for usage, sign in ((after, 1), (before, -1)):
+            for pattern, (collections, items, size) in usage.items():
+                total = self._memory.setdefault(pattern, [0, 0, 0])
+                total[0] += sign * collections
+                total[1] += sign * items
+                total[2] += sign * size
+        
+        self.__account_parents(matched[:-1], size_after - size_before)
+    
+    def __account_post(self, matched, collection, size_before, count=1):
+        """Updates the memory usage after a POST added items to the end of the
+        collection found by following the matched route, by measuring only 
+        the new items.
+        """
+        route = matched[-1][1]
+        nested = dict()
+        size = sys.getsizeof(collection) - size_before
+        for item in collection[len(collection) - count:]:
+            size += self.__measure(item, route.param_child, nested)
+        
+        for pattern, (collections, items, nested_size) in nested.items():
+            total = self._memory.setdefault(pattern, [0, 0, 0])
+            total[0] += collections
+            total[1] += items
+            total[2] += nested_size
+        
+        if route.param_child is not None:
+            self._memory.setdefault(route.pattern, [0, 0, 0])[1] += count
+        self.__account_parents(matched, size)
+    
+    def __account_parents(self, matched, size):
+        """Adds the change in size to every collection along the matched route.
+        """
+        for current_node, route in matched:
+            if route.param_child is not None:
+                self._memory.setdefault(route.pattern, [0, 0, 0])[2] += size
+            
+    def __perform_delete(self, previous_detail, current_key):
+        """Carries out a delete on the data (for example if the HTTP method used
+        was DELETE) which replaces the requested point with an empty object of
+        that type. Deletes will also do the same to anything underneath them in
+        the model structure.
+        """
+        if isinstance(previous_detail[current_key], Mapping):
             for new_key in previous_detail[current_key]:
                 self.__perform_delete(previous_detail[current_key], new_key)
         else:
             previous_type = type(previous_detail[current_key])
             empty_object = previous_type()
+            self.__preserve(previous_detail)
             previous_detail[current_key] = empty_object
 
 
+class DataEncoder(json.JSONEncoder):
+    """The DataEncoder encodes data from the :class:`rasblite.engine.ModelData`
+    as JSON. Collections held in columns or records are turned back into 
+    dictionaries.
+    """
+    
+    def default(self, o):
+        """Returns a JSON serialisable version of an object that the standard
+        :class:`json.JSONEncoder` does not handle.
+        """
+        if isinstance(o, ModelData.ColumnarCollection):
+            return o.materialize()
+        if isinstance(o, (ModelData.ColumnarItem, ModelData.Record)):
+            return dict(o)
+        return super().default(o)
+    
+    def iterencode_list(self, items, chunk_size=65536):
+        """Encodes a list item by item, yielding the JSON in chunks of roughly
+        chunk_size bytes so that a large list never has to be encoded into a 
+        single string.
+        
+        :param list items: items of the list to encode
+        :param int chunk_size: number of bytes to gather before yielding them
+        :returns: generator of the encoded JSON
+        :rtype: generator of bytes
+        """
+        parts = ['[']
+        size = 1
+        for index, item in enumerate(items):
+            part = self.encode(item)
+            if index:
+                part = self.item_separator + part
+            parts.append(part)
+            size += len(part)
+            
+            if size >= chunk_size:
+                yield ''.join(parts).encode()
+                parts = list()
+                size = 0
+        
+        parts.append(']')
+        yield ''.join(parts).encode()
+
+
+class ResponseCache(object):
+    """The ResponseCache holds the encoded responses to recent GET requests so
+    that they can be sent again without walking the data store or encoding 
+    the data. Each response is stored along with the version of the data it 
+    was encoded from (see :meth:`rasblite.engine.ModelData.version`) and is
+    only used while that is still the current version, so a POST, PUT or 
+    DELETE to the path, anything above it or anything underneath it 
+    invalidates the response. Once the cache is full the least recently used
+    response is evicted.
+    """
+    
+    def __init__(self, max_size):
+        """Creates an empty ResponseCache.
+        
+        :param int max_size: maximum number of responses held
+        """
+        self._max_size = max_size
+        self._responses = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+    
+    def get(self, key, version):
+        """Returns the response cached for the key if it was encoded from the 
+        current version of the data, otherwise None. A response for an older 
+        version is dropped.
+        
+        :param tuple key: normalised path and content type of the response
+        :param str version: current version of the data at the path
+        :returns: cached response or None
+        """
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry is None or version is None or entry[0] != version:
+                self._misses += 1
+                if entry is not None:
+                    del self._responses[key]
+                return None
+            
+            self._responses.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+    
+    def put(self, key, version, response):
+        """Caches the response encoded from the version of the data given, 
+        evicting the least recently used response if the cache is full.
+        
+        :param tuple key: normalised path and content type of the response
+        :param str version: version of the data the response was encoded from
+        :param response: encoded response
+        """
+        with self._lock:
+            self._responses[key] = (version, response)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self._max_size:
+                self._responses.popitem(last=False)
+    
+    def stats(self):
+        """Returns the number of cache hits and misses so far along with the 
+        number of responses held.
+        
+        :returns: dictionary with `hits`, `misses`, `size` and `max_size` keys
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses,
+                    'size': len(self._responses), 'max_size': self._max_size}
+
+
+class Metrics(object):
+    """The Metrics class records the number of requests served, their status 
+    codes, the bytes sent back and latency histograms. Requests are grouped by
+    HTTP method and the route they matched within the model structure (such 
+    as `users/:userID/name`) rather than the url requested, so the number of 
+    groups is bounded by the size of the model. Requests that do not match the
+    model are grouped under an empty route.
+    
+    The latency of each request as a whole is recorded separately from the 
+    time spent in the data store (waiting for its lock, walking it and 
+    encoding the data found) so that it is clear where the time goes.
+    """
+    
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 
+               0.5, 1.0, 2.5, 5.0) # Upper bounds in seconds
+    
+    class Histogram():
+        """The Histogram class counts observations into the buckets of 
+        :attr:`Metrics.BUCKETS`, the last count being for larger observations.
+        """
+        __slots__ = ('counts', 'total', 'count')
+        
+        def __init__(self):
+            """Creates a new Histogram without any observations.
+            """
+            self.counts = [0] * (len(Metrics.BUCKETS) + 1)
+            self.total = 0.0
+            self.count = 0
+        
+        def observe(self, value):
+            """Counts an observation into its bucket."""
+            self.counts[bisect_left(Metrics.BUCKETS, value)] += 1
+            self.total += value
+            self.count += 1
+        
+        def snapshot(self):
+            """Returns the cumulative bucket counts (keyed by upper bound), sum
+            and count of the observations.
+            """
+            upper_bounds = Metrics.BUCKETS + (float('inf'),)
+            return {'buckets': dict(zip(upper_bounds, accumulate(self.counts))),
+                    'sum': self.total, 'count': self.count}
+    
+    class RouteMetrics():
+        """The RouteMetrics class holds the metrics of the requests for a 
+        single HTTP method and route.
+        """
+        __slots__ = ('statuses', 'bytes_out', 'latency')
+        
+        def __init__(self):
+            """Creates a new RouteMetrics without any requests.
+            """
+            self.statuses = dict()
+            self.bytes_out = 0
+            self.latency = Metrics.Histogram()
+    
+    def __init__(self):
+        """Creates a new Metrics without any requests recorded.
+        """
+        self._lock = Lock()
+        self._requests = dict()
+        self._model = dict()
+    
+    def observe_request(self, method, route, status, bytes_out, seconds):
+        """Records a request served by the :class:`rasblite.engine.RequestHandler`.
+        
+        :param str method: HTTP method of the request
+        :param str route: route matched or None if the request did not match
+        :param int status: HTTP status of the response
+        :param int bytes_out: length of the response body
+        :param float seconds: time taken to serve the request
+        """
+        key = (method, route or '')
+        with self._lock:
+            route_metrics = self._requests.get(key)
+            if route_metrics is None:
+                route_metrics = self._requests[key] = Metrics.RouteMetrics()
+            route_metrics.statuses[status] = route_metrics.statuses.get(status, 0) + 1
+            route_metrics.bytes_out += bytes_out
+            route_metrics.latency.observe(seconds)
+    
+    def add_bytes(self, method, route, bytes_out):
+        """Adds to the bytes sent for a request after it has been recorded, 
+        such as when a streamed response finishes.
+        
+        :param str method: HTTP method of the request
+        :param str route: route matched or None if the request did not match
+        :param int bytes_out: length of the rest of the response body
+        """
+        key = (method, route or '')
+        with self._lock:
+            route_metrics = self._requests.get(key)
+            if route_metrics is None:
+                route_metrics = self._requests[key] = Metrics.RouteMetrics()
+            route_metrics.bytes_out += bytes_out
+    
+    def observe_model(self, method, route, seconds):
+        """Records the time taken by a request on the data store, see 
+        :meth:`rasblite.engine.Controller.perform_user_request`.
+        
+        :param str method: HTTP method of the request
+        :param str route: route matched or None if the request did not match
+        :param float seconds: time taken on the data store
+        """
+        key = (method, route or '')
+        with self._lock:
+            histogram = self._model.get(key)
+            if histogram is None:
+                histogram = self._model[key] = Metrics.Histogram()
+            histogram.observe(seconds)
+    
+    def snapshot(self):
+        """Returns a copy of the metrics recorded so far. The `requests` are 
+        keyed by (method, route) and hold the `count` of requests, their 
+        `statuses`, the `bytes_out` and the `latency` histogram. The `model` 
+        histograms are keyed in the same way.
+        
+        :returns: dictionary with `requests` and `model` keys
+        :rtype: dict
+        """
+        with self._lock:
+            requests = {key: {'count': route_metrics.latency.count,
+                              'statuses': dict(route_metrics.statuses),
+                              'bytes_out': route_metrics.bytes_out,
+                              'latency': route_metrics.latency.snapshot()}
+                        for key, route_metrics in self._requests.items()}
+            model = {key: histogram.snapshot() 
+                     for key, histogram in self._model.items()}
+        
+        return {'requests': requests, 'model': model}
+    
+    def prometheus(self):
+        """Returns the metrics recorded so far in the Prometheus text 
+        exposition format.
+        
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        requests = sorted(snapshot['requests'].items())
+        lines = list()
+        
+        lines.append('# HELP rasblite_requests_total Requests served by route and status.')
+        lines.append('# TYPE rasblite_requests_total counter')
+        for key, route_metrics in requests:
+            for status, count in sorted(route_metrics['statuses'].items()):
+                lines.append('rasblite_requests_total{%s,status="%d"} %d' 
+                             % (self.__labels(key), status, count))
+        
+        lines.append('# HELP rasblite_response_bytes_total Response body bytes sent by route.')
+        lines.append('# TYPE rasblite_response_bytes_total counter')
+        for key, route_metrics in requests:
+            lines.append('rasblite_response_bytes_total{%s} %d' 
+                         % (self.__labels(key), route_metrics['bytes_out']))
+        
+        self.__histogram_lines(lines, 'rasblite_request_duration_seconds', 
+                               'Time taken to serve requests by route.',
+                               [(key, route_metrics['latency']) for key, route_metrics in requests])
+        self.__histogram_lines(lines, 'rasblite_model_duration_seconds', 
+                               'Time taken on the data store by route.',
+                               sorted(snapshot['model'].items()))
+        
+        return '\n'.join(lines) + '\n'
+    
+    def __histogram_lines(self, lines, name, description, histograms):
+        """Appends the lines of a Prometheus histogram for each route."""
+        lines.append('# HELP ' + name + ' ' + description)
+        lines.append('# TYPE ' + name + ' histogram')
+        for key, histogram in histograms:
+            labels = self.__labels(key)
+            for upper_bound, count in histogram['buckets'].items():
+                le = '+Inf' if upper_bound == float('inf') else repr(upper_bound)
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, le, count))
+            lines.append('%s_sum{%s} %r' % (name, labels, histogram['sum']))
+            lines.append('%s_count{%s} %d' % (name, labels, histogram['count']))
+    
+    def __labels(self, key):
+        """Returns the Prometheus labels for a (method, route) key."""
+        method, route = key
+        route = route.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        
+        return 'method="%s",route="%s"' % (method, route)
+
+
+class RequestProfiler(object):
+    """The RequestProfiler runs cProfile around requests on the data store 
+    while it is started, for a number of requests, a number of seconds or 
+    until it is stopped. Only a sample of the requests can be profiled so 
+    that the server is not slowed down as much. The stats are aggregated for
+    each HTTP method and route within the model structure.
+    
+    One request is profiled at a time. Requests served at the same time as 
+    one being profiled are not sampled, so that their time is not mixed in.
+    """
+    
+    def __init__(self):
+        """Creates a RequestProfiler that is not profiling any requests.
+        """
+        self._lock = Lock()
+        self._profiling = Lock()
+        self._active = False
+        self._remaining = None
+        self._deadline = None
+        self._sample_rate = 1.0
+        self._output = None
+        self._stats = dict()
+    
+    def start(self, requests=None, seconds=None, sample_rate=1.0, output=None):
+        """Starts profiling requests, discarding any stats from before. 
+        Profiling stops after the number of requests or seconds given 
+        (whichever comes first) or when :meth:`stop` is called.
+        
+        :param int requests: number of requests to profile or None for no limit
+        :param float seconds: seconds to profile for or None for no limit
+        :param float sample_rate: fraction of the requests to profile
+        :param str output: path of a file to write the stats to once 
+            profiling stops
+        """
+        with self._lock:
+            self._stats = dict()
+            self._remaining = requests
+            self._deadline = None if seconds is None else time.monotonic() + seconds
+            self._sample_rate = sample_rate
+            self._output = output
+            self._active = True
+    
+    def stop(self):
+        """Stops profiling requests, writing the stats to the output file if 
+        one was given.
+        """
+        with self._lock:
+            output = self.__finish()
+        
+        if output is not None:
+            self.__write(output)
+    
+    def is_active(self):
+        """Returns True if requests are being profiled.
+        
+        :rtype: bool
+        """
+        if self.__expired():
+            self.stop()
+        
+        return self._active
+    
+    def call(self, method, route, function, *args):
+        """Calls the function, profiling it if the request is sampled.
+        
+        :param str method: HTTP method of the request
+        :param str route: route matched or None if the request did not match
+        :param function function: function serving the request
+        :returns: result of the function
+        """
+        if not self._active or not self.__sample():
+            return function(*args)
+        
+        if not self._profiling.acquire(blocking=False):
+            return function(*args)
+        
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            self._profiling.release()
+            self.__add(method, route, profile)
+    
+    def report(self, sort='cumulative', limit=30):
+        """Returns the stats of the requests profiled so far, as printed by 
+        :class:`pstats.Stats`, for each HTTP method and route.
+        
+        :param str sort: key to sort the functions by, such as `cumulative` or
+            `tottime`
+        :param int limit: number of functions printed for each route
+        :rtype: str
+        """
+        report = io.StringIO()
+        with self._lock:
+            for (method, route), (stats, count) in sorted(self._stats.items()):
+                report.write('%s %s (%d requests profiled)\n' % (method, route, count))
+                stats.stream = report
+                stats.sort_stats(sort).print_stats(limit)
+        
+        return report.getvalue() or 'No requests profiled\n'
+    
+    def __sample(self):
+        """Returns True if the next request should be profiled."""
+        if self.__expired():
+            self.stop()
+            return False
+        
+        return self._sample_rate >= 1 or random.random() < self._sample_rate
+    
+    def __expired(self):
+        """Returns True if profiling has gone on for the seconds given."""
+        return self._active and self._deadline is not None and \
+               time.monotonic() >= self._deadline
+    
+    def __add(self, method, route, profile):
+        """Adds the stats of a request to those of its route."""
+        output = None
+        with self._lock:
+            if not self._active:
+                return
+            
+            key = (method, route or '')
+            if key in self._stats:
+                self._stats[key][0].add(profile)
+                self._stats[key][1] += 1
+            else:
+                self._stats[key] = [pstats.Stats(profile), 1]
+            
+            if self._remaining is not None:
+                self._remaining -= 1
+                if self._remaining <= 0:
+                    output = self.__finish()
+        
+        if output is not None:
+            self.__write(output)
+    
+    def __finish(self):
+        """Stops profiling, returning the output file to write the stats to.
+        The caller must hold the lock.
+        """
+        output = self._output if self._active else None
+        self._active = False
+        self._output = None
+        
+        return output
+    
+    def __write(self, output):
+        """Writes the stats to the output file."""
+        with open(output, 'w') as output_file:
+            output_file.write(self.report())
+
+
+class MemoryTracker(object):
+    """The MemoryTracker takes tracemalloc snapshots of the memory allocated 
+    by the server so that its growth between two of them can be reported, 
+    line by line. Tracing starts with the first snapshot (it slows Python 
+    down, so it is off until then) and only the most recent snapshots are 
+    kept. Each snapshot is numbered in the order it was taken.
+    """
+    
+    def __init__(self, max_snapshots=10, frames=1):
+        """Creates a MemoryTracker that has not taken any snapshots.
+        
+        :param int max_snapshots: number of snapshots to keep
+        :param int frames: number of frames stored for each allocation
+        """
+        self._lock = Lock()
+        self._frames = frames
+        self._snapshots = deque(maxlen=max_snapshots)
+        self._taken = 0
+        self._tracing = False
+    
+    def take_snapshot(self):
+        """Takes a snapshot, starting tracemalloc first if it isn't tracing.
+        
+        :returns: number of the snapshot
+        :rtype: int
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self._frames)
+                self._tracing = True
+            
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            self._snapshots.append(snapshot)
+            self._taken += 1
+            
+            return self._taken - 1
+    
+    def compare(self, first=None, second=None, limit=20, key_type='lineno'):
+        """Returns the largest differences in the memory allocated between two
+        snapshots, one per line, as printed by :class:`tracemalloc.StatisticDiff`.
+        
+        :param int first: number of the earlier snapshot or None for the one 
+            before the second
+        :param int second: number of the later snapshot or None for the latest
+        :param int limit: number of differences returned
+        :param str key_type: how allocations are grouped, such as `lineno` or 
+            `filename`
+        :raises ValueError: if either snapshot is not kept
+        :rtype: str
+        """
+        with self._lock:
+            if second is None:
+                second = self._taken - 1
+            if first is None:
+                first = second - 1
+            
+            before = self.__snapshot(first)
+            after = self.__snapshot(second)
+        
+        stats = after.compare_to(before, key_type)
+        lines = ['Memory growth from snapshot %d to %d' % (first, second)]
+        lines.extend(str(stat) for stat in stats[:limit])
+        
+        return '\n'.join(lines) + '\n'
+    
+    def stop(self):
+        """Stops tracemalloc, if it was started by the MemoryTracker, and 
+        discards the snapshots.
+        """
+        with self._lock:
+            if self._tracing:
+                tracemalloc.stop()
+                self._tracing = False
+            self._snapshots.clear()
+    
+    def __snapshot(self, number):
+        """Returns the snapshot with the number given. The caller must hold 
+        the lock.
+        """
+        index = number - (self._taken - len(self._snapshots))
+        if number < 0 or not 0 <= index < len(self._snapshots):
+            raise ValueError('No memory snapshot ' + str(number))
+        
+        return self._snapshots[index]
+
+
+class WriteAheadLog(object):
+    """The WriteAheadLog keeps the data store across restarts by appending 
+    every successful POST, PUT and DELETE to a log in the state directory. 
+    When the server starts again the log is replayed on top of the starting
+    data (or the last snapshot) to get back to where it was.
+    
+    Entries are written and fsynced by a background thread. A request is only
+    answered once its entry has been synced (see :meth:`wait` and 
+    :meth:`wait_async`), but the entries of every request that arrives while 
+    the log is being synced are synced together next time (group commit), so
+    a burst of writes costs a few fsyncs rather than one each.
+    
+    Once the log grows past the compaction size a snapshot of the whole data
+    store is written in the background (see 
+    :meth:`rasblite.engine.ModelData.snapshot`) and the entries it holds are
+    removed from the log. Entries are numbered so that those already in the
+    snapshot are skipped if the server stopped in between.
+    """
+    
+    LOG_FILE = 'wal.log'
+    SNAPSHOT_FILE = 'snapshot.txt'
+    compact_size = 64 * 1024 * 1024
+    
+    def __init__(self, directory, compact_size=compact_size):
+        """Creates a WriteAheadLog that keeps its files in the directory given,
+        which is created if needed. Nothing is read until :meth:`recover`.
+        
+        :param str directory: path of the state directory
+        :param int compact_size: bytes the log can grow to before it is 
+            compacted into a snapshot
+        """
+        self._directory = directory
+        self._compact_size = compact_size
+        self._condition = Condition()
+        self._pending = list()
+        self._waiters = list() # Futures of coroutines waiting in wait_async
+        self._appended = 0 # Number of the last entry appended
+        self._synced = 0   # Number of the last entry synced to disk
+        self._closed = False
+        self._error = None
+        self._compacting = False
+        self._compacted = None # Offset in the log that the snapshot written holds up to
+        self._file = None
+        self._thread = None
+        self._model = None
+    
+    def recover(self, model):
+        """Loads the snapshot into the model (in place of the starting data) if
+        there is one, then replays the entries in the log after it. A partly 
+        written entry at the end of the log, left by a crash, is discarded.
+        
+        :param rasblite.engine.ModelData model: model to recover the data of
+        :raises ValueError: if an entry before the last cannot be read, as the
+            log has been corrupted rather than cut short by a crash
+        :returns: number of entries replayed
+        :rtype: int
+        """
+        os.makedirs(self._directory, exist_ok=True)
+        
+        snapshot_number = 0
+        snapshot_path = os.path.join(self._directory, self.SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            snapshot_number = model.load_snapshot(snapshot_path)
+            logger.info('Loaded snapshot of the data store from %s', snapshot_path)
+        
+        replayed = 0
+        last_number = snapshot_number
+        valid_size = 0
+        log_path = os.path.join(self._directory, self.LOG_FILE)
+        if os.path.exists(log_path):
+            with open(log_path, 'rb') as log_file:
+                bad_line = None
+                for line_number, line in enumerate(log_file, 1):
+                    if bad_line is not None:
+                        raise ValueError('Line %d of %s cannot be read but is followed by more entries' 
+                                         % (bad_line, log_path))
+                    try:
+                        number, _, entry = line.decode().partition(' ')
+                        number = int(number)
+                        method, path, message_body, bulk = literal_eval(entry)
+                    except (ValueError, SyntaxError, TypeError):
+                        bad_line = line_number
+                        continue
+                    
+                    if not line.endswith(b'\n'):
+                        bad_line = line_number
+                        continue
+                    
+                    valid_size += len(line)
+                    if number > snapshot_number:
+                        result = model.action_path(method, path, message_body, bulk=bulk)
+                        if isinstance(result, ModelData.ModelError):
+                            logger.warning('Replaying %s %s failed', method, path)
+                        replayed += 1
+                    last_number = max(last_number, number)
+                
+                if bad_line is not None:
+                    logger.warning('Discarding a partly written entry at the end of %s', log_path)
+            logger.info('Replayed %d changes from %s', replayed, log_path)
+        
+        self._file = open(log_path, 'ab')
+        self._file.truncate(valid_size)
+        self._appended = self._synced = last_number
+        
+        return replayed
+    
+    def start(self, model):
+        """Starts the background thread that syncs the log, and compacts it 
+        using the data store of the model given.
+        
+        :param rasblite.engine.ModelData model: model the log is kept for
+        """
+        self._model = model
+        self._thread = Thread(target=self.__run, name='rasblite-wal', daemon=True)
+        self._thread.start()
+    
+    def encode(self, method, path, message_body, bulk):
+        """Encodes a change as an entry of the log.
+        
+        :param str method: HTTP method of the change
+        :param str path: full url changed
+        :param message_body: data put into the model, if any
+        :param bool bulk: True if a list of items was posted in bulk
+        :rtype: str
+        """
+        return repr((method, path, message_body, bulk))
+    
+    def append(self, entries):
+        """Appends encoded entries to the log, to be synced by the background
+        thread. This must be called in the same order as the changes were 
+        made, so :class:`rasblite.engine.ModelData` calls it while the data 
+        store is still locked.
+        
+        :param list(str) entries: entries from :meth:`encode`
+        """
+        with self._condition:
+            for entry in entries:
+                self._appended += 1
+                self._pending.append('%d %s\n' % (self._appended, entry))
+            self._condition.notify_all()
+    
+    def position(self):
+        """Returns the number of the last entry appended.
+        
+        :rtype: int
+        """
+        return self._appended
+    
+    def wait(self, position=None):
+        """Blocks until every entry appended so far, or up to the position 
+        given, has been synced to disk.
+        
+        :param int position: number of the entry to wait for, from 
+            :meth:`position`, or None for the last entry appended
+        :raises OSError: if the log could not be written
+        """
+        with self._condition:
+            target = self._appended if position is None else position
+            while self._synced < target and self._error is None and not self._closed:
+                self._condition.wait()
+            
+            if self._error is not None:
+                raise self._error
+    
+    async def wait_async(self, position=None):
+        """Waits like :meth:`wait` but without blocking the event loop it is 
+        awaited on, so that coroutines waiting together are synced together.
+        
+        :param int position: number of the entry to wait for, from 
+            :meth:`position`, or None for the last entry appended
+        :raises OSError: if the log could not be written
+        """
+        with self._condition:
+            target = self._appended if position is None else position
+            if self._error is not None:
+                raise self._error
+            if self._synced >= target or self._closed:
+                return
+            
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((target, future))
+        
+        await future
+    
+    def close(self):
+        """Syncs any entries still waiting and finishes any compaction, then 
+        stops the background thread and closes the log.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        
+        if self._thread is not None:
+            self._thread.join()
+        if self._file is not None:
+            self._file.close()
+        
+        with self._condition:
+            self.__wake_waiters(None)
+    
+    def __run(self):
+        """Writes and syncs whatever entries are waiting, over and over, until
+        the log is closed.
+        """
+        while True:
+            with self._condition:
+                while not self._pending and self._compacted is None and \
+                      (self._compacting or not self._closed):
+                    self._condition.wait()
+                if not self._pending and self._compacted is None:
+                    return
+                
+                lines = self._pending
+                self._pending = list()
+                last_number = self._appended
+                compacted = self._compacted
+                self._compacted = None
+            
+            try:
+                if compacted is not None:
+                    self.__remove_compacted(compacted)
+                
+                if lines:
+                    self._file.write(''.join(lines).encode())
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            except OSError as error:
+                logger.error('Could not write to the write-ahead log: %s', error)
+                with self._condition:
+                    self._error = error
+                    self._condition.notify_all()
+                    self.__wake_waiters(None, error)
+                return
+            
+            with self._condition:
+                self._synced = last_number
+                self._condition.notify_all()
+                self.__wake_waiters(last_number)
+            
+            if not self._compacting and self._file.tell() >= self._compact_size:
+                self.__compact()
+    
+    def __wake_waiters(self, synced, error=None):
+        """Wakes the coroutines in :meth:`wait_async` waiting for entries up to
+        the number synced (or all of them if None), on their own event loops.
+        The caller must hold the condition.
+        """
+        waiting = list()
+        for target, future in self._waiters:
+            if synced is not None and target > synced:
+                waiting.append((target, future))
+                continue
+            try:
+                future.get_loop().call_soon_threadsafe(self.__settle, future, error)
+            except RuntimeError:
+                pass # The event loop has already been closed
+        self._waiters = waiting
+    
+    @staticmethod
+    def __settle(future, error):
+        """Finishes a future from :meth:`wait_async` unless it was cancelled."""
+        if future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+    
+    def __compact(self):
+        """Starts writing a snapshot of the data store in the background. No 
+        entry can be appended while the snapshot is taken, so it holds every
+        entry written to the log so far (and perhaps some still waiting, which
+        are skipped on replay). Once it is written, the log up to where it is 
+        now is removed.
+        """
+        logger.info('Compacting the write-ahead log into a snapshot')
+        self._compacting = True
+        offset = self._file.tell()
+        
+        def compacted(error):
+            with self._condition:
+                if error is None:
+                    self._compacted = offset
+                else:
+                    self._compacting = False
+                self._condition.notify_all()
+        
+        self._model.snapshot(os.path.join(self._directory, self.SNAPSHOT_FILE), compacted)
+    
+    def __remove_compacted(self, offset):
+        """Removes the entries up to the offset given, which are held by the 
+        snapshot, by copying those after it to a new log.
+        """
+        log_path = os.path.join(self._directory, self.LOG_FILE)
+        with open(log_path, 'rb') as log_file:
+            log_file.seek(offset)
+            remaining = log_file.read()
+        
+        with open(log_path + '.tmp', 'wb') as new_log_file:
+            new_log_file.write(remaining)
+            new_log_file.flush()
+            os.fsync(new_log_file.fileno())
+        os.replace(log_path + '.tmp', log_path)
+        
+        self._file.close()
+        self._file = open(log_path, 'ab')
+        self._compacting = False
+
+
 class RequestHandler(http.server.BaseHTTPRequestHandler):
     """The RequestHandler deals with requests from the HTTP interface and performs
     those requests on the :class:`rasblite.engine.Controller`. The RequestHandler
     also handles the responses back from the :class:`rasblite.engine.Controller`
     so that it can be displayed to the user.
+    
+    Connections are kept alive between requests (HTTP/1.1) until the client 
+    closes them or they are idle for longer than the timeout, unless keep 
+    alive is turned off because the server only serves one connection at a 
+    time (where an idle connection would hold up every other client).
     """
     
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True # Headers and body are written separately
+    timeout = 5
+    keep_alive = True
+    sync_changes = True # Otherwise the server waits for changes to be synced
+    CONTENT_TYPES = ('application/json', 'text/html') # In order of preference
+    json_encoder = DataEncoder(separators=(',', ':'))
+    stream_threshold = 1000
+    cache_size = 1024
+    response_cache = None
+    metrics = None
+    ADMIN_PATH = '/__rasblite/'
+    NDJSON_TYPE = 'application/x-ndjson' # Items posted in bulk, one per line
+    BATCH_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE')
+    # Status and message sent for each type of ModelError
+    MODEL_ERRORS = {'BaseError':       (404, 'Page not found'),
+                    'BadRequestError': (400, 'Invalid HTTP method or arguments'),
+                    'RolledBackError': (424, 'Rolled back as another operation failed')}
+    
+    
     @classmethod
     def set_controller(cls, controller):
         """Sets which :class:`rasblite.engine.Controller` to use by the RequestHandler
@@ -446,12 +3177,60 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         :param rasblite.engine.Controller controller: controller to use
         """
         cls.controller = controller
+        
+    @classmethod
+    def set_timeout(cls, timeout):
+        """Sets how long (in seconds) a kept alive connection can be idle for 
+        before the RequestHandler closes it.
+        
+        :param float timeout: idle timeout in seconds or None to wait forever
+        """
+        cls.timeout = timeout
+    
+    @classmethod
+    def set_keep_alive(cls, keep_alive):
+        """Sets whether connections are kept alive between requests. Otherwise
+        each response is sent with `Connection: close`.
+        
+        :param bool keep_alive: True to keep connections alive
+        """
+        cls.keep_alive = keep_alive
+        
+    @classmethod
+    def set_stream_threshold(cls, stream_threshold):
+        """Sets the length above which a list is streamed back to the user 
+        using chunked transfer encoding rather than being encoded as a whole.
+        
+        :param int stream_threshold: length of the list
+        """
+        cls.stream_threshold = stream_threshold
+        
+    @classmethod
+    def set_cache_size(cls, cache_size):
+        """Sets how many encoded GET responses are cached (see 
+        :class:`rasblite.engine.ResponseCache`), starting with an empty cache.
+        
+        :param int cache_size: number of responses or 0 to disable the cache
+        """
+        cls.cache_size = cache_size
+        cls.response_cache = ResponseCache(cache_size) if cache_size else None
+        
+    @classmethod
+    def set_metrics(cls, metrics):
+        """Sets the :class:`rasblite.engine.Metrics` that requests are recorded
+        in.
+        
+        :param rasblite.engine.Metrics metrics: metrics to record requests in
+        """
+        cls.metrics = metrics
     
     @classmethod
     def parse_response(self, raw_response):
         """Parses the response (HTTP body) into a Python collection, if applicable.
-        For example, if the HTTP response body contained `<\html><h1>['a','b']</h1></html>`
-        a Python :class:`list` would be returned with two elements, a and b.
+        For example, if the HTTP response body contained `["a","b"]` a Python 
+        :class:`list` would be returned with two elements, a and b. Responses 
+        rendered as html (such as `<html><h1>['a','b']</h1></html>`) are 
+        parsed too.
         
         This function is useful because in the future the response from the 
         :class:`rasblite.engine.RequestHandler` may change to add extra info
@@ -465,6 +3244,14 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         if not raw_response:
             return None
         
+        if not raw_response.startswith(b'<html>'):
+            try:
+                return json.loads(raw_response.decode('utf8'))
+            except ValueError:
+                # Such as an error page, which is neither JSON nor rendered data
+                logger.warning('RequestHandler could not retrieve an object from the response')
+                return None
+        
         matchObj = re.match(r'<html><h1>(.+)</h1></html>', raw_response.decode('utf8'))
         if matchObj:
             
@@ -476,10 +3263,10 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
             if parsed_response:
                 return parsed_response
             else:
-                print('ERROR: RequestHandler could not retrieve an object from the response.')
+                logger.warning('RequestHandler could not retrieve an object from the response')
                 return None
         else:
-            print('ERROR: RequestHandler response format has changed. The regex needs to be updated.')
+            logger.warning('RequestHandler response format has changed. The regex needs to be updated')
             return None
          
     def get_message_body(self):
@@ -495,51 +3282,244 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         content_type = self.headers.get('content-type', '')
         if content_type == 'application/json':
             return json.loads(raw_message_body.decode())
+        elif content_type == self.NDJSON_TYPE:
+            return [json.loads(line) for line in raw_message_body.decode().splitlines() 
+                    if line.strip()]
         else:
             return raw_message_body
     
     
     def do_GET(self):
-        """Serves a GET request."""
+        """Serves a GET request. Paths under :attr:`ADMIN_PATH` are reserved for
+        rasblite itself, such as `/__rasblite/metrics` for the metrics recorded
+        in the Prometheus text format.
+        """
 
-        if 'favicon.ico' in self.path:
+        if self.path.startswith(self.ADMIN_PATH):
+            self.__serve_admin('GET')
+        elif 'favicon.ico' in self.path:
             favicon_path = os.path.join(RESOURCE_DIR, 'favicon.ico')
             self.__send_response(ctype='image/x-icon', 
                                  content=open(favicon_path, 'rb').read())
         else:
-            controller = RequestHandler.controller
-            result = controller.perform_user_request('GET', self.path)
-            self.__handle_result(result)
+            self.__perform_user_request('GET')
+            
+    def do_HEAD(self):
+        """Serves a HEAD request. The headers are the same as for a GET request
+        except that a collection is never encoded. Instead, its number of items
+        is sent in the X-Item-Count header.
+        """
+        if 'favicon.ico' in self.path:
+            self.do_GET()
+        else:
+            self.__perform_user_request('HEAD')
             
     def do_POST(self):
-        """Serves a POST request.
+        """Serves a POST request. Items can be posted to a collection in bulk
+        as a JSON array or as newline delimited JSON (NDJSON), in which case 
+        only their count and indices are sent back.
         """
         message_body = self.get_message_body()
         
-        controller = RequestHandler.controller
-        result = controller.perform_user_request('POST', self.path, message_body)
-        self.__handle_result(result)
+        if self.path.startswith(self.ADMIN_PATH):
+            self.__serve_admin('POST', message_body)
+        else:
+            bulk = self.headers.get('content-type', '') == self.NDJSON_TYPE
+            self.__perform_user_request('POST', message_body, bulk)
         
     def do_PUT(self):
         """Serves a PUT request.
         """
         message_body = self.get_message_body()
         
-        controller = RequestHandler.controller
-        result = controller.perform_user_request('PUT', self.path, message_body)
-        self.__handle_result(result)
+        self.__perform_user_request('PUT', message_body)
         
     def do_DELETE(self):
         """Serves a DELETE request.
         """
-        controller = RequestHandler.controller
-        result = controller.perform_user_request('DELETE', self.path)
+        if self.path.startswith(self.ADMIN_PATH):
+            self.__serve_admin('DELETE')
+        else:
+            self.__perform_user_request('DELETE')
+        
+    def __serve_admin(self, method, message_body=None):
+        """Serves one of the pages reserved for rasblite itself:
+        
+        * GET `metrics` returns the metrics recorded in the Prometheus format
+        * POST `profile` starts profiling requests, taking `requests`, 
+          `seconds` and `sample` from the query string
+        * GET `profile` returns the stats of the requests profiled so far,
+          sorted by `sort` and limited to `limit` functions per route
+        * DELETE `profile` stops profiling requests and returns the stats
+        * GET `memory` returns the memory used by each collection as JSON
+        * POST `memory/snapshot` takes a tracemalloc snapshot and returns its
+          number as JSON
+        * DELETE `memory/snapshot` stops tracing memory allocations
+        * GET `memory/diff` returns the memory growth between the snapshots 
+          numbered `first` and `second`, limited to `limit` lines
+        * POST `batch` carries out a JSON array of operations in one go (see
+          :meth:`__serve_batch`), atomically if `atomic` is `true`
+        * POST `snapshot` starts writing a snapshot of the data store to the 
+          snapshot path the server was started with
+        """
+        page, _, query = self.path[len(self.ADMIN_PATH):].partition('?')
+        params = {name: values[-1] for name, values in urllib.parse.parse_qs(query).items()}
+        controller = self.controller
+        
+        try:
+            if method == 'GET' and page == 'metrics':
+                content = self.metrics.prometheus()
+                ctype = 'text/plain; version=0.0.4'
+            elif method == 'POST' and page == 'profile':
+                controller.start_profiling(int(params['requests']) if 'requests' in params else None,
+                                           float(params['seconds']) if 'seconds' in params else None,
+                                           float(params.get('sample', 1.0)))
+                content = 'Profiling started\n'
+                ctype = 'text/plain'
+            elif method in ('GET', 'DELETE') and page == 'profile':
+                if method == 'DELETE':
+                    controller.stop_profiling()
+                content = controller.profile_report(params.get('sort', 'cumulative'),
+                                                    int(params.get('limit', 30)))
+                ctype = 'text/plain'
+            elif method == 'GET' and page == 'memory':
+                content = json.dumps(controller.memory_usage())
+                ctype = 'application/json'
+            elif method == 'POST' and page == 'memory/snapshot':
+                content = json.dumps({'snapshot': controller.take_memory_snapshot()})
+                ctype = 'application/json'
+            elif method == 'DELETE' and page == 'memory/snapshot':
+                controller.stop_memory_tracing()
+                content = 'Memory tracing stopped\n'
+                ctype = 'text/plain'
+            elif method == 'POST' and page == 'snapshot':
+                controller.snapshot()
+                content = 'Snapshot started\n'
+                ctype = 'text/plain'
+            elif method == 'POST' and page == 'batch':
+                self.__serve_batch(message_body, params.get('atomic') in ('true', '1'))
+                return
+            elif method == 'GET' and page == 'memory/diff':
+                content = controller.compare_memory_snapshots(
+                    int(params['first']) if 'first' in params else None,
+                    int(params['second']) if 'second' in params else None,
+                    int(params.get('limit', 20)))
+                ctype = 'text/plain'
+            else:
+                self.__send_error(404, 'Unknown rasblite page: ' + method + ' ' + page)
+                return
+        except (ValueError, KeyError) as error:
+            self.__send_error(400, 'Invalid rasblite request: ' + str(error))
+            return
+        
+        self.__send_response(content.encode(), ctype=ctype)
+        
+    def __serve_batch(self, message_body, atomic):
+        """Carries out a batch of operations on the data store under a single 
+        lock (see :meth:`rasblite.engine.ModelData.action_batch`). Each 
+        operation is an object with a `method`, a `path` and, for a POST or 
+        PUT, a `body`. An array with the `status` and `body` of each operation 
+        is sent back as JSON. If an atomic batch is rolled back then the 
+        status of the response is that of the operation which failed.
+        
+        :raises ValueError: if the batch is not an array of operations
+        """
+        if isinstance(message_body, bytes):
+            message_body = json.loads(message_body.decode())
+        if not isinstance(message_body, list):
+            raise ValueError('Batch must be an array of operations')
+        
+        operations = list()
+        for operation in message_body:
+            if not isinstance(operation, dict) or \
+               operation.get('method') not in self.BATCH_METHODS or \
+               not isinstance(operation.get('path'), str):
+                raise ValueError('Operation needs a method and a path: ' + json.dumps(operation))
+            operations.append((operation['method'], operation['path'], operation.get('body')))
+        
+        results = self.controller.perform_batch(operations, atomic, 
+                                                encoder=self.__encode_batch_result,
+                                                sync=self.sync_changes)
+        
+        status = 200
+        responses = list()
+        for result in results:
+            if result is None:
+                result = ModelData.ModelError(error_type='BaseError')
+            
+            if isinstance(result, ModelData.ModelError):
+                error_status, message = self.MODEL_ERRORS.get(result.error_type, 
+                                                              self.MODEL_ERRORS['BaseError'])
+                if atomic and result.error_type != 'RolledBackError':
+                    status = error_status
+                responses.append('{"status":%d,"body":%s}' % (error_status, json.dumps(message)))
+            else:
+                responses.append('{"status":200,"body":%s}' % result)
+        
+        self.__send_response(('[' + ','.join(responses) + ']').encode(), 
+                             ctype='application/json', status=status)
+    
+    def __encode_batch_result(self, data, version):
+        """Encodes the data returned by an operation in a batch as JSON."""
+        return self.json_encoder.encode(data)
+    
+    def __perform_user_request(self, method, message_body=None, bulk=False):
+        """Passes the request on to the Controller, rendering any data returned
+        while the data store is still locked, and then handles the result. The
+        request is recorded in the metrics once the response has been sent.
+        """
+        started = time.perf_counter()
+        controller = self.controller
+        encoder = self.render_model_success
+        self.__route = controller.route(self.path)
+        result = None
+        
+        cache = self.response_cache
+        if method == 'GET' and cache is not None:
+            key = (self.__normalise_path(), self.negotiate_content_type())
+            cached = cache.get(key, controller.version(self.path))
+            if cached is not None:
+                result = self.__revalidate(cached)
+            else:
+                def encoder(data, version):
+                    rendered = self.render_model_success(data, version)
+                    if rendered[3] == 200 and isinstance(rendered[0], bytes):
+                        cache.put(key, version, rendered)
+                    return rendered
+        
+        if result is None:
+            result = controller.perform_user_request(method, self.path, message_body,
+                                                     encoder=encoder, bulk=bulk,
+                                                     sync=self.sync_changes, 
+                                                     route=self.__route)
         self.__handle_result(result)
         
+        self.metrics.observe_request(method, self.__route, self.__status, 
+                                     self.__bytes_out, time.perf_counter() - started)
+    
+    def __normalise_path(self):
+        """Returns the path requested without any trailing slash, so that the
+        same data is cached once however it is requested.
+        """
+        path, _, query = self.path.partition('?')
+        path = path.rstrip('/')
+        
+        return path + '?' + query if query else path
+    
+    def __revalidate(self, rendered):
+        """Returns the cached response, or 304 (Not Modified) if the user 
+        already has it.
+        """
+        content, ctype, headers, status = rendered
+        if self.__etag_matches(headers['ETag']):
+            return (None, ctype, headers, 304)
+        
+        return rendered
             
     def __handle_result(self, result):
         """Handles the result from the Controller. For example this could be
-        displaying the requested data or showing an error message.
+        displaying the requested data (already rendered by 
+        :meth:`render_model_success`) or showing an error message.
         """
         if result is None:
             result = ModelData.ModelError(error_type='BaseError')
@@ -547,27 +3527,106 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         if isinstance(result, ModelData.ModelError):
             self.handle_model_error(result)
         else:
-            self.handle_model_success(result)
+            content, ctype, headers, status = result
+            self.__send_response(content, ctype, status, headers)
             
         
     def __send_response(self, content=None, ctype='text/html', 
-                        status=200):
+                        status=200, headers=None):
         """Sends a HTTP response back to the user with a format defined by the
-        caller.
+        caller. String content is encoded first (and wrapped in html tags if it
+        is html) whereas bytes are sent as they are. No body is written if the 
+        content is None but the Content-Length is always sent (other than for
+        a HEAD request or a 304 response) so that the connection can be kept 
+        alive for the next request. Any other content is taken to be an 
+        iterable of bytes which is streamed back to the user using chunked 
+        transfer encoding.
         """
-        if 'text/html' in ctype:
+        if isinstance(content, str):
+            if 'text/html' in ctype:
                 content = '<html>' + content + '</html>'
-                content = content.encode()
+            content = content.encode()
 
         
-        self.send_response(200)
-        if content:
+        self.__status = status
+        self.__bytes_out = 0
+        self.__stream_cut = False
+        
+        self.send_response(status)
+        if not self.keep_alive:
+            self.send_header('Connection', 'close')
+        if content is not None or self.command == 'HEAD':
             self.send_header("Content-type", ctype)
-            self.send_header("Content-Length", len(content))
+        if headers:
+            for name, value in headers.items():
+                self.send_header(name, value)
+        
+        if content is None and (self.command == 'HEAD' or status == 304):
+            self.end_headers()
+        elif content is None or isinstance(content, bytes):
+            self.send_header("Content-Length", len(content) if content is not None else 0)
+            self.end_headers()
+            
+            if content is not None and self.command != 'HEAD':
+                self.wfile.write(content)
+                self.__bytes_out = len(content)
+        else:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            
+            if self.command != 'HEAD':
+                self.send_chunks(self.__frame_chunks(content))
+    
+    def __frame_chunks(self, content):
+        """Frames each (non-empty) part of the content as a chunk of a chunked
+        response, followed by the last (empty) chunk. If the content was cut 
+        short, the last chunk is left out and the connection closed, so that
+        the user can tell the response is incomplete. The length of the 
+        content is added to the metrics once it has all been framed, as the
+        request may have been recorded already.
+        """
+        bytes_out = 0
+        for chunk in content:
+            if chunk:
+                bytes_out += len(chunk)
+                yield b'%x\r\n' % len(chunk) + chunk + b'\r\n'
+        if self.__stream_cut:
+            self.close_connection = True
+        else:
+            yield b'0\r\n\r\n'
+        
+        self.metrics.add_bytes(self.command, self.__route, bytes_out)
+            
+    def send_chunks(self, chunks):
+        """Writes the chunks of a chunked response back to the user as they are
+        generated.
+        
+        :param chunks: chunks of the response, already framed
+        :type chunks: generator of bytes
+        """
+        for chunk in chunks:
+            self.wfile.write(chunk)
+            
+    def log_message(self, format, *args):
+        """Logs a message about the request (such as the request line and 
+        status of the response) at debug level rather than writing it to 
+        stderr, so nothing is formatted for each request unless it is wanted.
+        """
+        logger.debug('%s - ' + format, self.address_string(), *args)
             
-        self.end_headers()
+    def __send_error(self, status, message):
+        """Sends an error page back to the user, like 
+        :meth:`http.server.BaseHTTPRequestHandler.send_error`, but without 
+        closing the connection as the request itself was well formed.
+        """
+        self.log_error("code %d, message %s", status, message)
+        content = self.error_message_format % {
+            'code': status,
+            'message': html.escape(message, quote=False),
+            'explain': html.escape(self.responses[status][1], quote=False)}
         
-        self.wfile.write(content)
+        self.__send_response(content.encode('UTF-8', 'replace'), 
+                             ctype=self.error_content_type, status=status)
 
 
     def handle_model_error(self, model_error):
@@ -576,16 +3635,9 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         :param rasblite.engine.ModelData.ModelError model_error: error
             that was raised by the user's request.
         """
-        if model_error.error_type == 'BaseError':
-            self.send_error(404, "Page not found")
-            return
-        elif model_error.error_type == 'BadRequestError':
-            self.send_error(400, "Invalid HTTP method or arguments")
-            return
-            
-        
-        self.send_error(404, "Page not found")
-             
+        status, message = self.MODEL_ERRORS.get(model_error.error_type,
+                                                self.MODEL_ERRORS['BaseError'])
+        self.__send_error(status, message)
     
     def handle_model_success(self, data):
         """Handles the response back to the user after a successful request.
@@ -593,9 +3645,519 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         :param str,dict,list data: either the data requested or other data 
             relating to the user's request.
         """
-        self.__send_response('<h1>' + str(data) + '</h1>')
+        content, ctype, headers, status = self.render_model_success(data)
+        self.__send_response(content, ctype, status, headers)
+    
+    def render_model_success(self, data, version=None):
+        """Renders the data from a successful request into the content of the
+        response sent back to the user. The data is encoded as JSON unless the
+        user prefers html (see :meth:`negotiate_content_type`).
+        
+        Lists returned by a GET that are longer than the stream threshold are
+        not encoded straight away.
+        Instead they are encoded a chunk at a time as they are streamed back to
+        the user, without being copied (see :meth:`__stream_items`). Lists are
+        not encoded at all for a HEAD request.
+        
+        If the version of the data is given then it is sent as the ETag of a 
+        GET or HEAD response. Should that match the If-None-Match header sent
+        by the user then the data has not changed since they last requested 
+        it, so it is not encoded at all and 304 (Not Modified) is returned.
+        
+        :param str,dict,list data: either the data requested or other data 
+            relating to the user's request.
+        :param str version: version of the data requested
+        :returns: content of the response (bytes, a generator of bytes or None),
+            its content type, any extra headers and the HTTP status
+        :rtype: tuple(bytes, str, dict, int)
+        """
+        ctype = self.negotiate_content_type()
+        headers = dict()
+        
+        if version is not None and self.command in ('GET', 'HEAD'):
+            etag = '"' + version + '-' + ctype.split('/')[1] + '"'
+            headers['ETag'] = etag
+            if self.__etag_matches(etag):
+                return (None, ctype, headers, 304)
+        
+        if isinstance(data, (list, ModelData.ColumnarCollection)):
+            headers['X-Item-Count'] = len(data)
+            if self.command == 'HEAD':
+                return (None, ctype, headers, 200)
+        
+        if ctype == 'text/html':
+            content = '<html><h1>' + str(data) + '</h1></html>'
+        elif isinstance(data, (list, ModelData.ColumnarCollection)) and len(data) > self.stream_threshold and \
+             self.command == 'GET' and self.request_version == 'HTTP/1.1':
+            return (self.__stream_items(data, version), ctype, headers, 200)
+        else:
+            content = self.json_encoder.encode(data)
+        
+        return (content.encode(), ctype, headers, 200)
+    
+    def __stream_items(self, items, version):
+        """Encodes the items a chunk at a time once the data store has been 
+        unlocked, locking it again as a reader while each chunk is encoded. 
+        Should the data requested change before every chunk has been encoded,
+        the rest of the response is not sent (see :meth:`__frame_chunks`) 
+        rather than mixing the data from before and after the change. Items 
+        not from the data store (without a version) are encoded as they are.
+        """
+        chunks = self.json_encoder.iterencode_list(items)
+        if version is None:
+            yield from chunks
+            return
+        
+        while True:
+            chunk = self.controller.read_if_unchanged(self.path, version, next, chunks, None)
+            if isinstance(chunk, ModelData.ModelError):
+                logger.warning('Stopped streaming %s as the data changed', self.path)
+                self.__stream_cut = True
+                return
+            if chunk is None:
+                return
+            yield chunk
+    
+    def __etag_matches(self, etag):
+        """Returns True if the ETag matches one of those in the If-None-Match
+        header sent by the user.
+        """
+        if_none_match = self.headers.get('if-none-match')
+        if not if_none_match:
+            return False
+        
+        for other_etag in if_none_match.split(','):
+            other_etag = other_etag.strip()
+            if other_etag.startswith('W/'):
+                other_etag = other_etag[2:]
+            if other_etag == etag or other_etag == '*':
+                return True
+        
+        return False
+    
+    def negotiate_content_type(self):
+        """Returns the content type of the response that best matches the 
+        Accept header sent by the user. JSON is preferred unless html is 
+        accepted with a higher quality, as it is by web browsers.
+        
+        :returns: `application/json` or `text/html`
+        :rtype: str
+        """
+        accept = self.headers.get('accept')
+        if not accept:
+            return 'application/json'
+        
+        qualities = dict()
+        for ctype in self.CONTENT_TYPES:
+            major_type = ctype.split('/')[0] + '/*'
+            
+            specificity, quality = -1, 0.0
+            for media_range in accept.split(','):
+                media_type, _, params = media_range.partition(';')
+                media_type = media_type.strip().lower()
+                
+                if media_type == ctype:
+                    match = 2
+                elif media_type == major_type:
+                    match = 1
+                elif media_type == '*/*':
+                    match = 0
+                else:
+                    continue
+                
+                if match > specificity:
+                    specificity, quality = match, 1.0
+                    for param in params.split(';'):
+                        name, _, value = param.partition('=')
+                        if name.strip() == 'q':
+                            try:
+                                quality = float(value)
+                            except ValueError:
+                                quality = 0.0
+            qualities[ctype] = quality
+        
+        return max(self.CONTENT_TYPES, key=lambda ctype: qualities[ctype])
+        
+    
+class AsyncioRequestHandler(RequestHandler):
+    """The AsyncioRequestHandler serves requests read by the 
+    :class:`rasblite.engine.AsyncioHTTPServer` using exactly the same logic as
+    the :class:`rasblite.engine.RequestHandler`. Rather than reading from its 
+    own socket, it is given the request that has already been read from an 
+    asyncio stream. As it is run on a worker thread rather than the event 
+    loop, its response is kept in a buffer for the server to write back to 
+    the stream. The server only does so once any change made has been synced
+    to the write-ahead log, which it waits for on the event loop rather than
+    on the worker thread.
+    """
+    
+    sync_changes = False
+    
+    class Headers(dict):
+        """Request headers keyed by their lower case name so that they can be
+        looked up case-insensitively, like :class:`http.client.HTTPMessage`.
+        """
+        def get(self, name, default=None):
+            return super().get(name.lower(), default)
+        
+        def __getitem__(self, name):
+            return super().__getitem__(name.lower())
+        
+        def __contains__(self, name):
+            return super().__contains__(name.lower())
+    
+    class StreamFile(object):
+        """Minimal writable file object that buffers what is written until the
+        event loop takes it to write to the asyncio stream.
+        """
+        def __init__(self):
+            self.buffer = list()
+            
+        def write(self, data):
+            self.buffer.append(bytes(data))
+            return len(data)
+        
+        def flush(self):
+            pass
+        
+        def take(self):
+            """Returns everything written since the last call, emptying the 
+            buffer.
+            
+            :rtype: bytes
+            """
+            data = b''.join(self.buffer)
+            self.buffer.clear()
+            return data
+    
+    def __init__(self, client_address, server):
+        """Creates a handler for the requests on one connection. Unlike the
+        :class:`rasblite.engine.RequestHandler` nothing is served until 
+        :meth:`handle_request` is called.
+        
+        :param tuple client_address: address of the client
+        :param rasblite.engine.AsyncioHTTPServer server: server the request
+            was received by
+        """
+        self.client_address = client_address
+        self.server = server
+        self.wfile = AsyncioRequestHandler.StreamFile()
+        self.close_connection = True
+        self.command = None
+        self.request_version = self.protocol_version
+        self.requestline = ''
+        self.pending_chunks = None
+        self.log_position = None
+        
+    def handle_request(self, command, path, request_version, headers, message_body):
+        """Serves a single request that has already been read from the stream.
+        This is called on a worker thread, as it may wait for the data store.
+        
+        :param str command: HTTP method used such as GET
+        :param str path: path requested by the user
+        :param str request_version: HTTP version of the request
+        :param rasblite.engine.AsyncioRequestHandler.Headers headers: request
+            headers
+        :param bytes message_body: HTTP body of the request
+        """
+        self.command = command
+        self.path = path
+        self.request_version = request_version
+        self.requestline = '%s %s %s' % (command, path, request_version)
+        self.headers = headers
+        self.rfile = io.BytesIO(message_body)
+        
+        connection = headers.get('connection', '').lower()
+        if request_version == 'HTTP/1.1':
+            self.close_connection = (connection == 'close')
+        else:
+            self.close_connection = (connection != 'keep-alive')
+        
+        self.pending_chunks = None
+        self.log_position = None
+        
+        method = getattr(self, 'do_' + command, None)
+        if method is None:
+            self.send_error(501, "Unsupported method (%r)" % command)
+        else:
+            method()
+            if command not in ('GET', 'HEAD'):
+                self.log_position = self.controller.log_position()
+            
+    def send_chunks(self, chunks):
+        """Keeps hold of the chunks of a chunked response rather than writing 
+        them straight away, so that the :class:`rasblite.engine.AsyncioHTTPServer`
+        can wait for each one to be sent before generating the next (on a 
+        worker thread).
+        
+        :param chunks: chunks of the response, already framed
+        :type chunks: generator of bytes
+        """
+        self.pending_chunks = chunks
+            
+
+class AsyncioHTTPServer(object):
+    """The AsyncioHTTPServer is an alternative to :class:`http.server.HTTPServer`
+    that serves every connection from a single asyncio event loop, so that 
+    idle keep-alive connections cost a coroutine rather than a thread. Each
+    request read is served on a pool of worker threads, so that a request 
+    waiting for the data store lock (or for its change to be synced) does not
+    hold up the event loop. It offers the same serve_forever, shutdown and 
+    server_close methods so that the :class:`rasblite.engine.Controller` can 
+    run either server in the same way.
+    """
+    
+    MAX_LINE = 65536
+    
+    def __init__(self, server_address, RequestHandlerClass, workers=None):
+        """Creates the server and binds it to the server address.
+        
+        :param tuple server_address: address (host, port) to bind to
+        :param RequestHandlerClass: :class:`rasblite.engine.AsyncioRequestHandler`
+            (or a subclass) used for each connection
+        :param int workers: maximum number of requests served at the same 
+            time, or None for the default size of a 
+            :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+        self.server_address = server_address
+        self.RequestHandlerClass = RequestHandlerClass
+        
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(server_address)
+        self.socket.listen(socket.SOMAXCONN)
+        
+        self.__loop = asyncio.new_event_loop()
+        self.__executor = ThreadPoolExecutor(max_workers=workers, 
+                                             thread_name_prefix='rasblite-asyncio')
+        self.__stop = None
+        self.__shutdown_request = False
+        self.__connections = set()
+        self.__is_shut_down = Event()
+        self.__is_shut_down.set()
+        
+    def serve_forever(self):
+        """Runs the event loop on the calling thread until :meth:`shutdown` is
+        called.
+        """
+        self.__is_shut_down.clear()
+        try:
+            self.__loop.run_until_complete(self.__serve())
+        finally:
+            self.__shutdown_request = False
+            self.__is_shut_down.set()
+    
+    def shutdown(self):
+        """Stops the serve_forever loop and waits until it has finished. This
+        must be called from another thread to serve_forever.
+        """
+        self.__shutdown_request = True
+        self.__loop.call_soon_threadsafe(self.__wake)
+        self.__is_shut_down.wait()
+    
+    def server_close(self):
+        """Closes the listening socket and the event loop, then waits for the
+        workers to finish.
+        """
+        self.socket.close()
+        self.__loop.close()
+        self.__executor.shutdown(wait=True)
+    
+    def __wake(self):
+        """Wakes the serve_forever loop so that it notices a shutdown request."""
+        if self.__stop is not None:
+            self.__stop.set()
+        
+    async def __serve(self):
+        """Accepts connections until asked to stop, then closes any remaining
+        (idle) connections.
+        """
+        self.__stop = asyncio.Event()
+        server = await asyncio.start_server(self.__handle_connection, 
+                                            sock=self.socket, 
+                                            limit=self.MAX_LINE)
+        async with server:
+            if not self.__shutdown_request:
+                await self.__stop.wait()
+            
+            server.close()
+            for connection in list(self.__connections):
+                connection.cancel()
+            if self.__connections:
+                await asyncio.wait(list(self.__connections))
+    
+    async def __handle_connection(self, reader, writer):
+        """Serves every request sent on a single connection until either side
+        closes it.
+        """
+        connection = asyncio.current_task()
+        self.__connections.add(connection)
+        
+        loop = asyncio.get_running_loop()
+        handler = self.RequestHandlerClass(writer.get_extra_info('peername'), self)
+        if handler.disable_nagle_algorithm:
+            writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, 
+                                                       socket.TCP_NODELAY, True)
+        timeout = handler.timeout
+        try:
+            while True:
+                request = await asyncio.wait_for(self.__read_request(reader), timeout)
+                if request is None:
+                    break
+                
+                await loop.run_in_executor(self.__executor, handler.handle_request, *request)
+                if handler.log_position is not None:
+                    await handler.controller.wait_for_log(handler.log_position)
+                writer.write(handler.wfile.take())
+                await writer.drain()
+                
+                chunks = handler.pending_chunks
+                while chunks is not None:
+                    chunk = await loop.run_in_executor(self.__executor, next, chunks, None)
+                    if chunk is None:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+                
+                if handler.close_connection:
+                    break
+        except (asyncio.TimeoutError, asyncio.CancelledError, 
+                asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except OSError:
+            # The change could not be synced (and has been logged), so it is 
+            # not answered, as with the http.server engine
+            pass
+        except ValueError:
+            # The request line or a header was too long or badly formed
+            handler.close_connection = True
+            handler.send_error(400, "Bad request")
+            writer.write(handler.wfile.take())
+        finally:
+            self.__connections.discard(connection)
+            writer.close()
+            
+    async def __read_request(self, reader):
+        """Reads a single request from the stream, returning the arguments for
+        :meth:`rasblite.engine.AsyncioRequestHandler.handle_request` or None
+        if the client closed the connection.
+        """
+        request_line = await reader.readline()
+        while request_line in (b'\r\n', b'\n'):
+            # Ignore blank lines between requests as RFC 7230 allows
+            request_line = await reader.readline()
+        if not request_line:
+            return None
+        
+        command, path, request_version = request_line.decode('iso-8859-1').split()
+        if not request_version.startswith('HTTP/'):
+            raise ValueError('Bad request version ' + request_version)
+        
+        headers = AsyncioRequestHandler.Headers()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('iso-8859-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        
+        content_len = int(headers.get('content-length', 0))
+        message_body = await reader.readexactly(content_len) if content_len else b''
+        
+        return (command, path, request_version, headers, message_body)
+    
+
+class ConnectionTrackingMixIn(object):
+    """The ConnectionTrackingMixIn keeps track of the connections a threaded
+    :class:`http.server.HTTPServer` is serving so that they can be closed 
+    when the server is, rather than waiting for idle keep-alive connections 
+    to time out before the threads serving them finish.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        """Creates the server with no connections being served."""
+        self.__connections = set()
+        self.__connections_lock = Lock()
+        super().__init__(*args, **kwargs)
+    
+    def finish_request(self, request, client_address):
+        """Serves the connection, tracking it until it has been served."""
+        with self.__connections_lock:
+            self.__connections.add(request)
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            with self.__connections_lock:
+                self.__connections.discard(request)
+    
+    def close_connections(self):
+        """Shuts down every connection still being served, which wakes any 
+        thread waiting for the next request on it.
+        """
+        with self.__connections_lock:
+            connections = list(self.__connections)
+        
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass # Already closed by the client
+
+
+class ThreadingHTTPServer(ConnectionTrackingMixIn, http.server.ThreadingHTTPServer):
+    """The ThreadingHTTPServer is a :class:`http.server.ThreadingHTTPServer`
+    that closes the connections it is serving when it is closed.
+    """
+    
+    def server_close(self):
+        """Closes the listening socket and every open connection, then waits
+        for the threads serving them to finish.
+        """
+        self.close_connections()
+        super().server_close()
+
+
+class WorkerPoolHTTPServer(ConnectionTrackingMixIn, http.server.HTTPServer):
+    """The WorkerPoolHTTPServer is a :class:`http.server.HTTPServer` that serves
+    each connection on one of a bounded pool of worker threads. Unlike 
+    :class:`http.server.ThreadingHTTPServer` the number of threads does not
+    grow with the number of clients.
+    """
+    
+    def __init__(self, server_address, RequestHandlerClass, workers):
+        """Creates the server and its pool of worker threads.
         
+        :param tuple server_address: address (host, port) to bind to
+        :param RequestHandlerClass: request handler class used for each request
+        :param int workers: maximum number of requests served at the same time
+        """
+        super().__init__(server_address, RequestHandlerClass)
+        self.__executor = ThreadPoolExecutor(max_workers=workers, 
+                                             thread_name_prefix='rasblite-worker')
+    
+    def process_request(self, request, client_address):
+        """Hands the request to the worker pool rather than serving it on the
+        thread that accepted it.
+        """
+        self.__executor.submit(self.__process_request_worker, request, client_address)
+    
+    def __process_request_worker(self, request, client_address):
+        """Serves a single request on a worker thread."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
     
+    def server_close(self):
+        """Closes the listening socket and every open connection, then waits 
+        for the workers to finish.
+        """
+        super().server_close()
+        self.close_connections()
+        self.__executor.shutdown(wait=True)
+
 
 class Controller(object):
     """The rasblite Controller is the public-facing entry point to external scripts.
@@ -605,36 +4167,140 @@ class Controller(object):
     :class:`rasblite.engine.ModelParser`"""
     
     STARTING_DATA_MODES = ModelParser.STARTING_DATA_MODES # See ModelParser for info
+    ENGINES = ('http.server', 'asyncio')
+    STORAGES = ('dict', 'columnar', 'records')
+    SERIAL_IDLE_TIMEOUT = 0.5 # Longest idle time of a connection when one request is served at a time
     
-    def __init__(self, model, data, port):
+    def __init__(self, model, data, port, workers=None, engine='http.server', 
+                 idle_timeout=RequestHandler.timeout, 
+                 stream_threshold=RequestHandler.stream_threshold,
+                 cache_size=RequestHandler.cache_size, trace_size=0,
+                 state_dir=None, compact_size=WriteAheadLog.compact_size,
+                 snapshot_path=None, snapshot_interval=None, validate_workers=None,
+                 storage='dict'):
         """Initialises the Controller with the data model structure, starting data 
         and the port to stand up the HTTP server on.
         
         :param str model: format of the data model that will be built 
-        :param str data: starting data to fill the model with (or a special string 
-            that tells the Controller how to create the starting data
+        :param data: starting data to fill the model with (or a special string 
+            that tells the Controller how to create the starting data, or the
+            path of a file to read it from, see 
+            :meth:`rasblite.engine.ModelParser.parse`)
         :param int port: port to use for the HTTP server
+        :param int workers: how requests are served concurrently. None (the 
+            default) serves one request at a time, 0 serves each connection on
+            its own thread and any other number serves connections on a bounded
+            pool of that many worker threads
+        :param str engine: HTTP engine used to serve requests. Either 
+            `http.server` (the default) or `asyncio`, which serves every 
+            connection from a single event loop and serves the requests read
+            on a pool of that many worker threads (or a default sized pool)
+        :param float idle_timeout: seconds a kept alive connection can be idle
+            for before it is closed, or None to wait forever. When requests 
+            are served one at a time (without workers or the asyncio engine)
+            this is capped at `SERIAL_IDLE_TIMEOUT`, as an idle connection 
+            holds up every other client
+        :param int stream_threshold: length above which a list is streamed back
+            to the user with chunked transfer encoding
+        :param int cache_size: number of encoded GET responses to cache, or 0
+            to disable the response cache
+        :param int trace_size: number of recent debug log records to keep in 
+            memory while the server is running (see :meth:`trace`), or 0 to 
+            keep none
+        :param str state_dir: directory to keep a write-ahead log of every 
+            change in, so that the data store survives a restart (see 
+            :class:`rasblite.engine.WriteAheadLog`), or None to keep nothing
+        :param int compact_size: bytes the write-ahead log can grow to before
+            it is compacted into a snapshot of the data store
+        :param str snapshot_path: path to write snapshots of the data store to
+            on request (such as a POST to `/__rasblite/snapshot`) or None
+        :param float snapshot_interval: seconds between the snapshots written
+            to the snapshot path while the server is running, or None to only
+            write them on request
+        :param int validate_workers: number of processes to verify large 
+            starting data across, or None to verify it in this process (see 
+            :class:`rasblite.engine.ModelParser`)
+        :param str storage: how collections are held in the data store. Either
+            `dict` (the default) for a dictionary per item or `columnar` to 
+            hold collections whose items only have leaf fields as columns (see
+            :meth:`rasblite.engine.ModelData.use_columnar_storage`) or 
+            `records` to hold every item as an instance of a record class 
+            generated from the model (see 
+            :meth:`rasblite.engine.ModelData.use_record_storage`)
         """
+        if engine not in self.ENGINES:
+            raise ValueError('Unknown engine ' + repr(engine) + '. Expected one of: ' + ', '.join(self.ENGINES))
+        if storage not in self.STORAGES:
+            raise ValueError('Unknown storage ' + repr(storage) + '. Expected one of: ' + ', '.join(self.STORAGES))
         
-        self._raw_model       = model
-        self._raw_data        = data
-        self._port            = port
-        self._server_address  = None
+        self._raw_model        = model
+        self._raw_data         = data
+        self._port             = port
+        self._workers          = workers
+        self._engine           = engine
+        self._idle_timeout     = idle_timeout
+        self._stream_threshold = stream_threshold
+        self._cache_size       = cache_size
+        self._trace_size       = trace_size
+        self._state_dir        = state_dir
+        self._compact_size     = compact_size
+        self._snapshot_path    = snapshot_path
+        self._snapshot_interval = snapshot_interval
+        self._validate_workers = validate_workers
+        self._storage          = storage
+        self._server_address   = None
         
-        self.__server_thread  = None
-        self.__server         = None
-        self.__model          = None
+        self.__server_thread   = None
+        self.__server          = None
+        self.__model           = None
+        self.__trace_handler   = None
+        self.__propagating_handler = None
+        self.__log_level       = None
+        self.__log_propagate   = None
+        self.__metrics         = Metrics()
+        self.__profiler        = RequestProfiler()
+        self.__memory_tracker  = MemoryTracker()
+        self.__write_ahead_log = None
+        self.__snapshot_thread = None
+        self.__snapshot_stop   = Event()
         
     def start(self):
         """Parses the model and fills it with starting data passed in at initialisation
         before standing up the HTTP server."""
+        if self._trace_size:
+            self.__start_trace()
         self.__parse_model()
         self.__start_server()
+        if self._snapshot_path is not None and self._snapshot_interval:
+            self.__start_snapshots()
         
     def stop(self):
         """Stops the HTTP server, tearing it down and freeing any associated
         resources."""
         self.__stop_server()
+        if self.__snapshot_thread is not None:
+            self.__stop_snapshots()
+        if self.__write_ahead_log is not None:
+            self.__model.set_journal(None)
+            self.__write_ahead_log.close()
+            self.__write_ahead_log = None
+        self.__profiler.stop()
+        self.__memory_tracker.stop()
+        if self.__trace_handler is not None:
+            self.__stop_trace()
+    
+    def trace(self):
+        """Returns the most recent debug log records (such as each request 
+        served) if the Controller was created with a trace size, otherwise an
+        empty list.
+        
+        :returns: formatted log records, oldest first
+        :rtype: list(str)
+        """
+        if self.__trace_handler is None:
+            return []
+        
+        return self.__trace_handler.getvalue()
         
     def is_server_running(self):
         """Returns True if the server and server thread is currently running, 
@@ -647,8 +4313,8 @@ class Controller(object):
     
     def parse_response(self, raw_response):
         """Parses the response (HTTP body) into a Python collection, if applicable.
-        For example, if the HTTP response body contained `<\html><h1>['a','b']</h1></html>`
-        a Python :class:`list` would be returned with two elements, a and b.
+        For example, if the HTTP response body contained `["a","b"]` a Python 
+        :class:`list` would be returned with two elements, a and b.
         
         This function is useful because in the future the response from the 
         :class:`rasblite.engine.RequestHandler` may change to add extra info
@@ -660,7 +4326,8 @@ class Controller(object):
         """
         return self.__server.RequestHandlerClass.parse_response(raw_response)
     
-    def perform_user_request(self, method, path, message_body=None):
+    def perform_user_request(self, method, path, message_body=None, encoder=None, bulk=False, 
+                             sync=True, route=None):
         """Carries out the user's instruction depending on the method (GET,POST,
         PUT or DELETE) and returns either the data requested or a 
         :class:`rasblite.engine.ModelData.ModelError` if there was an issue.
@@ -669,23 +4336,253 @@ class Controller(object):
         :param str path: full url requested by the user
         :param str message_body: data from the HTTP body (such as data to be put
             into the model)
+        :param function encoder: optional function applied to the data requested
+            while the data store is still locked
+        :param bool bulk: True if the message body of a POST is a list of items
+            to add to the collection (see 
+            :meth:`rasblite.engine.ModelData.action_path`)
+        :param bool sync: False to return without waiting for a change to be 
+            synced to the write-ahead log, leaving the caller to wait with 
+            :meth:`wait_for_log`
+        :param str route: route the path matches, if the caller has already 
+            looked it up with :meth:`route`, so that it is not matched again
         :returns: data requested by the user or a 
             :class:`rasblite.engine.ModelData.ModelError`
         :rtype: str, dict, list or :class:`rasblite.engine.ModelData.ModelError`
         """
-        return self.__model.action_path(method, path, message_body)
+        if route is None:
+            route = self.__model.route(path)
+        started = time.perf_counter()
+        result = self.__profiler.call(method, route, self.__model.action_path, 
+                                      method, path, message_body, encoder, bulk)
+        if self.__write_ahead_log is not None and sync and method not in ('GET', 'HEAD'):
+            self.__write_ahead_log.wait()
+        self.__metrics.observe_model(method, route, time.perf_counter() - started)
+        
+        return result
+    
+    def snapshot(self, path=None, callback=None):
+        """Writes a snapshot of the whole data store to a file in the 
+        background while the server carries on serving requests (see 
+        :meth:`rasblite.engine.ModelData.snapshot`). The snapshot can be used 
+        as the starting data next time.
+        
+        :param str path: path of the file to write or None for the snapshot 
+            path given at initialisation
+        :param function callback: optional function called with None, or the
+            error if the snapshot could not be written, once it is done
+        :raises ValueError: if no path was given
+        :returns: background thread that finishes the snapshot
+        :rtype: :class:`threading.Thread`
+        """
+        path = path or self._snapshot_path
+        if path is None:
+            raise ValueError('No snapshot path given')
+        
+        return self.__model.snapshot(path, callback)
+    
+    def perform_batch(self, operations, atomic=False, encoder=None, sync=True):
+        """Carries out a batch of operations in order while holding the data 
+        store lock once (see :meth:`rasblite.engine.ModelData.action_batch`). 
+        The same can be done with a POST to `/__rasblite/batch`.
+        
+        :param list operations: method, path and message body of each operation
+        :param bool atomic: True to undo the whole batch if any operation fails
+        :param function encoder: optional function applied to the data 
+            returned by each operation while the data store is still locked
+        :param bool sync: False to return without waiting for the changes to 
+            be synced to the write-ahead log, leaving the caller to wait with 
+            :meth:`wait_for_log`
+        :returns: data or :class:`rasblite.engine.ModelData.ModelError` 
+            returned by each operation
+        :rtype: list
+        """
+        results = self.__model.action_batch(operations, atomic, encoder)
+        if self.__write_ahead_log is not None and sync:
+            self.__write_ahead_log.wait()
+        
+        return results
+    
+    def log_position(self):
+        """Returns the number of the last change appended to the write-ahead 
+        log, or None if no state directory was given.
+        
+        :rtype: int
+        """
+        if self.__write_ahead_log is None:
+            return None
+        
+        return self.__write_ahead_log.position()
+    
+    async def wait_for_log(self, position):
+        """Waits, without blocking the event loop, until the changes up to the
+        position given have been synced to the write-ahead log (see 
+        :meth:`rasblite.engine.WriteAheadLog.wait_async`).
+        
+        :param int position: position from :meth:`log_position`
+        :raises OSError: if the log could not be written
+        """
+        await self.__write_ahead_log.wait_async(position)
+    
+    def start_profiling(self, requests=None, seconds=None, sample_rate=1.0, output=None):
+        """Starts running cProfile around :meth:`perform_user_request` for the
+        number of requests or seconds given, whichever comes first, or until 
+        :meth:`stop_profiling` is called. The same can be done with a POST to 
+        `/__rasblite/profile`. Any stats from before are discarded.
+        
+        :param int requests: number of requests to profile or None for no limit
+        :param float seconds: seconds to profile for or None for no limit
+        :param float sample_rate: fraction of the requests to profile
+        :param str output: path of a file to write the stats to once 
+            profiling stops
+        """
+        if sample_rate <= 0 or sample_rate > 1:
+            raise ValueError('Sample rate must be greater than 0 and at most 1: ' + str(sample_rate))
+        
+        self.__profiler.start(requests, seconds, sample_rate, output)
+    
+    def stop_profiling(self):
+        """Stops profiling requests (see :meth:`start_profiling`), writing the 
+        stats to the output file if one was given. 
+        """
+        self.__profiler.stop()
+    
+    def is_profiling(self):
+        """Returns True if requests are being profiled.
+        
+        :rtype: bool
+        """
+        return self.__profiler.is_active()
+    
+    def profile_report(self, sort='cumulative', limit=30):
+        """Returns the cProfile stats of the requests profiled so far for each 
+        HTTP method and route within the model, as printed by 
+        :class:`pstats.Stats`. The same is returned by a GET on 
+        `/__rasblite/profile`.
+        
+        :param str sort: key to sort the functions by, such as `cumulative` or
+            `tottime`
+        :param int limit: number of functions printed for each route
+        :rtype: str
+        """
+        return self.__profiler.report(sort, limit)
+    
+    def memory_usage(self):
+        """Returns the approximate memory used by the collections at each 
+        route within the model, kept up to date as the data is written to (see
+        :meth:`rasblite.engine.ModelData.memory_usage`). The same is returned 
+        by a GET on `/__rasblite/memory`.
+        
+        :returns: `collections`, `items` and `bytes` keyed by route
+        :rtype: dict
+        """
+        return self.__model.memory_usage()
+    
+    def take_memory_snapshot(self):
+        """Takes a tracemalloc snapshot of the memory allocated by the server, 
+        starting tracing with the first one. The same can be done with a POST 
+        to `/__rasblite/memory/snapshot`.
+        
+        :returns: number of the snapshot, for :meth:`compare_memory_snapshots`
+        :rtype: int
+        """
+        return self.__memory_tracker.take_snapshot()
+    
+    def compare_memory_snapshots(self, first=None, second=None, limit=20):
+        """Returns the lines of code that allocated the most memory between 
+        two snapshots taken by :meth:`take_memory_snapshot`, by default the 
+        last two. The same is returned by a GET on `/__rasblite/memory/diff`.
+        
+        :param int first: number of the earlier snapshot
+        :param int second: number of the later snapshot
+        :param int limit: number of lines of code reported
+        :raises ValueError: if either snapshot is no longer kept
+        :rtype: str
+        """
+        return self.__memory_tracker.compare(first, second, limit)
+    
+    def stop_memory_tracing(self):
+        """Stops tracing memory allocations and discards the snapshots taken.
+        """
+        self.__memory_tracker.stop()
+    
+    def server_port(self):
+        """Returns the port the HTTP server is listening on. This is useful if
+        the Controller was given port 0 so that any free port would be used.
+        
+        :returns: port of the running HTTP server
+        :rtype: int
+        """
+        return self.__server.socket.getsockname()[1]
+    
+    def route(self, path):
+        """Returns the route within the model structure that the path matches
+        (see :meth:`rasblite.engine.ModelData.route`).
+        
+        :param str path: full url requested by the user
+        :returns: route matched or None if the path does not match the model
+        :rtype: str
+        """
+        return self.__model.route(path)
+    
+    def metrics(self):
+        """Returns the request counts, status codes, bytes sent and latency 
+        histograms recorded for each HTTP method and route of the model (see 
+        :meth:`rasblite.engine.Metrics.snapshot`). The same metrics are served
+        in the Prometheus text format at `/__rasblite/metrics`.
+        
+        :returns: dictionary with `requests` and `model` keys
+        :rtype: dict
+        """
+        return self.__metrics.snapshot()
+    
+    def version(self, path):
+        """Returns the version of the data at the path requested (see 
+        :meth:`rasblite.engine.ModelData.version`).
+        
+        :param str path: full url of the data
+        :returns: opaque version string or None if the path is not valid
+        :rtype: str
+        """
+        return self.__model.version(path)
+    
+    def read_if_unchanged(self, path, version, function, *args):
+        """Calls the function while the data store is locked as a reader, as 
+        long as the data at the path has not changed (see 
+        :meth:`rasblite.engine.ModelData.read_if_unchanged`).
+        
+        :param str path: full url of the data
+        :param str version: version of the data when it was returned
+        :param function function: function to call, with any further 
+            arguments given
+        :returns: result of the function or a ModelError if the data has 
+            changed
+        :rtype: object or :class:`rasblite.engine.ModelData.ModelError`
+        """
+        return self.__model.read_if_unchanged(path, version, function, *args)
+    
+    def cache_stats(self):
+        """Returns the hit and miss counts of the response cache along with 
+        its size, or None if the response cache is disabled.
+        
+        :returns: dictionary with `hits`, `misses`, `size` and `max_size` keys
+        :rtype: dict
+        """
+        cache = self.__server.RequestHandlerClass.response_cache
+        
+        return cache.stats() if cache is not None else None
         
     def __server_run_thread(self):
         """This method directly runs the HTTP server which is a blocking call and
         therefore is ran within a server thread.
         """
         try:
-            print('Starting Server')
+            logger.info('Starting Server')
             self.__server.serve_forever()
             
-            print('Confirmed, Server shutdown')
+            logger.info('Confirmed, Server shutdown')
         except:
-            print('ERROR: Failed to start server')
+            logger.exception('Failed to start server')
         finally:
             self.__server.server_close()
     
@@ -694,11 +4591,30 @@ class Controller(object):
         then runs the thred which in turn stands up the HTTP server.
         """
         self._server_address = ('', self._port)
-        self.__server = http.server.HTTPServer(self._server_address, RequestHandler)
+        if self._engine == 'asyncio':
+            self.__server = AsyncioHTTPServer(self._server_address, AsyncioRequestHandler, 
+                                              self._workers or None)
+        elif self._workers is None:
+            self.__server = http.server.HTTPServer(self._server_address, RequestHandler)
+        elif self._workers == 0:
+            self.__server = ThreadingHTTPServer(self._server_address, RequestHandler)
+        else:
+            self.__server = WorkerPoolHTTPServer(self._server_address, RequestHandler, self._workers)
         #Set ourselves onto the server so it can callback to us
         self.__server.RequestHandlerClass.set_controller(self)
+        idle_timeout = self._idle_timeout
+        if self._engine != 'asyncio' and self._workers is None:
+            # An idle connection holds up every other client of a server that 
+            # only serves one connection at a time, so it is only kept briefly
+            idle_timeout = min(idle_timeout if idle_timeout is not None else self.SERIAL_IDLE_TIMEOUT, 
+                               self.SERIAL_IDLE_TIMEOUT)
+        self.__server.RequestHandlerClass.set_timeout(idle_timeout)
+        self.__server.RequestHandlerClass.set_keep_alive(True)
+        self.__server.RequestHandlerClass.set_stream_threshold(self._stream_threshold)
+        self.__server.RequestHandlerClass.set_cache_size(self._cache_size)
+        self.__server.RequestHandlerClass.set_metrics(self.__metrics)
         sa = self.__server.socket.getsockname()
-        print("Serving HTTP on", sa[0], "port", sa[1], "...")
+        logger.info('Serving HTTP on %s port %s ...', sa[0], sa[1])
         
         self.__server_thread = Thread(target=self.__server_run_thread)
         self.__server_thread.start()
@@ -706,18 +4622,77 @@ class Controller(object):
     def __stop_server(self):
         """Shutsdown the HTTP server and then waits for the server thread to close
         before returning."""
-        print('Shutting down server...')
+        logger.info('Shutting down server...')
         self.__server.shutdown()
         self.__server_thread.join()
-        print('Server shutdown')
+        logger.info('Server shutdown')
 
             
+    def __start_snapshots(self):
+        """Starts a thread that writes a snapshot to the snapshot path every 
+        snapshot interval.
+        """
+        def write_snapshots():
+            while not self.__snapshot_stop.wait(self._snapshot_interval):
+                self.snapshot().join()
+        
+        self.__snapshot_stop.clear()
+        self.__snapshot_thread = Thread(target=write_snapshots, name='rasblite-snapshots', daemon=True)
+        self.__snapshot_thread.start()
+    
+    def __stop_snapshots(self):
+        """Stops writing snapshots every snapshot interval, waiting for any 
+        snapshot being written to finish.
+        """
+        self.__snapshot_stop.set()
+        self.__snapshot_thread.join()
+        self.__snapshot_thread = None
+    
+    def __start_trace(self):
+        """Keeps recent debug log records in memory, lowering the level of the
+        logger so that they are created. Only the records at or above the 
+        level the logger had before are propagated to the handlers of the 
+        application (see :class:`rasblite.engine.PropagatingHandler`).
+        """
+        self.__trace_handler = RingBufferHandler(self._trace_size, logging.DEBUG)
+        self.__trace_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        self.__log_level = logger.level
+        self.__log_propagate = logger.propagate
+        self.__propagating_handler = None
+        if logger.propagate:
+            self.__propagating_handler = PropagatingHandler(logger, logger.getEffectiveLevel())
+            logger.addHandler(self.__propagating_handler)
+            logger.propagate = False
+        logger.addHandler(self.__trace_handler)
+        logger.setLevel(logging.DEBUG)
+    
+    def __stop_trace(self):
+        """Stops keeping debug log records, restoring the level of the logger
+        and its propagation. The records already kept can still be read with
+        :meth:`trace`.
+        """
+        logger.removeHandler(self.__trace_handler)
+        if self.__propagating_handler is not None:
+            logger.removeHandler(self.__propagating_handler)
+        logger.propagate = self.__log_propagate
+        logger.setLevel(self.__log_level)
+    
     def __parse_model(self):
         """Creates a :class:`rasblite.engine.ModelParser` that parses the data 
         model and fills it with starting data if specified at initialisation.
         """
-        model_parser = ModelParser()
+        model_parser = ModelParser(self._validate_workers)
         self.__model = model_parser.parse(self._raw_model, self._raw_data)
-        pprint(self.__model)
+        logger.debug('Parsed model:\n%s', self.__model)
+        if self._storage == 'columnar':
+            self.__model.use_columnar_storage()
+        elif self._storage == 'records':
+            self.__model.use_record_storage()
+        
+        if self._state_dir is not None:
+            self.__write_ahead_log = WriteAheadLog(self._state_dir, self._compact_size)
+            self.__write_ahead_log.recover(self.__model)
+            self.__model.set_journal(self.__write_ahead_log)
+            self.__write_ahead_log.start(self.__model)
         
         
@@ -5,13 +5,17 @@ is designed to be ran by the user from the command line but it can also be used
 to quickly stand up a configured server from a bash script for example. 
 """
 import argparse
+import logging
 import os
+import pathlib
 import sys
 
 # If the user hasn't installed rasblite then try to find it in this repo.
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from rasblite import engine
 
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
 def add_parser_arguments(arg_parser):
     """Adds arguments to the :class:`argparse.ArgumentParser` which is passed in
     to allow the user to configure rasblite.
@@ -24,6 +28,23 @@ def add_parser_arguments(arg_parser):
     arg_parser.add_argument('--model', '-m', type=argparse.FileType('r'), required=True)
     arg_parser.add_argument('--starting_data', '-d', type=str)
     arg_parser.add_argument('--port', '-p', type=int, default=8080)
+    arg_parser.add_argument('--workers', '-w', type=int, default=None)
+    arg_parser.add_argument('--engine', '-e', choices=engine.Controller.ENGINES, default='http.server')
+    arg_parser.add_argument('--idle_timeout', '-t', type=float, default=engine.RequestHandler.timeout)
+    arg_parser.add_argument('--stream_threshold', '-s', type=int, default=engine.RequestHandler.stream_threshold)
+    arg_parser.add_argument('--cache_size', '-c', type=int, default=engine.RequestHandler.cache_size)
+    arg_parser.add_argument('--log_level', '-l', choices=LOG_LEVELS, default='INFO')
+    arg_parser.add_argument('--profile', action='store_true')
+    arg_parser.add_argument('--profile_requests', type=int, default=None)
+    arg_parser.add_argument('--profile_seconds', type=float, default=None)
+    arg_parser.add_argument('--profile_sample', type=float, default=1.0)
+    arg_parser.add_argument('--profile_output', type=str, default=None)
+    arg_parser.add_argument('--state_dir', type=str, default=None)
+    arg_parser.add_argument('--compact_size', type=int, default=engine.WriteAheadLog.compact_size)
+    arg_parser.add_argument('--snapshot_path', type=str, default=None)
+    arg_parser.add_argument('--snapshot_interval', type=float, default=None)
+    arg_parser.add_argument('--validate_workers', type=int, default=None)
+    arg_parser.add_argument('--storage', choices=engine.Controller.STORAGES, default='dict')
     
     
     return arg_parser
@@ -58,17 +79,58 @@ def expand_arguments(args, error_function):
     starting_data = args.starting_data
     if args.starting_data not in engine.Controller.STARTING_DATA_MODES:
         if os.path.exists(starting_data) and os.path.isfile(starting_data):
-            starting_data = open(args.starting_data, 'r').read()
+            # Read when the model is parsed, which may be compiled data
+            starting_data = pathlib.Path(starting_data)
         else:
             error_function("Could not read file: " + starting_data 
                              + ". Did you mean to use a defined type? (" 
                              + ", ".join(engine.Controller.STARTING_DATA_MODES.keys()) + ")")
                 
+    if args.workers is not None and args.workers < 0:
+        error_function("The number of workers cannot be negative: " + str(args.workers))
+    
+    if args.cache_size < 0:
+        error_function("The cache size cannot be negative: " + str(args.cache_size))
+    
+    if args.compact_size <= 0:
+        error_function("The compaction size must be positive: " + str(args.compact_size))
+    
+    if args.snapshot_interval is not None:
+        if args.snapshot_path is None:
+            error_function("A snapshot interval needs a snapshot path")
+        if args.snapshot_interval <= 0:
+            error_function("The snapshot interval must be positive: " + str(args.snapshot_interval))
+    
+    if args.validate_workers is not None and args.validate_workers <= 0:
+        error_function("The number of validation workers must be positive: " + str(args.validate_workers))
+    
+    if not 0 < args.profile_sample <= 1:
+        error_function("The profile sample rate must be greater than 0 and at most 1: " + str(args.profile_sample))
+    
+    profile = None
+    if args.profile:
+        profile = {'requests':    args.profile_requests,
+                   'seconds':     args.profile_seconds,
+                   'sample_rate': args.profile_sample,
+                   'output':      args.profile_output}
     
     # Get args   
-    expanded_args['data']  = starting_data
-    expanded_args['model'] = args.model.read()
-    expanded_args['port']  = args.port
+    expanded_args['data']             = starting_data
+    expanded_args['model']            = args.model.read()
+    expanded_args['port']             = args.port
+    expanded_args['workers']          = args.workers
+    expanded_args['engine_name']      = args.engine
+    expanded_args['idle_timeout']     = args.idle_timeout
+    expanded_args['stream_threshold'] = args.stream_threshold
+    expanded_args['cache_size']       = args.cache_size
+    expanded_args['log_level']        = args.log_level
+    expanded_args['profile']          = profile
+    expanded_args['state_dir']        = args.state_dir
+    expanded_args['compact_size']     = args.compact_size
+    expanded_args['snapshot_path']    = args.snapshot_path
+    expanded_args['snapshot_interval'] = args.snapshot_interval
+    expanded_args['validate_workers'] = args.validate_workers
+    expanded_args['storage']          = args.storage
     
     # Clean up!
     args.model.close()
@@ -76,28 +138,87 @@ def expand_arguments(args, error_function):
     return expanded_args
 
         
-def main(model, data, port):
+def main(model, data, port, workers=None, engine_name='http.server', 
+         idle_timeout=engine.RequestHandler.timeout, 
+         stream_threshold=engine.RequestHandler.stream_threshold,
+         cache_size=engine.RequestHandler.cache_size, log_level='INFO', 
+         profile=None, state_dir=None, 
+         compact_size=engine.WriteAheadLog.compact_size, snapshot_path=None,
+         snapshot_interval=None, validate_workers=None, storage='dict'):
     """The entry point for running rasblite module, mainly for when this script
     is called from the command line. Another Python script probably would not want
     to call this unless it was extending the functionality of it. Otherwise it
     would be better to call the :class:`rasblite.engine.Controller` directly.
     
     :param str model: format of the data model that will be built 
-    :param str data: starting data to fill the model with (or a special string 
-        that tells rasblite how to create the starting data
+    :param data: starting data to fill the model with (or a special string 
+        that tells rasblite how to create the starting data, or the path of a 
+        file to read it from such as one compiled by rasblite-compile-data)
     :param int port: port to use for the HTTP server
+    :param int workers: None to serve one request at a time, 0 for a thread per
+        connection or the size of the worker thread pool otherwise
+    :param str engine_name: HTTP engine to serve requests with, either 
+        `http.server` or `asyncio`
+    :param float idle_timeout: seconds a kept alive connection can be idle for
+        before it is closed
+    :param int stream_threshold: length above which a list is streamed back 
+        with chunked transfer encoding
+    :param int cache_size: number of encoded GET responses to cache, or 0 to
+        disable the response cache
+    :param str log_level: lowest level of the log messages written to stderr,
+        such as `INFO` or `DEBUG` (which includes every request served)
+    :param dict profile: None or the arguments to 
+        :meth:`rasblite.engine.Controller.start_profiling` to profile requests
+        from the start. The stats are printed on exit if there is no output file
+    :param str state_dir: directory to keep a write-ahead log of every change
+        in, so that the data is still there after a restart, or None
+    :param int compact_size: bytes the write-ahead log can grow to before it
+        is compacted into a snapshot
+    :param str snapshot_path: path to write snapshots of the data store to
+    :param float snapshot_interval: seconds between snapshots or None to only
+        write them when a POST is sent to `/__rasblite/snapshot`
+    :param int validate_workers: number of processes to verify large starting
+        data across, or None to verify it in this process
+    :param str storage: either `dict` to hold a dictionary per item of each 
+        collection, `columnar` to hold collections of flat items as columns or
+        `records` to hold each item as an instance of a generated record class
     
     """
+    configure_logging(log_level)
     print('RASBLite Start!')
-    controller = engine.Controller(model, data, port)
+    controller = engine.Controller(model, data, port, workers, engine_name, 
+                                   idle_timeout, stream_threshold, cache_size,
+                                   state_dir=state_dir, compact_size=compact_size,
+                                   snapshot_path=snapshot_path, 
+                                   snapshot_interval=snapshot_interval,
+                                   validate_workers=validate_workers,
+                                   storage=storage)
     
     try:
         controller.start()
+        if profile is not None:
+            controller.start_profiling(**profile)
         input('Press ENTER to exit...')
     except (KeyboardInterrupt, EOFError):
         pass
     finally:
         controller.stop()
+    
+    if profile is not None and profile['output'] is None:
+        print(controller.profile_report())
+
+def configure_logging(log_level):
+    """Writes log messages from rasblite at or above the level given to stderr.
+    
+    :param str log_level: lowest level of the log messages written
+    """
+    handler = logging.StreamHandler()
+    handler.setLevel(log_level)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    logger = logging.getLogger('rasblite')
+    logger.addHandler(handler)
+    logger.setLevel(log_level)
 
 def command_line_run():
     """Parses the command line before passing the arguments to the main function"""
@@ -15,6 +15,8 @@ setup(
     entry_points={
         'console_scripts': [
             'rasblite-run = rasblite.run:command_line_run',
+            'rasblite-bench = rasblite.bench:command_line_run',
+            'rasblite-compile-data = rasblite.compile_data:command_line_run',
             ],
         },
     packages=find_packages(exclude=('tests', 'docs')),
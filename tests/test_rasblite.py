@@ -1,14 +1,26 @@
 #!/usr/bin/env python3
 
 import unittest
+import unittest.mock
 import trace
 import sys
 import os
+import asyncio
 import urllib.request
+import http.client
+import io
 import json
+import logging
+import pathlib
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from array import array
 from ast import literal_eval
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
-from rasblite import engine
+from rasblite import engine, bench
 
 BASE_URL='/rest/api/1.0/'
 SERVER_PORT = 8080
@@ -49,6 +61,97 @@ class TestModelParser(unittest.TestCase):
         pass
 
 
+    def test_compile_data(self):
+        directory = tempfile.mkdtemp()
+        try:
+            compiled_path = pathlib.Path(directory, 'data.bin')
+            with open(compiled_path, 'wb') as compiled_file:
+                self.model_parser.compile_data(DEFAULT_MODEL, DEFAULT_STARTING_DATA, compiled_file)
+            
+            model = self.model_parser.parse(DEFAULT_MODEL, compiled_path)
+            self.assertDictEqual(model._data_store, literal_eval(DEFAULT_STARTING_DATA), 'Compiled data was not loaded into the data store')
+            
+            other_model = DEFAULT_MODEL.replace('GET,PUT          users/:userID/age', 'GET              users/:userID/age')
+            with self.assertRaises(ValueError, msg='Compiled data should not be loaded for a different model'):
+                self.model_parser.parse(other_model, compiled_path)
+            
+            with open(compiled_path, 'wb') as compiled_file:
+                with self.assertRaises(ValueError, msg='Data that does not match the model should not be compiled'):
+                    self.model_parser.compile_data(DEFAULT_MODEL, "{'cars': []}", compiled_file)
+            
+            data_path = pathlib.Path(directory, 'data.txt')
+            data_path.write_text(DEFAULT_STARTING_DATA)
+            model = self.model_parser.parse(DEFAULT_MODEL, data_path)
+            self.assertDictEqual(model._data_store, literal_eval(DEFAULT_STARTING_DATA), 'Starting data was not read from the file')
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_load_data(self):
+        expected = literal_eval(DEFAULT_STARTING_DATA)
+        directory = tempfile.mkdtemp()
+        try:
+            json_path = pathlib.Path(directory, 'data.json')
+            json_path.write_text(json.dumps(expected, indent=4))
+            model = self.model_parser.parse(DEFAULT_MODEL, json_path)
+            self.assertDictEqual(model._data_store, expected, 'JSON starting data was not streamed into the data store')
+            
+            ndjson_path = pathlib.Path(directory, 'data.ndjson')
+            ndjson_path.write_text('\n'.join(json.dumps({'users': user}) for user in expected['users']))
+            model = self.model_parser.parse(DEFAULT_MODEL, ndjson_path)
+            self.assertDictEqual(model._data_store, expected, 'NDJSON starting data was not streamed into the data store')
+        finally:
+            shutil.rmtree(directory)
+        
+        # Read a character at a time so that every value spans many reads
+        chunk_size, engine.ModelParser.JSONReader.CHUNK_SIZE = engine.ModelParser.JSONReader.CHUNK_SIZE, 1
+        try:
+            data_store = self.model_parser.load_data(self.model_parser.parse(DEFAULT_MODEL, 'EMPTY'), 
+                                                     io.StringIO(json.dumps(expected)))
+            self.assertDictEqual(data_store, expected, 'Values split across reads were not decoded')
+        finally:
+            engine.ModelParser.JSONReader.CHUNK_SIZE = chunk_size
+        
+        model = self.model_parser.parse(DEFAULT_MODEL, 'EMPTY')
+        data_store = self.model_parser.load_data(model, io.StringIO('{"users": [{"name": "Bob"}, {"cars": "2"}]}'))
+        self.assertDictEqual(data_store, {}, 'Data that does not match the model should not be loaded')
+        
+        with self.assertRaises(ValueError, msg='Invalid JSON should not be loaded'):
+            self.model_parser.load_data(model, io.StringIO('{"users": [{"name": "Bob"}'))
+    
+    def test_parse_starting_data_in_parallel(self):
+        model_parser = engine.ModelParser(validate_workers=2)
+        model_parser.validate_chunk_size = 2
+        users = [{'name': 'User' + str(index), 'addresses': [], 'age': str(index)} for index in range(7)]
+        
+        model = model_parser.parse(DEFAULT_MODEL, repr({'users': users}))
+        self.assertListEqual(model._data_store['users'], users, 'Starting data verified in parallel was not loaded')
+        
+        users[3]['addresses'].append({'post_code': 5})
+        users[6]['cars'] = '2'
+        with self.assertLogs('rasblite', 'ERROR') as logs:
+            model = model_parser.parse(DEFAULT_MODEL, repr({'users': users}))
+        self.assertDictEqual(model._data_store, {}, 'Starting data that does not match the model should not be loaded')
+        self.assertEqual(logs.output, ['ERROR:rasblite.engine:Unhandled type int (at users/3/addresses/0/post_code)'], 
+                         'The first mismatch should be reported along with where it is')
+        self.assertEqual(model_parser.check_data(model_parser.parse(DEFAULT_MODEL, 'EMPTY'), {'users': users}), 
+                         'Unhandled type int (at users/3/addresses/0/post_code)', 'Checking the data should return the first mismatch')
+        
+        def user(index, addresses=0):
+            return {'name': 'User' + str(index), 'age': str(index), 
+                    'addresses': [{'post_code': 'AB' + str(number)} for number in range(addresses)]}
+        
+        mismatches = [{'users': [user(index) for index in range(7)] + [{'cars': '2'}], 'cars': '1'},
+                      {'users': [user(0, addresses=5), user(1)], 'cars': '1'},
+                      {'users': [user(0, addresses=5), [user(1)]]},
+                      {'users': [user(index, addresses=3) for index in range(5)] + ['User5']}]
+        mismatches[1]['users'][0]['addresses'][4]['post_code'] = 5
+        for data in mismatches:
+            with self.assertLogs('rasblite', 'ERROR') as logs:
+                engine.ModelParser().parse(DEFAULT_MODEL, repr(data))
+            with self.assertLogs('rasblite', 'ERROR') as parallel_logs:
+                model_parser.parse(DEFAULT_MODEL, repr(data))
+            self.assertEqual(parallel_logs.output, logs.output, 'The mismatch reported in parallel should be the one reported in turn')
+    
     def test_parse_default_starting_data(self):
         model = self.model_parser.parse(DEFAULT_MODEL, DEFAULT_STARTING_DATA)
         self.assertMultiLineEqual(str(model), DEFAULT_MODEL_STR, 'Model parsed from config seems different to model loaded')
@@ -133,6 +236,19 @@ class TestModelParser(unittest.TestCase):
         expected = 'IJ12 3KL'
         self.assertEqual(result, expected, 'Starting data is different to expected')
         
+    def test_parse_compiles_routes(self):
+        model = self.model_parser.parse(DEFAULT_MODEL, DEFAULT_STARTING_DATA)
+        
+        users = model._routes.children['users']
+        self.assertEqual(users.methods, frozenset(['GET', 'POST']), 'Route methods were not compiled from the model')
+        self.assertIsNone(users.param_child.param_child, 'users/:userID/ should not have a parameter child')
+        
+        user = users.param_child
+        self.assertEqual(user.key, ':userID', 'Parameter route was not compiled from the model')
+        self.assertTrue(user.is_param, 'Parameter route was not marked as a parameter')
+        self.assertSetEqual(set(user.children), {'name', 'age', 'addresses'}, 'Literal routes were not compiled from the model')
+        self.assertEqual(user.children['addresses'].param_child.children['post_code'].methods, frozenset(['GET', 'PUT']), 'Nested route methods were not compiled from the model')
+        
 class TestModelData(unittest.TestCase):
     def setUp(self):
         self.model_parser = engine.ModelParser()
@@ -159,6 +275,11 @@ class TestModelData(unittest.TestCase):
         self.assertIsInstance(result, expected.__class__, 'model_object.action_path(GET,...) should have returned an error because the path does not exist.')
         self.assertEqual(result.error_type, expected.error_type, 'model_object.action_path(GET,...) returned an error as expected but the error type was different.')
         
+        result = self.model.action_path('GET', BASE_URL + 'cars/0')
+        expected = engine.ModelData.ModelError(error_type='BaseError')
+        self.assertIsInstance(result, expected.__class__, 'model_object.action_path(GET,...) should have returned an error because the collection is not in the model.')
+        self.assertEqual(result.error_type, expected.error_type, 'model_object.action_path(GET,...) returned an error as expected but the error type was different.')
+        
         result = self.model.action_path('GET', BASE_URL + 'users/ten')
         expected = engine.ModelData.ModelError(error_type='BadRequestError')
         self.assertIsInstance(result, expected.__class__, 'model_object.action_path(GET,...) should have returned an error because a string was given instead of a number.')
@@ -197,6 +318,249 @@ class TestModelData(unittest.TestCase):
         expected = 'AB12 3CD'
         self.assertEqual(result, expected, 'model_object.action_path(GET,...) returned unexpected result')
         
+    def test_route(self):
+        self.assertEqual(self.model.route(BASE_URL + 'users/1/name'), 'users/:userID/name', 'Path should match the route in the model')
+        self.assertEqual(self.model.route(BASE_URL + 'users/?count'), 'users', 'Query string should be ignored')
+        self.assertIsNone(self.model.route(BASE_URL + 'cars/0'), 'Path outside the model should not match a route')
+        
+    def test_version(self):
+        users, user0, user1 = (self.model.version(BASE_URL + path) for path in ('users/', 'users/0', 'users/1'))
+        self.model.action_path('PUT', BASE_URL + 'users/0/age', '30')
+        self.assertNotEqual(self.model.version(BASE_URL + 'users/'), users, 'Version of the parent should change')
+        self.assertNotEqual(self.model.version(BASE_URL + 'users/0'), user0, 'Version of the changed item should change')
+        self.assertEqual(self.model.version(BASE_URL + 'users/1'), user1, 'Version of a sibling should not change')
+        
+    def test_action_path_POST_bulk(self):
+        message_body = [{'name': 'User' + str(index), 'addresses': [], 'age': str(index)} for index in range(3)]
+        result = self.model.action_path('POST', BASE_URL + 'users/', message_body)
+        self.assertDictEqual(result, {'count': 3, 'ids': [2, 3, 4]}, 'Bulk POST should only return the count and ids of the items added')
+        self.assertEqual(self.model.action_path('GET', BASE_URL + 'users/4/name'), 'User2', 'Items posted in bulk should be added in order')
+        
+        result = self.model.action_path('POST', BASE_URL + 'users/0/addresses/', {'post_code': 'EE55 1FF'}, bulk=True)
+        self.assertEqual(result.error_type, 'BadRequestError', 'Bulk POST of a single item should be a bad request')
+        
+    def test_action_path_validation(self):
+        invalid = [('POST', 'users/', {'name': 'Jim', 'cars': []}),
+                   ('POST', 'users/', [{'name': 'Jim'}, {'name': ['Jim']}]),
+                   ('POST', 'users/0/addresses/', 'AB12 3CD'),
+                   ('PUT', 'users/0/', {'addresses': [{'post_code': {'AB12': '3CD'}}]}),
+                   ('PUT', 'users/0/name', 21)]
+        for method, path, message_body in invalid:
+            result = self.model.action_path(method, BASE_URL + path, message_body)
+            self.assertIsInstance(result, engine.ModelData.ModelError, method + ' of data that does not match the model should fail: ' + path)
+            self.assertEqual(result.error_type, 'BadRequestError', method + ' of data that does not match the model should be a bad request: ' + path)
+        
+        self.assertListEqual(self.model.action_path('GET', BASE_URL + 'users/'), literal_eval(DEFAULT_STARTING_DATA)['users'], 'Data that does not match the model should not be stored')
+        
+        routes = self.model._routes
+        self.assertEqual(routes.children['users'].kind, engine.ModelData.RouteNode.COLLECTION, 'users should be compiled as a collection')
+        self.assertEqual(routes.children['users'].param_child.kind, engine.ModelData.RouteNode.OBJECT, 'A user should be compiled as an object')
+        self.assertEqual(routes.children['users'].param_child.children['name'].kind, engine.ModelData.RouteNode.LEAF, 'A name should be compiled as a leaf')
+        
+    def test_action_batch(self):
+        results = self.model.action_batch([('PUT', BASE_URL + 'users/0/age', '30'),
+                                           ('GET', BASE_URL + 'users/9', None),
+                                           ('GET', BASE_URL + 'users/0/age', None)])
+        self.assertEqual(results[0]['age'], '30', 'PUT in a batch returned unexpected result')
+        self.assertEqual(results[1].error_type, 'BaseError', 'Failed operation should not stop a batch')
+        self.assertEqual(results[2], '30', 'Operation should see the changes made before it in the batch')
+        
+    def test_action_batch_atomic(self):
+        before = literal_eval(DEFAULT_STARTING_DATA)
+        results = self.model.action_batch([('POST', BASE_URL + 'users/', {'name': 'Jim', 'addresses': [], 'age': '18'}),
+                                           ('PUT', BASE_URL + 'users/0/', {'name': 'Rob'}),
+                                           ('DELETE', BASE_URL + 'users/1/', None),
+                                           ('PUT', BASE_URL + 'users/0/age', ['not', 'a', 'string']),
+                                           ('GET', BASE_URL + 'users/', None)], atomic=True)
+        
+        self.assertListEqual([result.error_type for result in results], 
+                             ['RolledBackError', 'RolledBackError', 'RolledBackError', 'BadRequestError', 'RolledBackError'],
+                             'Every operation other than the one which failed should be rolled back')
+        self.assertDictEqual(self.model._data_store, before, 'Data store should be as it was before the batch')
+        
+    def test_snapshot(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'snapshot.txt')
+            expected = repr(self.model._data_store)
+            errors = list()
+            with unittest.mock.patch.object(engine.ModelData, 'SNAPSHOT_BUFFER_SIZE', 10):
+                self.model.snapshot(path, errors.append).join()
+            self.model.action_path('PUT', BASE_URL + 'users/0/age', '30')
+            self.assertListEqual(errors, [None], 'Callback should be called once the snapshot is written')
+            
+            with open(path) as snapshot_file:
+                snapshot_file.readline()
+                self.assertEqual(snapshot_file.read(), expected, 'Snapshot written in pieces should match the data store encoded whole')
+            
+            snapshot = engine.ModelParser().parse(DEFAULT_MODEL, 'EMPTY')
+            self.assertEqual(snapshot.load_snapshot(path), 0, 'Snapshot should record the position of the journal')
+            self.assertEqual(snapshot.action_path('GET', BASE_URL + 'users/1/name'), 'Frank', 'Snapshot should hold the data store')
+            self.assertEqual(snapshot.action_path('GET', BASE_URL + 'users/0/age'), '21', 'Snapshot should not see later changes')
+        finally:
+            shutil.rmtree(directory)
+        
+    def test_snapshot_while_changing(self):
+        flat_model = '\n'.join(line for line in DEFAULT_MODEL.splitlines() if 'addresses' not in line)
+        changes = [('PUT', 'users/0/age', '30'), ('PUT', 'users/1/', {'name': 'Fred', 'age': '61'}),
+                   ('POST', 'users/', {'name': 'Jim', 'age': '18'}), ('DELETE', 'users/0/', None)]
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'snapshot.txt')
+            for storage in ('dict', 'columnar', 'records'):
+                model = engine.ModelParser().parse(flat_model, repr({'users': [{'name': 'Bob', 'age': '21'}, {'name': 'Frank', 'age': '60'}]}))
+                if storage == 'columnar':
+                    model.use_columnar_storage()
+                elif storage == 'records':
+                    model.use_record_storage()
+                expected = repr({'users': [dict(user) for user in model._data_store['users']]})
+                
+                # Change the data store between the pieces of the snapshot
+                acquire_read = model._lock.acquire_read
+                def acquire_and_change():
+                    if threading.current_thread().name == 'rasblite-snapshot' and changes_left:
+                        for method, change_path, message_body in changes_left:
+                            model.action_path(method, BASE_URL + change_path, message_body)
+                        changes_left.clear()
+                    acquire_read()
+                
+                changes_left = list(changes)
+                with unittest.mock.patch.object(engine.ModelData, 'SNAPSHOT_BUFFER_SIZE', 10), \
+                     unittest.mock.patch.object(model._lock, 'acquire_read', acquire_and_change):
+                    model.snapshot(path).join()
+                self.assertListEqual(changes_left, [], 'Changes should have been made during the snapshot (%s)' % storage)
+                self.assertEqual(model.action_path('GET', BASE_URL + 'users/2/name'), 'Jim', 'Changes should be made to the data store (%s)' % storage)
+                self.assertDictEqual(model._snapshots, {}, 'Copies should not be kept once the snapshot is written (%s)' % storage)
+                
+                with open(path) as snapshot_file:
+                    snapshot_file.readline()
+                    self.assertEqual(snapshot_file.read(), expected, 'Snapshot should not see changes made while it is written (%s)' % storage)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_memory_usage(self):
+        usage = self.model.memory_usage()
+        self.assertEqual(set(usage), {'users', 'users/:userID/addresses'}, 'Usage should be reported for each collection')
+        self.assertEqual(usage['users']['items'], 2, 'Usage should count the items in the collection')
+        self.assertGreater(usage['users']['bytes'], usage['users/:userID/addresses']['bytes'], 'Collection size should include nested collections')
+        
+        self.model.action_path('POST', BASE_URL + 'users/', {'name': 'Jim', 'addresses': [{'address_lines': 'a', 'post_code': 'b'}], 'age': '18'})
+        self.model.action_path('PUT', BASE_URL + 'users/1/name', 'F' * 1000)
+        self.model.action_path('DELETE', BASE_URL + 'users/0/addresses/0')
+        
+        full_walk = engine.ModelParser().parse(DEFAULT_MODEL, 'EMPTY')
+        full_walk._data_store = self.model._data_store
+        self.assertDictEqual(self.model.memory_usage(), full_walk.memory_usage(), 'Usage kept up to date should match measuring everything again')
+        
+    def test_columnar_storage(self):
+        flat_model = DEFAULT_MODEL.replace('users/:userID/addresses', 'users/:userID/others')
+        flat_model = '\n'.join(line for line in flat_model.splitlines() if 'others' not in line)
+        starting_data = {'users': [{'name': 'Bob', 'age': '21'}, {'name': 'Frank', 'age': '60'}]}
+        plain = engine.ModelParser().parse(flat_model, repr(starting_data))
+        columnar = engine.ModelParser().parse(flat_model, repr(starting_data))
+        columnar.use_columnar_storage()
+        self.assertIsInstance(columnar._data_store['users'], engine.ModelData.ColumnarCollection, 'A collection of flat items should be held as columns')
+        
+        operations = [('GET', 'users/', None),
+                      ('GET', 'users/1', None),
+                      ('POST', 'users/', {'name': 'Jim', 'age': '18'}),
+                      ('POST', 'users/', {'name': 'Sue'}),
+                      ('PUT', 'users/0/', {'age': 'unknown'}),
+                      ('PUT', 'users/1/name', 'Fred'),
+                      ('DELETE', 'users/2', None),
+                      ('GET', 'users/?offset=1&limit=2', None),
+                      ('GET', 'users/9', None)]
+        encoder = engine.DataEncoder()
+        for method, path, message_body in operations:
+            expected = plain.action_path(method, BASE_URL + path, message_body)
+            result = columnar.action_path(method, BASE_URL + path, message_body)
+            if isinstance(expected, engine.ModelData.ModelError):
+                self.assertEqual(result.error_type, expected.error_type, method + ' should fail the same way with columnar storage: ' + path)
+            else:
+                self.assertEqual(result, expected, method + ' should have the same result with columnar storage: ' + path)
+                self.assertEqual(json.loads(encoder.encode(result)), json.loads(encoder.encode(expected)), method + ' should be encoded the same with columnar storage: ' + path)
+        
+        results = columnar.action_batch([('POST', BASE_URL + 'users/', {'name': 'Tom'}), ('GET', BASE_URL + 'users/9', None)], atomic=True)
+        self.assertEqual(results[1].error_type, 'BaseError', 'Batch should have failed')
+        self.assertEqual(literal_eval(repr(columnar._data_store)), plain._data_store, 'Columnar data store should match the plain one after a rolled back batch')
+        
+        usage = columnar.memory_usage()
+        columnar._memory = None
+        self.assertDictEqual(usage, columnar.memory_usage(), 'Usage kept up to date should match measuring everything again')
+        
+        ages = engine.ModelData.ColumnarCollection([{'age': '21'}, {'age': '60'}])
+        del ages[0]['age']
+        ages[1]['age'] = '' # As left by a DELETE
+        ages.append({'age': '18'})
+        self.assertIsInstance(ages._values['age'], array, 'An empty value should not turn a column of whole numbers into a list')
+        self.assertEqual(ages.materialize(), [{}, {'age': ''}, {'age': '18'}], 'Empty values should be kept apart from zero')
+        
+        for value in ('0', '-0', '00', '+1', '007', '-999999999999999999', '1234567890123456789', '-9223372036854775808'):
+            ages = engine.ModelData.ColumnarCollection([{'age': '21'}, {'age': value}])
+            self.assertEqual(ages[1]['age'], value, 'Value should be read back exactly as it was set: ' + value)
+            self.assertEqual(ages.materialize()[1]['age'], value, 'Value should be encoded exactly as it was set: ' + value)
+        
+    def test_record_storage(self):
+        plain = engine.ModelParser().parse(DEFAULT_MODEL, DEFAULT_STARTING_DATA)
+        self.model.use_record_storage()
+        user = self.model._data_store['users'][0]
+        self.assertIsInstance(user, engine.ModelData.Record, 'Items should be held as records')
+        self.assertIsInstance(user['addresses'][0], engine.ModelData.Record, 'Items of nested collections should be held as records')
+        self.assertFalse(hasattr(user, '__dict__'), 'Records should only have slots')
+        self.assertEqual(user.__slots__, ('name', 'addresses', 'age'), 'Records should have a slot for each field in the model')
+        
+        operations = [('GET', 'users/0', None),
+                      ('POST', 'users/', {'name': 'Jim', 'addresses': [{'post_code': 'UR98 7ST'}]}),
+                      ('PUT', 'users/1/', {'addresses': [{'post_code': 'CC44 3YY', 'address_lines': '11 Testing Avenue'}]}),
+                      ('POST', 'users/', [{'name': 'Sue', 'age': '30'}, {'age': '5'}]),
+                      ('DELETE', 'users/0/addresses/0', None),
+                      ('GET', 'users/1/addresses/0/post_code', None),
+                      ('GET', 'users/2/age', None)]
+        encoder = engine.DataEncoder()
+        for method, path, message_body in operations:
+            expected = plain.action_path(method, BASE_URL + path, message_body)
+            result = self.model.action_path(method, BASE_URL + path, message_body)
+            if isinstance(expected, engine.ModelData.ModelError):
+                self.assertEqual(result.error_type, expected.error_type, method + ' should fail the same way with record storage: ' + path)
+            else:
+                self.assertEqual(result, expected, method + ' should have the same result with record storage: ' + path)
+                self.assertEqual(json.loads(encoder.encode(result)), json.loads(encoder.encode(expected)), method + ' should be encoded the same with record storage: ' + path)
+        
+        self.assertIsInstance(self.model._data_store['users'][1]['addresses'][0], engine.ModelData.Record, 'Items put should be held as records')
+        self.assertEqual(literal_eval(repr(self.model._data_store)), plain._data_store, 'Data store with records should match the plain one')
+        
+        usage = self.model.memory_usage()
+        self.model._memory = None
+        self.assertDictEqual(usage, self.model.memory_usage(), 'Usage kept up to date should match measuring everything again')
+        
+    def test_action_path_paging(self):
+        for index in range(2, 10):
+            self.model.action_path('POST', BASE_URL + 'users/', {'name': 'User' + str(index), 'addresses': [], 'age': str(index)})
+        
+        def names(query):
+            return [user['name'] for user in self.model.action_path('GET', BASE_URL + 'users/?' + query)]
+        
+        self.assertListEqual(names('offset=2&limit=3'), ['User2', 'User3', 'User4'], 'model_object.action_path(GET,...) returned an unexpected page')
+        self.assertListEqual(names('offset=8'), ['User8', 'User9'], 'model_object.action_path(GET,...) returned an unexpected page')
+        self.assertListEqual(names('limit=2'), ['Bob', 'Frank'], 'model_object.action_path(GET,...) returned an unexpected page')
+        self.assertListEqual(names('after=6&limit=2'), ['User7', 'User8'], 'model_object.action_path(GET,...) returned an unexpected page')
+        self.assertListEqual(names('after=9'), [], 'model_object.action_path(GET,...) returned an unexpected page')
+        self.assertListEqual(names('offset=100'), [], 'model_object.action_path(GET,...) returned an unexpected page')
+        self.assertEqual(len(names('unknown=1')), 10, 'model_object.action_path(GET,...) should ignore unknown parameters')
+        
+        self.assertEqual(self.model.action_path('GET', BASE_URL + 'users/?count'), 10, 'model_object.action_path(GET,...) returned an unexpected count')
+        self.assertEqual(self.model.action_path('GET', BASE_URL + 'users/?count&offset=8&limit=5'), 2, 'model_object.action_path(GET,...) returned an unexpected count')
+        self.assertEqual(self.model.action_path('GET', BASE_URL + 'users/1/addresses?count'), 2, 'model_object.action_path(GET,...) returned an unexpected count')
+        self.assertEqual(self.model.action_path('HEAD', BASE_URL + 'users/?limit=1'), [{'name': 'Bob', 'addresses': [{'post_code': 'AB12 3CD', 'address_lines': '123 Fake Street'}], 'age': '21'}], 'model_object.action_path(HEAD,...) should be the same as GET')
+        
+        for query in ('limit=ten', 'offset=-1', 'limit=-5'):
+            result = self.model.action_path('GET', BASE_URL + 'users/?' + query)
+            self.assertIsInstance(result, engine.ModelData.ModelError, 'model_object.action_path(GET,...) should have returned an error for ' + query)
+            self.assertEqual(result.error_type, 'BadRequestError', 'model_object.action_path(GET,...) returned an error as expected but the error type was different.')
+        
+        result = self.model.action_path('GET', BASE_URL + 'users/0/name?limit=1')
+        self.assertIsInstance(result, engine.ModelData.ModelError, 'model_object.action_path(GET,...) should have returned an error because only collections can be paged.')
+        
     def test_action_path_POST(self):
         result = self.model.action_path('GET', BASE_URL + 'users/')
         expected = literal_eval("[{'name': 'Bob', 'addresses': [{'post_code': 'AB12 3CD', 'address_lines': '123 Fake Street'}], 'age': '21'}, {'name': 'Frank', 'addresses': [{'post_code': 'EF45 6GH', 'address_lines': '456 My Street'}, {'post_code': 'IJ12 3KL', 'address_lines': '789 Other Street'}], 'age': '60'}]")
@@ -327,8 +691,10 @@ class TestModelData(unittest.TestCase):
         
 class TestRequestHandler(unittest.TestCase):
     
+    controller_options = {}
+    
     def setUp(self):
-        self.controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT)
+        self.controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT, **self.controller_options)
         self.controller.start()
         
     def tearDown(self):
@@ -596,6 +962,637 @@ class TestRequestHandler(unittest.TestCase):
         expected = literal_eval("[{'name': 'Sarah', 'addresses': [{'post_code': 'AB12 3CD', 'address_lines': '123 Fake Street'}, {'post_code': 'EE55 1FF', 'address_lines': '99 Oak Avenue'}], 'age': '21'}, {'age': '60', 'name': 'Frank', 'addresses': [{'address_lines': '', 'post_code': ''}, {'address_lines': '789 Other Street', 'post_code': 'IJ12 3KL'}]}, {'name': '', 'addresses': [], 'age': ''}]")
         self.assertListEqual(result, expected, 'self.server_request(GET,...) didn\'t show the recently deleted user')
         
+    def test_request_content_type(self):
+        expected = literal_eval("{'post_code': 'AB12 3CD', 'address_lines': '123 Fake Street'}")
+        
+        for accept, ctype in ((None, 'application/json'), 
+                              ('*/*', 'application/json'),
+                              ('text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8', 'text/html'),
+                              ('text/html;q=0.5, application/json', 'application/json')):
+            headers = {'Accept': accept} if accept else {}
+            request = urllib.request.Request(url='http://localhost:' + str(SERVER_PORT) + BASE_URL + 'users/0/addresses/0', 
+                                             headers=headers)
+            response = urllib.request.urlopen(request)
+            
+            self.assertEqual(response.getheader('Content-type'), ctype, 'Unexpected content type negotiated for Accept: ' + str(accept))
+            raw_response = response.read()
+            if ctype == 'application/json':
+                self.assertDictEqual(json.loads(raw_response.decode()), expected, 'Response should have been JSON')
+            self.assertDictEqual(self.controller.parse_response(raw_response), expected, 'parse_response returned unexpected result')
+        
+    def test_request_streamed(self):
+        self.controller.stop()
+        self.controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT, stream_threshold=1, **self.controller_options)
+        self.controller.start()
+        
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        try:
+            for path in ('users/', 'users/1/addresses/', 'users/0/addresses/'):
+                connection.request('GET', BASE_URL + path)
+                response = connection.getresponse()
+                streamed = (response.getheader('Transfer-Encoding') == 'chunked')
+                self.assertEqual(streamed, path != 'users/0/addresses/', 'Only lists longer than the stream threshold should be streamed: ' + path)
+                self.assertEqual(self.controller.parse_response(response.read()), self.controller.perform_user_request('GET', BASE_URL + path), 'Streamed response was different to the data store')
+        finally:
+            connection.close()
+        
+        # Encode an item per chunk and change the data before the second one
+        iterencode_list = engine.DataEncoder.iterencode_list
+        def small_iterencode_list(encoder, items):
+            return iterencode_list(encoder, items, 1)
+        
+        read_if_unchanged = engine.Controller.read_if_unchanged
+        reads = list()
+        def changed_read_if_unchanged(controller, *args):
+            reads.append(args)
+            if len(reads) == 2:
+                controller.perform_user_request('PUT', BASE_URL + 'users/1/name', 'Fred')
+            return read_if_unchanged(controller, *args)
+        
+        with unittest.mock.patch.object(engine.DataEncoder, 'iterencode_list', small_iterencode_list):
+            self.assertEqual(self.server_request('GET', 'users/'), 
+                             self.controller.perform_user_request('GET', BASE_URL + 'users/'), 'Response streamed in many chunks was different to the data store')
+            
+            connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+            try:
+                with unittest.mock.patch.object(engine.Controller, 'read_if_unchanged', changed_read_if_unchanged):
+                    connection.request('GET', BASE_URL + 'users/')
+                    response = connection.getresponse()
+                    self.assertEqual(response.status, 200, 'Stream should start before the data changes')
+                    with self.assertRaises(http.client.IncompleteRead, msg='Stream should be cut short once the data changes'):
+                        response.read()
+            finally:
+                connection.close()
+        self.assertEqual(self.server_request('GET', 'users/1/name'), 'Fred', 'Change should have been made while streaming')
+        
+    def test_request_traced(self):
+        self.assertListEqual(self.controller.trace(), [], 'Nothing should be traced by default')
+        
+        self.controller.stop()
+        self.controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT, trace_size=2, **self.controller_options)
+        self.controller.start()
+        
+        # The application's handlers should not see the debug records traced
+        records = list()
+        application_handler = logging.Handler()
+        application_handler.emit = records.append
+        logging.getLogger().addHandler(application_handler)
+        try:
+            engine.logger.error('Still propagated')
+            for path in ('users/0/name', 'users/1/name', 'users/1/age'):
+                self.server_request('GET', path)
+        finally:
+            logging.getLogger().removeHandler(application_handler)
+        engine_records = [record for record in records if record.name == engine.logger.name]
+        self.assertListEqual([record.getMessage() for record in engine_records], ['Still propagated'], 
+                             'Only records at the usual level should reach the application while tracing')
+        
+        trace = self.controller.trace()
+        self.assertEqual(len(trace), 2, 'Only the most recent records should be kept')
+        self.assertIn('GET ' + BASE_URL + 'users/1/age', trace[-1], 'Most recent request should be traced')
+        
+    def test_request_HEAD(self):
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        try:
+            connection.request('HEAD', BASE_URL + 'users/')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200, 'HEAD request on a collection failed')
+            self.assertEqual(response.getheader('X-Item-Count'), '2', 'HEAD request should return the size of the collection')
+            self.assertEqual(response.read(), b'', 'HEAD request should not return a body')
+            
+            connection.request('HEAD', BASE_URL + 'users/1/name')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200, 'HEAD request on an item failed')
+            self.assertEqual(response.getheader('Content-Length'), str(len(b'"Frank"')), 'HEAD request should return the length of the GET response')
+            self.assertEqual(response.read(), b'', 'HEAD request should not return a body')
+            
+            connection.request('HEAD', BASE_URL + 'users/0/this_does_not_exist')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 400, 'HEAD request returned an error as expected but the error code was different.')
+            response.read()
+            
+            connection.request('GET', BASE_URL + 'users/?offset=1&limit=1')
+            response = connection.getresponse()
+            self.assertListEqual([user['name'] for user in self.controller.parse_response(response.read())], ['Frank'], 'Paged GET request returned an unexpected result')
+            
+            connection.request('GET', BASE_URL + 'users/?count')
+            self.assertEqual(self.controller.parse_response(connection.getresponse().read()), 2, 'Count GET request returned an unexpected result')
+        finally:
+            connection.close()
+            
+    def test_request_ETag(self):
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        
+        def etag(path):
+            connection.request('GET', BASE_URL + path)
+            response = connection.getresponse()
+            response.read()
+            return response.getheader('ETag')
+        
+        try:
+            users_etag, user0_etag, user1_etag = etag('users/'), etag('users/0'), etag('users/1')
+            self.assertIsNotNone(users_etag, 'GET request should return an ETag')
+            
+            connection.request('GET', BASE_URL + 'users/', headers={'If-None-Match': users_etag})
+            response = connection.getresponse()
+            self.assertEqual(response.status, 304, 'GET request with a matching ETag should not be modified')
+            self.assertEqual(response.read(), b'', '304 response should not return a body')
+            
+            connection.request('PUT', BASE_URL + 'users/0/name', body='"Bobby"', headers={'Content-Type': 'application/json'})
+            connection.getresponse().read()
+            self.assertNotEqual(etag('users/'), users_etag, 'ETag of the parent collection should change')
+            self.assertNotEqual(etag('users/0'), user0_etag, 'ETag of the changed item should change')
+            self.assertEqual(etag('users/1'), user1_etag, 'ETag of a sibling item should not change')
+            
+            connection.request('GET', BASE_URL + 'users/', headers={'If-None-Match': users_etag})
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200, 'GET request with a stale ETag should return the data')
+            response.read()
+        finally:
+            connection.close()
+    
+    def test_request_cached(self):
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        
+        def get(path):
+            connection.request('GET', BASE_URL + path)
+            return self.controller.parse_response(connection.getresponse().read())
+        
+        try:
+            self.assertEqual(get('users/1/name'), 'Frank', 'GET request returned an unexpected result')
+            self.assertEqual(get('users/1/name'), 'Frank', 'Cached GET request returned an unexpected result')
+            self.assertEqual(self.controller.cache_stats()['hits'], 1, 'Second GET request should be served from the cache')
+            
+            get('users/')
+            connection.request('PUT', BASE_URL + 'users/1/', body='{"name": "Fred", "age": "61", "addresses": []}', headers={'Content-Type': 'application/json'})
+            connection.getresponse().read()
+            self.assertEqual(get('users/1/name'), 'Fred', 'PUT request above the path should invalidate the cached response')
+            self.assertEqual(get('users/')[1]['name'], 'Fred', 'PUT request below the path should invalidate the cached response')
+            self.assertEqual(self.controller.cache_stats()['hits'], 1, 'Invalidated responses should not be served from the cache')
+        finally:
+            connection.close()
+    
+    def test_request_metrics(self):
+        # Requests on the same connection are recorded before the next is read
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        try:
+            for path in ('users/0/name', 'users/1/name', 'users/5/name'):
+                connection.request('GET', BASE_URL + path)
+                connection.getresponse().read()
+            
+            connection.request('GET', '/__rasblite/metrics')
+            response = connection.getresponse()
+            self.assertTrue(response.getheader('Content-Type').startswith('text/plain'), 'Metrics should be served as text')
+            lines = response.read().decode().splitlines()
+        finally:
+            connection.close()
+        
+        self.assertIn('rasblite_requests_total{method="GET",route="users/:userID/name",status="200"} 2', lines, 'Metrics should be served in the Prometheus format')
+        self.assertIn('rasblite_model_duration_seconds_count{method="GET",route="users/:userID/name"} 3', lines, 'Time taken on the data store should be served')
+        
+        requests = self.controller.metrics()['requests'][('GET', 'users/:userID/name')]
+        self.assertEqual(requests['count'], 3, 'Requests should be grouped by the route in the model')
+        self.assertDictEqual(requests['statuses'], {200: 2, 404: 1}, 'Status codes of the requests should be counted')
+        self.assertEqual(requests['latency']['buckets'][float('inf')], 3, 'Latency of every request should be recorded')
+    
+    def test_request_profiled(self):
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        try:
+            connection.request('POST', '/__rasblite/profile?requests=2')
+            self.assertEqual(connection.getresponse().read(), b'Profiling started\n', 'Profiling should be started')
+            
+            for path in ('users/0/age', 'users/1/age', 'users/'):
+                connection.request('GET', BASE_URL + path)
+                connection.getresponse().read()
+            self.assertFalse(self.controller.is_profiling(), 'Profiling should stop after the number of requests given')
+            
+            connection.request('GET', '/__rasblite/profile?sort=tottime')
+            report = connection.getresponse().read().decode()
+            self.assertIn('GET users/:userID/age (2 requests profiled)', report, 'Stats should be aggregated by route')
+            self.assertNotIn('GET users ', report, 'Requests after profiling stopped should not be profiled')
+            
+            connection.request('GET', '/__rasblite/profile?sort=unknown')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 400, 'Unknown sort key should be a bad request')
+            response.read()
+        finally:
+            connection.close()
+    
+    def test_request_memory(self):
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        try:
+            connection.request('GET', '/__rasblite/memory')
+            usage = json.loads(connection.getresponse().read().decode())
+            self.assertEqual(usage['users']['collections'], 1, 'Memory usage should be returned for each collection')
+            
+            connection.request('POST', '/__rasblite/memory/snapshot')
+            self.assertEqual(json.loads(connection.getresponse().read().decode()), {'snapshot': 0}, 'Snapshot number should be returned')
+            connection.request('POST', '/__rasblite/memory/snapshot')
+            connection.getresponse().read()
+            
+            connection.request('GET', '/__rasblite/memory/diff?limit=5')
+            self.assertIn('Memory growth from snapshot 0 to 1', connection.getresponse().read().decode(), 'Last two snapshots should be compared')
+            
+            connection.request('GET', '/__rasblite/memory/diff?first=7')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 400, 'Unknown snapshot should be a bad request')
+            response.read()
+        finally:
+            self.controller.stop_memory_tracing()
+            connection.close()
+    
+    def test_request_POST_bulk(self):
+        message_body = '\n'.join(json.dumps({'post_code': 'P' + str(index), 'address_lines': 'Street'}) for index in range(3))
+        request = urllib.request.Request('http://localhost:' + str(SERVER_PORT) + BASE_URL + 'users/1/addresses/', data=(message_body + '\n').encode(), 
+                                         headers={'Content-Type': 'application/x-ndjson'}, method='POST')
+        with urllib.request.urlopen(request) as response:
+            result = self.controller.parse_response(response.read())
+        
+        self.assertDictEqual(result, {'count': 3, 'ids': [2, 3, 4]}, 'NDJSON POST should only return the count and ids of the items added')
+        self.assertEqual(self.server_request('GET', 'users/1/addresses/4/post_code'), 'P2', 'Items posted in bulk should be added in order')
+    
+    def test_request_batch(self):
+        operations = [{'method': 'POST', 'path': BASE_URL + 'users/', 'body': {'name': 'Jim', 'addresses': [], 'age': '18'}},
+                      {'method': 'PUT', 'path': BASE_URL + 'users/2/age', 'body': '19'},
+                      {'method': 'GET', 'path': BASE_URL + 'users/5'}]
+        request = urllib.request.Request('http://localhost:' + str(SERVER_PORT) + '/__rasblite/batch', data=json.dumps(operations).encode(), 
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request) as response:
+            results = json.loads(response.read().decode())
+        
+        self.assertListEqual([result['status'] for result in results], [200, 200, 404], 'Batch returned unexpected statuses')
+        self.assertEqual(results[1]['body']['age'], '19', 'Batch returned unexpected result')
+        
+        operations[1]['path'] = BASE_URL + 'users/9/age'
+        request = urllib.request.Request('http://localhost:' + str(SERVER_PORT) + '/__rasblite/batch?atomic=true', data=json.dumps(operations[:2]).encode(), method='POST')
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(request)
+        self.assertEqual(context.exception.code, 404, 'Atomic batch should fail with the status of the failed operation')
+        results = json.loads(context.exception.read().decode())
+        self.assertListEqual([result['status'] for result in results], [424, 404], 'Batch returned unexpected statuses')
+        self.assertEqual(len(self.controller.perform_user_request('GET', BASE_URL + 'users/')), 3, 'Atomic batch should have been rolled back')
+        
+        request = urllib.request.Request('http://localhost:' + str(SERVER_PORT) + '/__rasblite/batch', data=b'{"method": "GET"}', method='POST')
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(request)
+        self.assertEqual(context.exception.code, 400, 'Batch that is not an array should be a bad request')
+    
+    def test_request_not_json(self):
+        for method, path in (('POST', 'users/'), ('PUT', 'users/0/name')):
+            request = urllib.request.Request(method=method, url='http://localhost:' + str(SERVER_PORT) + BASE_URL + path,
+                                             data=b'Rob', headers={'Content-Type': 'text/plain'})
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(request)
+            self.assertEqual(context.exception.code, 400, 'A body that is not JSON should be a bad request: ' + method)
+        self.assertEqual(self.server_request('GET', 'users/0/name'), 'Bob', 'A body that is not JSON should not be stored')
+    
+    def test_parse_error_page(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen('http://localhost:' + str(SERVER_PORT) + BASE_URL + 'users/999')
+        error_page = context.exception.read()
+        self.assertFalse(error_page.startswith(b'<html>'), 'Error page should not look like rendered data')
+        with self.assertLogs('rasblite', 'WARNING'):
+            self.assertIsNone(self.controller.parse_response(error_page), 'An error page should not be parsed')
+    
+    def test_request_keep_alive(self):
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        try:
+            for path, status in (('users/0/name', 200), ('users/999', 404), ('users/ten', 400), ('users/1/name', 200)):
+                connection.request('GET', BASE_URL + path)
+                response = connection.getresponse()
+                self.assertEqual(response.status, status, 'Request on a kept alive connection returned an unexpected status')
+                self.assertEqual(response.version, 11, 'Response should be HTTP/1.1')
+                self.assertFalse(response.will_close, 'Server should keep the connection alive after ' + path)
+                self.assertEqual(len(response.read()), int(response.getheader('Content-Length')), 'Content-Length does not match the response body')
+        finally:
+            connection.close()
+    
+    def test_request_route_matched_once(self):
+        with unittest.mock.patch.object(engine.ModelData, 'route', autospec=True, side_effect=engine.ModelData.route) as route:
+            self.assertEqual(self.server_request('GET', 'users/1/name'), 'Frank', 'GET request failed')
+        self.assertEqual(route.call_count, 1, 'Route should only be matched once for each request')
+    
+    def test_request_idle_connection(self):
+        connection = http.client.HTTPConnection('localhost', SERVER_PORT)
+        try:
+            connection.request('GET', BASE_URL + 'users/0/name')
+            response = connection.getresponse()
+            self.assertEqual(self.controller.parse_response(response.read()), 'Bob', 'First request returned unexpected result')
+            
+            # The first connection sits idle while a second client is served
+            started = time.time()
+            self.assertEqual(self.server_request('GET', 'users/1/name'), 'Frank', 'Second client should be served while the first connection is idle')
+            self.assertLess(time.time() - started, 2, 'Second client should not wait for the idle connection to time out')
+            
+            started = time.time()
+            self.controller.stop()
+            self.assertLess(time.time() - started, 2, 'Stopping should not wait for the idle connection to time out')
+        finally:
+            connection.close()
+            self.setUp()
+            
+    def test_request_pipelined(self):
+        connection = socket.create_connection(('localhost', SERVER_PORT))
+        try:
+            request = 'GET ' + BASE_URL + '{0} HTTP/1.1\r\nHost: localhost\r\n\r\n'
+            connection.sendall((request.format('users/0/name') + request.format('users/1/name')).encode())
+            
+            reader = connection.makefile('rb')
+            for expected in ('Bob', 'Frank'):
+                self.assertIn(b' 200 ', reader.readline(), 'Pipelined request failed')
+                headers = http.client.parse_headers(reader)
+                raw_response = reader.read(int(headers['Content-Length']))
+                self.assertEqual(self.controller.parse_response(raw_response), expected, 'Pipelined request returned unexpected result')
+        finally:
+            connection.close()
+        
+class TestWorkerPoolRequestHandler(TestRequestHandler):
+    """Runs the same requests as TestRequestHandler against a server using a
+    pool of worker threads."""
+    
+    controller_options = {'workers': 4}
+        
+    def test_request_concurrent(self):
+        message_body = literal_eval("{'name': 'Jim', 'addresses': [], 'age': '18'}")
+        results = list()
+        
+        def client():
+            results.append(self.server_request('POST', 'users/', message_body))
+            results.append(self.server_request('GET', 'users/'))
+        
+        clients = [threading.Thread(target=client) for _ in range(8)]
+        for next_client in clients:
+            next_client.start()
+        for next_client in clients:
+            next_client.join()
+        
+        for result in results:
+            self.assertNotIsInstance(result, urllib.error.URLError, 'server_request failed with error: ' + str(result))
+        
+        result = self.server_request('GET', 'users/')
+        self.assertEqual(len(result), 10, 'Concurrent POSTs to self.server_request should all have been stored')
+        
+class TestAsyncioRequestHandler(TestRequestHandler):
+    """Runs the same requests as TestRequestHandler against the asyncio engine."""
+    
+    controller_options = {'engine': 'asyncio'}
+        
+    def test_set_controller(self):
+        self.assertEqual(getattr(engine.AsyncioRequestHandler, 'controller'), self.controller, "AsyncioRequestHandler should have a reference to this controller.")
+    
+    def test_request_waiting(self):
+        started, release = threading.Event(), threading.Event()
+        perform_user_request = self.controller.perform_user_request
+        
+        def waiting_request(method, path, *args, **kwargs):
+            if path.endswith('users/0/name'):
+                started.set()
+                release.wait(5)
+            return perform_user_request(method, path, *args, **kwargs)
+        
+        self.controller.perform_user_request = waiting_request
+        waiting = threading.Thread(target=self.server_request, args=('GET', 'users/0/name'))
+        waiting.start()
+        try:
+            self.assertTrue(started.wait(5), 'First request should have reached the controller')
+            self.assertEqual(self.server_request('GET', 'users/1/name'), 'Frank', 'Second request should be served while the first is waiting')
+            self.assertTrue(waiting.is_alive(), 'A waiting request should not hold up the event loop')
+        finally:
+            release.set()
+            waiting.join()
+
+        
+class TestBench(unittest.TestCase):
+    
+    def test_parse_mix(self):
+        self.assertDictEqual(bench.parse_mix('get=3,PUT=1'), {'GET': 3, 'PUT': 1}, 'Mix should be parsed into the weight of each method')
+        self.assertRaises(ValueError, bench.parse_mix, 'PATCH=1')
+        self.assertRaises(ValueError, bench.parse_mix, 'GET=0')
+    
+    def test_main(self):
+        starting_data = "{'users': [{'addresses': [], 'age': '21', 'name': 'Bob'}]}"
+        summaries = bench.main(DEFAULT_MODEL, starting_data, clients=2, duration=None, requests=40, 
+                               mix=bench.parse_mix('GET=1,PUT=1'), seed=1)
+        
+        self.assertEqual(summaries['total']['requests'], 40, 'Every request should be summarised')
+        self.assertEqual(summaries['total']['errors'], 0, 'Requests should only be sent to paths in the data')
+        self.assertIn('PUT users/:userID/name', summaries, 'Requests should be summarised by route')
+
+class TestDataEncoder(unittest.TestCase):
+    
+    def test_iterencode_list(self):
+        encoder = engine.DataEncoder(separators=(',', ':'))
+        items = literal_eval(DEFAULT_STARTING_DATA)['users'] * 10
+        
+        for chunk_size in (1, 50, 65536):
+            chunks = list(encoder.iterencode_list(items, chunk_size))
+            self.assertEqual(b''.join(chunks).decode(), encoder.encode(items), 'Encoding a list item by item should match encoding it whole')
+        
+        self.assertEqual(b''.join(encoder.iterencode_list([])), b'[]', 'An empty list should still be encoded')
+
+class TestResponseCache(unittest.TestCase):
+    
+    def test_get_put(self):
+        cache = engine.ResponseCache(2)
+        cache.put('a', 'v1', b'A')
+        cache.put('b', 'v1', b'B')
+        self.assertEqual(cache.get('a', 'v1'), b'A', 'Cached response should be returned for the same version')
+        self.assertIsNone(cache.get('b', 'v2'), 'Cached response should not be returned for a newer version')
+        
+        cache.put('b', 'v2', b'B2')
+        cache.put('c', 'v1', b'C')
+        self.assertIsNone(cache.get('a', 'v1'), 'Least recently used response should be evicted')
+        self.assertEqual(cache.get('c', 'v1'), b'C', 'Most recently used response should still be cached')
+        self.assertDictEqual(cache.stats(), {'hits': 2, 'misses': 2, 'size': 2, 'max_size': 2}, 'Unexpected cache stats')
+
+class TestMetrics(unittest.TestCase):
+    
+    def test_observe(self):
+        metrics = engine.Metrics()
+        for seconds in (0.0001, 0.003, 10):
+            metrics.observe_request('GET', 'users', 200, 10, seconds)
+        metrics.add_bytes('GET', 'users', 5)
+        
+        requests = metrics.snapshot()['requests'][('GET', 'users')]
+        self.assertEqual(requests['bytes_out'], 35, 'Bytes sent should be summed')
+        self.assertEqual(requests['latency']['buckets'][0.0005], 1, 'Buckets should count observations up to their upper bound')
+        self.assertEqual(requests['latency']['buckets'][0.005], 2, 'Buckets should be cumulative')
+        self.assertEqual(requests['latency']['buckets'][float('inf')], 3, 'Last bucket should count every observation')
+        self.assertIn('rasblite_request_duration_seconds_bucket{method="GET",route="users",le="+Inf"} 3', metrics.prometheus().splitlines(), 'Unexpected Prometheus histogram')
+
+class TestRequestProfiler(unittest.TestCase):
+    
+    def test_call(self):
+        profiler = engine.RequestProfiler()
+        self.assertEqual(profiler.call('GET', 'users', sorted, [2, 1]), [1, 2], 'Result should be returned when not profiling')
+        self.assertEqual(profiler.report(), 'No requests profiled\n', 'Nothing should be profiled before starting')
+        
+        output = os.path.join(os.path.dirname(__file__), 'profile_output.txt')
+        try:
+            profiler.start(requests=1, output=output)
+            self.assertEqual(profiler.call('GET', 'users', sorted, [2, 1]), [1, 2], 'Result should be returned when profiling')
+            self.assertFalse(profiler.is_active(), 'Profiling should stop after the number of requests given')
+            with open(output) as output_file:
+                self.assertIn('GET users (1 requests profiled)', output_file.read(), 'Stats should be written once profiling stops')
+        finally:
+            if os.path.exists(output):
+                os.remove(output)
+
+class TestWriteAheadLog(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def open_model(self, compact_size=engine.WriteAheadLog.compact_size):
+        model = engine.ModelParser().parse(DEFAULT_MODEL, DEFAULT_STARTING_DATA)
+        write_ahead_log = engine.WriteAheadLog(self.directory, compact_size)
+        replayed = write_ahead_log.recover(model)
+        model.set_journal(write_ahead_log)
+        write_ahead_log.start(model)
+        return model, write_ahead_log, replayed
+    
+    def test_recover(self):
+        model, write_ahead_log, replayed = self.open_model()
+        self.assertEqual(replayed, 0, 'Nothing should be replayed from a new state directory')
+        model.action_path('POST', BASE_URL + 'users/', {'name': 'Jim', 'addresses': [], 'age': '18'})
+        model.action_path('PUT', BASE_URL + 'users/2/age', '19')
+        model.action_path('GET', BASE_URL + 'users/9/age')
+        model.action_batch([('DELETE', BASE_URL + 'users/0/', None), ('PUT', BASE_URL + 'users/1/name', 'Fred')])
+        write_ahead_log.wait()
+        write_ahead_log.close()
+        
+        with open(os.path.join(self.directory, engine.WriteAheadLog.LOG_FILE), 'ab') as log_file:
+            log_file.write(b"5 ('PUT', ")
+        
+        recovered, write_ahead_log, replayed = self.open_model()
+        write_ahead_log.close()
+        self.assertEqual(replayed, 4, 'Every successful change should be replayed')
+        self.assertDictEqual(recovered._data_store, model._data_store, 'Data store should be recovered from the log')
+        
+    def test_recover_corrupt(self):
+        model, write_ahead_log, replayed = self.open_model()
+        model.action_path('PUT', BASE_URL + 'users/0/age', '22')
+        model.action_path('PUT', BASE_URL + 'users/1/age', '61')
+        write_ahead_log.wait()
+        write_ahead_log.close()
+        
+        log_path = os.path.join(self.directory, engine.WriteAheadLog.LOG_FILE)
+        with open(log_path, 'rb') as log_file:
+            first, second = log_file.readlines()
+        corrupt = first[:10] + b'\x00' * (len(first) - 11) + b'\n' + second
+        with open(log_path, 'wb') as log_file:
+            log_file.write(corrupt)
+        
+        self.assertRaises(ValueError, self.open_model)
+        with open(log_path, 'rb') as log_file:
+            self.assertEqual(log_file.read(), corrupt, 'A corrupt log should not be truncated')
+        
+    def test_compact(self):
+        model, write_ahead_log, replayed = self.open_model(compact_size=1)
+        for index in range(3):
+            model.action_path('POST', BASE_URL + 'users/', {'name': 'User' + str(index), 'addresses': [], 'age': '18'})
+            write_ahead_log.wait()
+        write_ahead_log.close()
+        
+        recovered, write_ahead_log, replayed = self.open_model()
+        write_ahead_log.close()
+        self.assertTrue(os.path.exists(os.path.join(self.directory, engine.WriteAheadLog.SNAPSHOT_FILE)), 'Log should have been compacted into a snapshot')
+        self.assertLess(replayed, 3, 'Changes in the snapshot should not be replayed')
+        self.assertDictEqual(recovered._data_store, model._data_store, 'Data store should be recovered from the snapshot')
+        
+    def test_wait_async(self):
+        model, write_ahead_log, replayed = self.open_model()
+        
+        async def change(index):
+            model.action_path('PUT', BASE_URL + 'users/0/age', str(index))
+            await write_ahead_log.wait_async(write_ahead_log.position())
+        
+        async def change_all():
+            await asyncio.gather(*(change(index) for index in range(20)))
+        
+        with unittest.mock.patch('os.fsync', wraps=os.fsync) as fsync:
+            asyncio.run(change_all())
+        write_ahead_log.close()
+        
+        self.assertLess(fsync.call_count, 20, 'Changes waited for together should be synced together')
+        recovered, write_ahead_log, replayed = self.open_model()
+        write_ahead_log.close()
+        self.assertEqual(replayed, 20, 'Every change should have been synced')
+        
+    def test_controller_restart(self):
+        controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT, state_dir=self.directory)
+        controller.start()
+        try:
+            controller.perform_user_request('PUT', BASE_URL + 'users/0/name', 'Rob')
+        finally:
+            controller.stop()
+        
+        controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT, state_dir=self.directory)
+        controller.start()
+        try:
+            self.assertEqual(controller.perform_user_request('GET', BASE_URL + 'users/0/name'), 'Rob', 'Change should survive a restart')
+        finally:
+            controller.stop()
+    
+    def test_asyncio_restart(self):
+        controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT, engine='asyncio', state_dir=self.directory)
+        controller.start()
+        try:
+            request = urllib.request.Request(method='PUT', url='http://localhost:' + str(SERVER_PORT) + BASE_URL + 'users/0/name',
+                                             data=b'"Rob"', headers={'Content-Type': 'application/json'})
+            self.assertEqual(urllib.request.urlopen(request).status, 200, 'PUT should succeed once synced')
+        finally:
+            controller.stop()
+        
+        controller = engine.Controller(DEFAULT_MODEL, DEFAULT_STARTING_DATA, SERVER_PORT, state_dir=self.directory)
+        controller.start()
+        try:
+            self.assertEqual(controller.perform_user_request('GET', BASE_URL + 'users/0/name'), 'Rob', 'Change made with the asyncio engine should survive a restart')
+        finally:
+            controller.stop()
+
+class TestRingBufferHandler(unittest.TestCase):
+    
+    def test_emit(self):
+        handler = engine.RingBufferHandler(2)
+        logger = logging.getLogger('rasblite.test')
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            for index in range(3):
+                logger.debug('Record %d', index)
+        finally:
+            logger.removeHandler(handler)
+        
+        self.assertListEqual(handler.getvalue(), ['Record 1', 'Record 2'], 'Only the most recent records should be kept')
+
+class TestReadWriteLock(unittest.TestCase):
+    
+    def test_readers_share_writer_excludes(self):
+        lock = engine.ReadWriteLock()
+        lock.acquire_read()
+        
+        # A second reader does not block while a reader holds the lock
+        other_reader = threading.Thread(target=lock.acquire_read)
+        other_reader.start()
+        other_reader.join(timeout=1)
+        self.assertFalse(other_reader.is_alive(), 'A reader should not wait for another reader')
+        lock.release_read()
+        
+        acquired = threading.Event()
+        def writer():
+            with lock.writing():
+                acquired.set()
+        
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        self.assertFalse(acquired.wait(timeout=0.2), 'A writer should wait for all readers to release the lock')
+        lock.release_read()
+        self.assertTrue(acquired.wait(timeout=1), 'A writer should acquire the lock once readers release it')
+        writer_thread.join()
 
 if __name__ == '__main__': 
     traceObj = trace.Trace(ignoredirs=[sys.prefix, sys.exec_prefix], count=1, trace=0)